@@ -0,0 +1,16 @@
+"""
+Celery config for main project.
+
+Workers are started with ``celery -A main worker``. Task modules are discovered
+from every installed app (``<app>/tasks.py``).
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+
+app = Celery('main')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -29,12 +29,29 @@ env = environ.Env(
     DJANGO_STATIC_URL=(str, '/static/'),
     DJANGO_STATIC_ROOT=(str, os.path.join(BASE_DIR, 'static')),
     DJANGO_ADDITIONAL_ALLOWED_HOSTS=(list, []),
+    DJANGO_QR_CACHE_SIZE=(int, 1024),
+    DJANGO_QR_CACHE_DIR=(str, None),
+    DJANGO_QR_RENDER_WORKERS=(int, None),
+    DJANGO_LABEL_SHEET_WORKERS=(int, 1),
+    DJANGO_QR_PAYLOAD_BASE_URL=(str, ''),
+    DJANGO_PROCESS_HOT_DAYS=(int, 90),
+    DJANGO_CHANGE_LOG_DAYS=(int, 30),
+    DJANGO_TELEMETRY_RAW_DAYS=(int, 7),
+    DJANGO_TELEMETRY_MINUTE_DAYS=(int, 90),
+    DJANGO_TELEMETRY_HOUR_DAYS=(int, 730),
+    DJANGO_PROCESS_ARCHIVE_DIR=(str, None),
     # Database
     DJANGO_DB_NAME=str,
     DJANGO_DB_USER=str,
     DJANGO_DB_PASS=str,
     DJANGO_DB_HOST=str,
     DJANGO_DB_PORT=(int, 5432),
+    # Celery
+    CELERY_BROKER_URL=(str, None),
+    DJANGO_BOARD_BROKER=(str, 'local'),
+    DJANGO_BOARD_BROKER_URL=(str, None),
+    DJANGO_CACHE_URL=(str, None),
+    CELERY_RESULT_BACKEND=(str, None),
     # Pytest (Only required when running tests)
     PYTEST_XDIST_WORKER=(str, None),
 )
@@ -162,6 +179,35 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = '/media/'
 STATIC_URL = "/staticfiles/"
 
+# On-demand QR rendering: number of images kept in the in-memory LRU, and an
+# optional directory for a shared disk cache.
+QR_CACHE_SIZE = env('DJANGO_QR_CACHE_SIZE')
+QR_CACHE_DIR = env('DJANGO_QR_CACHE_DIR')
+# Size of the process pool used to render QR codes in batches (defaults to the CPU count).
+QR_RENDER_WORKERS = env('DJANGO_QR_RENDER_WORKERS')
+# Size of the process pool used to draw a PDF label sheet in a web request; 1
+# draws it in-process. The print_labels command uses the CPU count instead.
+LABEL_SHEET_WORKERS = env('DJANGO_LABEL_SHEET_WORKERS')
+# Optional URL prefix of QR payloads (e.g. 'https://example.com/api/scan/'), so
+# phone cameras open the scan endpoint. Leave empty for the most compact codes.
+QR_PAYLOAD_BASE_URL = env('DJANGO_QR_PAYLOAD_BASE_URL')
+
+# Closed processes stay in the hot Process table for this many days before they
+# are moved to the month-partitioned process history.
+PROCESS_HOT_DAYS = env('DJANGO_PROCESS_HOT_DAYS')
+# Where detached history partitions are stored as compressed CSV files.
+PROCESS_ARCHIVE_DIR = env('DJANGO_PROCESS_ARCHIVE_DIR') or os.path.join(BASE_DIR, 'archive')
+# Days changes stay in the change feed (/api/changes/) before they are pruned.
+CHANGE_LOG_DAYS = env('DJANGO_CHANGE_LOG_DAYS')
+# Days sensor telemetry is kept, as raw readings and as 1 minute, 1 hour and
+# 1 day rollups, before it is pruned; None keeps it forever.
+TELEMETRY_RETENTION_DAYS = {
+    'raw': env('DJANGO_TELEMETRY_RAW_DAYS'),
+    '1m': env('DJANGO_TELEMETRY_MINUTE_DAYS'),
+    '1h': env('DJANGO_TELEMETRY_HOUR_DAYS'),
+    '1d': None,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -197,3 +243,42 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.SessionAuthentication",
     ),
 }
+
+
+# Celery
+# Without a broker (local development, tests) tasks run eagerly in-process.
+CELERY_BROKER_URL = env('CELERY_BROKER_URL')
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND')
+CELERY_TASK_ALWAYS_EAGER = TESTING or not CELERY_BROKER_URL
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+
+# Live station board: how board deltas reach the processes streaming them.
+# 'local' (single process, tests), 'redis' or 'postgres' (LISTEN/NOTIFY).
+BOARD_BROKER = 'local' if TESTING else env('DJANGO_BOARD_BROKER')
+BOARD_BROKER_URL = env('DJANGO_BOARD_BROKER_URL') or CELERY_BROKER_URL
+
+
+# Cache of the most polled payloads (see product/cache.py): Redis when
+# configured, otherwise local memory, which is also used in tests.
+if env('DJANGO_CACHE_URL') and not TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env('DJANGO_CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Whether every process serving requests sees the same change versions. Local
+# memory is only shared when a single process serves them (tests, runserver in
+# DEBUG); otherwise a write handled by one worker would leave the others
+# answering 304 to stale ETags, so conditional responses are not sent.
+CACHE_IS_SHARED = bool(env('DJANGO_CACHE_URL')) or TESTING or DEBUG
@@ -33,15 +33,22 @@ router = routers.DefaultRouter()
 
 router.register(r'product', product_views.ProductViewSet, basename='product')
 router.register(r'process', product_views.ProcessViewSet, basename='process')
+router.register(r'process-history', product_views.ProcessHistoryViewSet, basename='process-history')
+router.register(r'process-archives', product_views.ProcessArchiveViewSet, basename='process-archive')
 router.register(r'stations', product_views.StationViewSet, basename='station')
 router.register(r'users', UserViewSet, basename='users')
 router.register(r'casting-snapshots', product_views.CastingSnapshotViewSet, basename='casting-snapshot')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    url(r"^api/v1/product/(?P<pk>[^/.]+)/qr\.(?P<kind>png|svg)$", product_views.product_qr, name='product-qr'),
     url(r"^api/v1/", include(router.urls)),
     url(r"^register", RegistrationView.as_view()),
     url(r"^api/login", LoginView.as_view()),
+    path('api/changes/', product_views.ChangeFeedView.as_view(), name='changes'),
+    path('api/scan/<path:payload>', product_views.ScanView.as_view(), name='scan'),
+    path('api/station-board/events/', product_views.station_board_events, name='station-board-events'),
+    path('api/telemetry/', product_views.TelemetryView.as_view(), name='telemetry'),
     path('api/station-product-process/', product_views.StationProductProcessView.as_view(), name='station-product-process')
 ]
 
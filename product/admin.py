@@ -1,11 +1,15 @@
 from django.contrib import admin
+from django.db import transaction
 
 from product.models import (
     Process,
     Product,
+    ScanEvent,
     Station,
     ProcessingImages,
 )
+from product.counters import active_station_ids, refresh_station_wip
+from product.services import reconcile_current_pointers
 
 
 class ProcessAdminInline(admin.TabularInline):
@@ -13,6 +17,7 @@ class ProcessAdminInline(admin.TabularInline):
     fields = (
         "id",
         "product",
+        "is_active",
         "entry_time",
         "exit_time",
     )
@@ -20,9 +25,49 @@ class ProcessAdminInline(admin.TabularInline):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    pass
+    readonly_fields = ("current_station", "current_process")
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        station_ids = active_station_ids([obj.pk])
+        super().delete_model(request, obj)
+        refresh_station_wip(station_ids)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        station_ids = active_station_ids(queryset.values("pk"))
+        super().delete_queryset(request, queryset)
+        refresh_station_wip(station_ids)
 
 
 @admin.register(Station)
 class StationAdmin(admin.ModelAdmin):
     inlines = [ProcessAdminInline]
+
+    def save_formset(self, request, form, formset, change):
+        # Products whose processes were edited, including ones moved away
+        product_ids = set()
+        for inline_form in formset.forms:
+            product_ids.add(inline_form.instance.product_id)
+            if inline_form.initial.get("product"):
+                product_ids.add(inline_form.initial["product"])
+        # Stations the edited processes were at before, including deleted ones
+        station_ids = set(
+            Process.objects.filter(
+                pk__in=[
+                    inline_form.instance.pk
+                    for inline_form in formset.forms
+                    if inline_form.instance.pk
+                ]
+            ).values_list("station_id", flat=True)
+        )
+        super().save_formset(request, form, formset, change)
+        reconcile_current_pointers([pk for pk in product_ids if pk])
+        refresh_station_wip([form.instance.pk, *station_ids])
+
+
+@admin.register(ScanEvent)
+class ScanEventAdmin(admin.ModelAdmin):
+    list_display = ("key", "product_id", "station", "status", "received_at")
+    list_filter = ("status", "station")
+    search_fields = ("key", "product_id")
@@ -0,0 +1,198 @@
+import csv
+import datetime
+import gzip
+import io
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+
+from .cache import invalidate_board
+from .models import ProcessArchive
+
+# Columns of product_processhistory, in the order they are archived
+HISTORY_COLUMNS = [
+    "id",
+    "station_id",
+    "product_id",
+    "process_number",
+    "entry_time",
+    "exit_time",
+    "idempotency_key",
+]
+
+HISTORY_PARTITION = re.compile(r"^product_processhistory_y(\d{4})m(\d{2})$")
+
+# Closed processes that left the hot window, oldest first. Rows locked by a
+# concurrent batch are skipped, and rows still referenced as a product's current
+# process (possible only through pointer drift) are left alone.
+CLOSED_PROCESSES_SQL = """
+    SELECT pr.id, date_trunc('month', pr.entry_time, 'UTC')
+    FROM product_process pr
+    WHERE NOT pr.is_active
+        AND pr.exit_time < %(cutoff)s
+        AND NOT EXISTS (
+            SELECT 1 FROM product_product p WHERE p.current_process_id = pr.id
+        )
+    ORDER BY pr.id
+    LIMIT %(batch_size)s
+    FOR UPDATE OF pr SKIP LOCKED
+"""
+
+MOVE_TO_HISTORY_SQL = """
+    WITH moved AS (
+        DELETE FROM product_process
+        WHERE id = ANY(%(ids)s)
+        RETURNING {columns}
+    )
+    INSERT INTO product_processhistory ({columns})
+    SELECT {columns} FROM moved
+""".format(columns=", ".join(HISTORY_COLUMNS))
+
+
+def archive_storage():
+    return FileSystemStorage(location=settings.PROCESS_ARCHIVE_DIR)
+
+
+def partition_name(month):
+    return f"product_processhistory_y{month:%Y}m{month:%m}"
+
+
+def next_month(month):
+    return (month.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def ensure_history_partition(cursor, month):
+    """
+    Create the history partition of the month starting at ``month`` if needed.
+    """
+    start = datetime.datetime(month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(month)}
+        PARTITION OF product_processhistory FOR VALUES FROM (%s) TO (%s)
+        """,
+        [start, next_month(start)],
+    )
+
+
+def move_closed_processes(cutoff, batch_size=5000):
+    """
+    Move one batch of processes closed before ``cutoff`` into the history.
+
+    Each batch is its own short transaction that deletes the rows from the hot
+    table and inserts them into their monthly partitions, so this can run
+    repeatedly while the floor keeps moving products, including to convert years
+    of existing history.
+
+    Args:
+        cutoff (datetime): Move the processes that exited before this time.
+        batch_size (int): Maximum number of processes to move.
+
+    Returns:
+        int: Number of processes moved; 0 once there are none left.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            CLOSED_PROCESSES_SQL, {"cutoff": cutoff, "batch_size": batch_size}
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+        # Months already archived get no partition again, as they could never be
+        # archived a second time; their late processes stay in the default one
+        archived = set(ProcessArchive.objects.values_list("month", flat=True))
+        for month in {month for _, month in rows if month is not None}:
+            if month.date() not in archived:
+                ensure_history_partition(cursor, month)
+        cursor.execute(MOVE_TO_HISTORY_SQL, {"ids": [pk for pk, _ in rows]})
+        # Station process counts include the closed processes
+        invalidate_board()
+        return cursor.rowcount
+
+
+def history_partitions():
+    """
+    Return the first day of every month with a history partition, oldest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            WHERE parent.relname = 'product_processhistory'
+            """)
+        names = [name for (name,) in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = HISTORY_PARTITION.match(name)
+        if match:
+            months.append(datetime.date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def detach_history_partition(month):
+    """
+    Archive the history of a month into a gzipped CSV file and drop its partition.
+
+    The partition is locked against writes while it is exported, then detached
+    and dropped in the same transaction, so no process can be lost between the
+    export and the drop. Reads of the history are only blocked for the detach.
+
+    Args:
+        month (date): First day of the month.
+
+    Returns:
+        ProcessArchive: The record of the archive file.
+    """
+    name = partition_name(month)
+    columns = ", ".join(HISTORY_COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {name} IN SHARE MODE")
+        cursor.execute(f"SELECT count(*), max(exit_time) FROM {name}")
+        rows, last_exit_time = cursor.fetchone()
+
+        with tempfile.TemporaryFile() as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode="wb") as compressed:
+                cursor.copy_expert(
+                    f"COPY {name} ({columns}) TO STDOUT WITH (FORMAT csv, HEADER)",
+                    compressed,
+                )
+            tmp.seek(0)
+            file_name = archive_storage().save(
+                f"processes-{month:%Y-%m}.csv.gz", File(tmp)
+            )
+
+        try:
+            cursor.execute(
+                f"ALTER TABLE product_processhistory DETACH PARTITION {name}"
+            )
+            cursor.execute(f"DROP TABLE {name}")
+            return ProcessArchive.objects.create(
+                month=month, file=file_name, rows=rows, last_exit_time=last_exit_time
+            )
+        except Exception:
+            # The partition is kept, so the file would only be an orphan
+            archive_storage().delete(file_name)
+            raise
+
+
+def iter_archive_rows(archive, product_id=None, station_id=None):
+    """
+    Yield the processes of an archive as dicts of strings, optionally filtered.
+
+    The file is decompressed as it is read, so memory use does not depend on its
+    size.
+    """
+    with archive_storage().open(archive.file, "rb") as f:
+        with io.TextIOWrapper(gzip.GzipFile(fileobj=f), newline="") as text:
+            for row in csv.DictReader(text):
+                if product_id is not None and row["product_id"] != product_id:
+                    continue
+                if station_id is not None and row["station_id"] != str(station_id):
+                    continue
+                yield row
@@ -0,0 +1,251 @@
+import asyncio
+import contextlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Channel the station board deltas are published on
+BOARD_CHANNEL = "station_board"
+
+# Largest NOTIFY payload Postgres accepts is 8000 bytes; deltas are split below it
+PG_NOTIFY_CHUNK = 7000
+
+# Put in a subscription when its client may have missed deltas and must reload
+RESYNC = object()
+
+
+class LocalBackend:
+    """
+    Deliver events to the listeners of this process only.
+
+    Stands in for Redis or Postgres in tests and single-process development.
+    """
+
+    def __init__(self):
+        self._listeners = set()
+
+    def publish(self, message):
+        for loop, dispatch in list(self._listeners):
+            if loop.is_closed():
+                self._listeners.discard((loop, dispatch))
+            else:
+                loop.call_soon_threadsafe(dispatch, json.loads(message))
+
+    async def listen(self, dispatch):
+        listener = (asyncio.get_running_loop(), dispatch)
+        self._listeners.add(listener)
+        try:
+            await asyncio.Future()
+        finally:
+            self._listeners.discard(listener)
+
+
+class RedisBackend:
+    """
+    Fan events out to every process through Redis pub/sub.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self._client = None
+
+    def publish(self, message):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(BOARD_CHANNEL, message)
+
+    async def listen(self, dispatch):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        async with client.pubsub() as pubsub:
+            await pubsub.subscribe(BOARD_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    dispatch(json.loads(message["data"]))
+
+
+class PostgresBackend:
+    """
+    Fan events out to every process through Postgres LISTEN/NOTIFY, so no other
+    service is needed.
+    """
+
+    def publish(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [BOARD_CHANNEL, message])
+
+    async def listen(self, dispatch):
+        import psycopg2
+
+        # A dedicated connection, as LISTEN needs one that stays open and idle
+        listen_connection = psycopg2.connect(**connection.get_connection_params())
+        listen_connection.autocommit = True
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+
+        def on_readable():
+            try:
+                listen_connection.poll()
+            except psycopg2.Error as exc:
+                if not closed.done():
+                    closed.set_exception(exc)
+                return
+            while listen_connection.notifies:
+                notify = listen_connection.notifies.pop(0)
+                dispatch(json.loads(notify.payload))
+
+        try:
+            with listen_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {BOARD_CHANNEL}")
+            loop.add_reader(listen_connection.fileno(), on_readable)
+            await closed
+        finally:
+            with contextlib.suppress(ValueError, OSError):
+                loop.remove_reader(listen_connection.fileno())
+            listen_connection.close()
+
+
+def make_backend():
+    backend = settings.BOARD_BROKER
+    if backend == "redis":
+        return RedisBackend(settings.BOARD_BROKER_URL)
+    if backend == "postgres":
+        return PostgresBackend()
+    return LocalBackend()
+
+
+class Subscription:
+    """
+    Deltas of the subscribed stations waiting to be sent to one client.
+
+    When the client falls too far behind, its pending deltas are dropped for a
+    single RESYNC, so a stuck screen never holds on to an unbounded backlog.
+    """
+
+    def __init__(self, broker, stations, maxsize):
+        self.broker = broker
+        self.stations = set(stations) if stations else None
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    async def __aenter__(self):
+        self.broker._add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broker._subscriptions.discard(self)
+
+    def put(self, deltas):
+        if deltas is not RESYNC and self.stations is not None:
+            deltas = [delta for delta in deltas if delta["station"] in self.stations]
+            if not deltas:
+                return
+        if self._queue.full():
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            deltas = RESYNC
+        self._queue.put_nowait(deltas)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class BoardBroker:
+    """
+    In-process fan-out of station board deltas.
+
+    Every committed move publishes its deltas once through the backend. Each
+    process serving board streams runs a single listener on the backend, which
+    hands every delta to the subscriptions of its connected screens. Screens
+    therefore cost no queries per change, however many are watching.
+
+    Attributes:
+        queue_size (int): Deltas a subscription holds before it has to resync.
+    """
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._backend = None
+        self._subscriptions = set()
+        self._listener = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = make_backend()
+        return self._backend
+
+    def publish(self, deltas):
+        """
+        Publish board deltas; called once the transaction that made them commits.
+
+        A failure is logged instead of raised, as the move itself has already
+        been committed; screens resync when their connection to the broker
+        recovers.
+        """
+        if not deltas:
+            return
+        try:
+            for message in self._messages(deltas):
+                self.backend.publish(message)
+        except Exception:
+            logger.exception("Could not publish %d board deltas", len(deltas))
+
+    def publish_resync(self):
+        """
+        Tell every screen to reload its board, after changes made outside moves.
+        """
+        self.publish([{"event": "resync", "station": None}])
+
+    def _messages(self, deltas):
+        if not isinstance(self.backend, PostgresBackend):
+            yield json.dumps(deltas, cls=DjangoJSONEncoder)
+            return
+        chunk = []
+        for delta in deltas:
+            chunk.append(delta)
+            message = json.dumps(chunk, cls=DjangoJSONEncoder)
+            if len(message) > PG_NOTIFY_CHUNK and len(chunk) > 1:
+                yield json.dumps(chunk[:-1], cls=DjangoJSONEncoder)
+                chunk = [delta]
+        if chunk:
+            yield json.dumps(chunk, cls=DjangoJSONEncoder)
+
+    def subscribe(self, stations=None):
+        """
+        Receive the deltas of ``stations`` (all of them when None), as an async
+        context manager.
+        """
+        return Subscription(self, stations, self.queue_size)
+
+    def _add(self, subscription):
+        loop = asyncio.get_running_loop()
+        if self._listener is None or self._listener.get_loop() is not loop:
+            self._listener = loop.create_task(self._listen())
+        self._subscriptions.add(subscription)
+
+    async def _listen(self):
+        while True:
+            try:
+                await self.backend.listen(self._dispatch)
+            except Exception:
+                logger.exception("Lost the board broker connection, reconnecting")
+            # Deltas may have been missed while disconnected
+            self._dispatch(None)
+            await asyncio.sleep(1)
+
+    def _dispatch(self, deltas):
+        if deltas is None or any(delta["event"] == "resync" for delta in deltas):
+            deltas = RESYNC
+        for subscription in list(self._subscriptions):
+            subscription.put(deltas)
+
+
+board_broker = BoardBroker()
@@ -0,0 +1,129 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Collections with a change version, bumped whenever one of their rows changes.
+# Payloads are cached and validated by version, so a bump invalidates them all.
+# The station board covers products, processes and stations.
+BOARD = "board"
+CASTING_SNAPSHOTS = "casting-snapshots"
+
+# Seconds a cached payload is kept, as a bound on anything invalidation misses
+BOARD_CACHE_TIMEOUT = 300
+
+# Seconds a request may rebuild a payload while the others wait for it
+BOARD_LOCK_TIMEOUT = 10
+
+# Seconds a request waits for another one's rebuild before building its own
+BOARD_LOCK_WAIT = 2
+
+
+def version_key(collection):
+    return f"version:{collection}"
+
+
+def initial_version():
+    # Starts from the clock, so a version evicted from the cache comes back
+    # higher than before rather than at a value that was already handed out
+    return time.time_ns() // 1000
+
+
+def collection_version(collection):
+    """
+    Return the current change version of a collection.
+    """
+    version = cache.get(version_key(collection))
+    if version is None:
+        cache.add(version_key(collection), initial_version(), timeout=None)
+        version = cache.get(version_key(collection))
+    return version
+
+
+def bump_collection_version(collection):
+    """
+    Invalidate every cached payload and validator of a collection.
+    """
+    try:
+        cache.incr(version_key(collection))
+    except ValueError:
+        cache.add(version_key(collection), initial_version(), timeout=None)
+
+
+def invalidate_collection(collection):
+    """
+    Bump the version of a collection once the current transaction commits.
+
+    Bumping earlier would let a concurrent request cache the data from before the
+    commit under the new version.
+    """
+    transaction.on_commit(lambda: bump_collection_version(collection))
+
+
+def bump_board_version():
+    bump_collection_version(BOARD)
+
+
+def invalidate_board():
+    invalidate_collection(BOARD)
+
+
+def collection_etag(*collections):
+    """
+    Return an ETag function for views over ``collections``, for use with
+    ``django.views.decorators.http.condition``.
+
+    The ETag is built from the collection versions only, so a conditional request
+    is answered without running the view's queries. It also varies with the
+    renderer, as the same URL can be rendered as JSON or as the browsable API.
+    Without a cache shared by every process (``CACHE_IS_SHARED``) no ETag is
+    sent, as the versions of one process would miss the writes of the others.
+    """
+
+    def etag(request, *args, **kwargs):
+        if not settings.CACHE_IS_SHARED:
+            return None
+        versions = ".".join(str(collection_version(name)) for name in collections)
+        return f'W/"{versions}.{request.accepted_renderer.format}"'
+
+    return etag
+
+
+def cached_board(name, build, timeout=BOARD_CACHE_TIMEOUT):
+    """
+    Return a station board payload from the cache, building it on a miss.
+
+    Only one request rebuilds a missing payload; the others wait for it instead of
+    all running the same queries at once, and only build it themselves if the
+    rebuild takes longer than ``BOARD_LOCK_WAIT``.
+
+    Args:
+        name (str): Name of the payload, unique per endpoint and variant.
+        build (callable): Returns the payload; must be picklable.
+        timeout (int): Seconds to keep the payload.
+
+    Returns:
+        The payload.
+    """
+    key = f"board:{name}:{collection_version(BOARD)}"
+    payload = cache.get(key)
+    if payload is not None:
+        return payload
+
+    lock = f"{key}:lock"
+    deadline = time.monotonic() + BOARD_LOCK_WAIT
+    while not cache.add(lock, True, timeout=BOARD_LOCK_TIMEOUT):
+        time.sleep(0.05)
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+        if time.monotonic() > deadline:
+            return build()
+
+    try:
+        payload = build()
+        cache.set(key, payload, timeout=timeout)
+    finally:
+        cache.delete(lock)
+    return payload
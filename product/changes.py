@@ -0,0 +1,138 @@
+from django.db import connection
+
+# Cursor of a client that has not seen any change yet
+START_CURSOR = "0.0"
+
+# Changes after a cursor, in feed order, starting with the cursor's own row so
+# that a cursor whose row was pruned can be told apart. Only the changes of
+# transactions older than every transaction still running are read: a change
+# that commits later always sorts after them, so none is ever skipped.
+CHANGES_SQL = """
+    SELECT txid::text, id, resource, object_id
+    FROM product_changelog
+    WHERE (txid, id) >= (%(txid)s::xid8, %(id)s)
+        AND txid < pg_snapshot_xmin(pg_current_snapshot())
+        {resources}
+    ORDER BY txid, id
+    LIMIT %(limit)s
+"""
+
+HEAD_SQL = """
+    SELECT txid::text, id
+    FROM product_changelog
+    WHERE txid < pg_snapshot_xmin(pg_current_snapshot())
+    ORDER BY txid DESC, id DESC
+    LIMIT 1
+"""
+
+
+class CursorExpired(Exception):
+    """
+    The changes after a cursor were pruned; the client has to reload everything.
+    """
+
+
+def parse_cursor(cursor):
+    """
+    Return the ``(txid, id)`` of a cursor, or None if it is malformed.
+    """
+    txid, _, pk = cursor.partition(".")
+    if not (txid.isdigit() and pk.isdigit()):
+        return None
+    return txid, int(pk)
+
+
+def head_cursor():
+    """
+    Return the cursor of the latest change, to start following the feed from.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(HEAD_SQL)
+        row = cursor.fetchone()
+    return START_CURSOR if row is None else f"{row[0]}.{row[1]}"
+
+
+def read_changes(since, resources=None, limit=500):
+    """
+    Read the changes after a cursor, with one indexed query.
+
+    Every row written more than once is only reported once, at its last change.
+
+    Args:
+        since (str): Cursor returned by the previous read, or ``START_CURSOR``.
+        resources (list): Only read the changes of these resources.
+        limit (int): Maximum number of changes to read.
+
+    Returns:
+        tuple: ``(changes, cursor, has_more)``, with ``changes`` a list of
+        ``(resource, object_id)`` and ``cursor`` the cursor to read on from.
+
+    Raises:
+        CursorExpired: If the change at ``since`` was pruned.
+    """
+    txid, pk = parse_cursor(since)
+    sql = CHANGES_SQL.format(
+        resources=(
+            "AND (resource = ANY(%(resources)s) OR (txid, id) = (%(txid)s::xid8, %(id)s))"
+            if resources
+            else ""
+        )
+    )
+    params = {"txid": txid, "id": pk, "resources": resources, "limit": limit + 2}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    if since != START_CURSOR:
+        if not rows or rows[0][:2] != (txid, pk):
+            raise CursorExpired
+        rows = rows[1:]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], since, False
+
+    # Ordered by the last change of every row
+    latest = {}
+    for _, _, resource, object_id in rows:
+        latest.pop((resource, object_id), None)
+        latest[resource, object_id] = None
+    last_txid, last_id = rows[-1][:2]
+    return list(latest), f"{last_txid}.{last_id}", has_more
+
+
+def prune_changes(before, batch_size=10000):
+    """
+    Delete one batch of the changes that precede, in feed order, the first change
+    made at or after ``before``.
+
+    Pruning by feed order rather than by time keeps every change after a cursor
+    whose own change is kept, so a client is either caught up completely or told
+    that its cursor expired.
+
+    Returns:
+        int: Number of changes deleted; 0 once there are none left.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM product_changelog
+            WHERE id IN (
+                SELECT id FROM product_changelog
+                WHERE (txid, id) < coalesce(
+                    (
+                        SELECT (txid, id) FROM product_changelog
+                        WHERE changed_at >= %(before)s
+                        ORDER BY txid, id
+                        LIMIT 1
+                    ),
+                    -- Typed as the columns, records only compare alike types
+                    (pg_snapshot_xmin(pg_current_snapshot()), 0::bigint)
+                )
+                ORDER BY txid, id
+                LIMIT %(batch_size)s
+            )
+            """,
+            {"before": before, "batch_size": batch_size},
+        )
+        return cursor.rowcount
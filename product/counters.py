@@ -0,0 +1,153 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import Process, ProcessArchive, StationCounter
+
+# Counts of every station computed from the process rows, hot and historical
+RAW_COUNTS_SQL = """
+    WITH processes AS (
+        SELECT station_id, is_active FROM product_process
+        UNION ALL
+        SELECT station_id, FALSE FROM product_processhistory
+    )
+    SELECT s.id AS station_id,
+           count(*) FILTER (WHERE p.is_active)::int AS wip,
+           count(p.station_id) AS count_in,
+           count(*) FILTER (WHERE NOT p.is_active) AS count_out
+    FROM product_station s
+    LEFT JOIN processes p ON p.station_id = s.id
+    GROUP BY s.id
+"""
+
+
+def record_station_moves(entered=(), left=()):
+    """
+    Count products entering and leaving stations.
+
+    Must run in the transaction of the move. All the stations are updated by one
+    ``UPDATE`` of atomic increments, so concurrent moves never lose a count.
+
+    Args:
+        entered (list): Station ID of every opened process.
+        left (list): Station ID of every closed process.
+    """
+    entered, left = Counter(entered), Counter(left)
+    station_ids = sorted(entered.keys() | left.keys())
+    if not station_ids:
+        return
+
+    def per_station(counts):
+        return Case(
+            *[When(pk=pk, then=Value(counts[pk])) for pk in station_ids if counts[pk]],
+            default=Value(0),
+        )
+
+    StationCounter.objects.filter(pk__in=station_ids).update(
+        wip=F("wip") + per_station(entered) - per_station(left),
+        count_in=F("count_in") + per_station(entered),
+        count_out=F("count_out") + per_station(left),
+    )
+
+
+def refresh_station_wip(station_ids):
+    """
+    Recount the work in progress of stations from their active processes.
+
+    For writes that bypass the moves, such as admin and raw Process edits, which
+    correct the history rather than move products, so the cumulative counts are
+    left alone. Each station is counted through the partial index on the active
+    processes.
+
+    Args:
+        station_ids (list): Primary keys of the stations.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE product_stationcounter c
+            SET wip = (
+                SELECT count(*) FROM product_process p
+                WHERE p.station_id = c.station_id AND p.is_active
+            )
+            WHERE c.station_id = ANY(%s)
+            """,
+            [sorted(set(station_ids))],
+        )
+
+
+def active_station_ids(product_ids):
+    """
+    Return the stations the products are at, to refresh once they are deleted.
+
+    Deleting a product cascades to its active process, which leaves the work in
+    progress of its station one too high until it is refreshed.
+    """
+    return list(
+        Process.objects.filter(product_id__in=product_ids, is_active=True)
+        .values_list("station_id", flat=True)
+        .distinct()
+    )
+
+
+def raw_station_counts():
+    """
+    Return the counts of every station computed from the process rows.
+
+    Returns:
+        dict: ``(wip, count_in, count_out)`` by station ID.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RAW_COUNTS_SQL)
+        return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+
+def drifted_station_counters():
+    """
+    Compare the station counters with the process rows.
+
+    Cumulative counts can only be compared while no history has been archived;
+    after that only the work in progress is.
+
+    Returns:
+        list: ``(station_id, stored, raw)`` of every station whose counts are
+        wrong, with ``stored`` None if the station has no counter.
+    """
+    raw = raw_station_counts()
+    stored = {
+        counter.pk: (counter.wip, counter.count_in, counter.count_out)
+        for counter in StationCounter.objects.all()
+    }
+    compared = 1 if ProcessArchive.objects.exists() else 3
+    return [
+        (station_id, stored.get(station_id), counts)
+        for station_id, counts in sorted(raw.items())
+        if stored.get(station_id, (None,) * 3)[:compared] != counts[:compared]
+    ]
+
+
+def repair_station_counters():
+    """
+    Overwrite drifted station counters with the counts from the process rows.
+
+    The counters are locked while the drift is measured and repaired, so
+    concurrent moves are neither lost nor counted twice.
+
+    Returns:
+        list: The drifted stations, as ``drifted_station_counters`` lists them.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("LOCK TABLE product_stationcounter IN EXCLUSIVE MODE")
+        drifted = drifted_station_counters()
+        archived = ProcessArchive.objects.exists()
+        for station_id, stored, (wip, count_in, count_out) in drifted:
+            if stored is not None and archived:
+                # The archived history is not in the raw counts
+                count_in, count_out = stored[1:]
+            StationCounter.objects.update_or_create(
+                pk=station_id,
+                defaults={"wip": wip, "count_in": count_in, "count_out": count_out},
+            )
+    return drifted
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from http import HTTPStatus
+
+from django.db import close_old_connections, connections
+from django.utils.dateparse import parse_datetime
+
+from .models import ScanEvent
+from .services import apply_scan_events, store_scan_events
+from .utils import parse_qr_payload
+
+logger = logging.getLogger(__name__)
+
+# First line of a plain HTTP request, as sent by devices using the HTTP fallback
+HTTP_REQUEST_LINE = re.compile(rb"^([A-Z]+) (\S+) HTTP/1\.[01]\r?\n$")
+
+# Largest HTTP body accepted, in bytes
+MAX_HTTP_BODY = 1024 * 1024
+
+
+class ScanError(ValueError):
+    """
+    A scan line that cannot be queued.
+    """
+
+    def __init__(self, message, key=None):
+        super().__init__(message)
+        self.key = key
+
+
+def parse_scan(line):
+    """
+    Parse one scan line into an unsaved ScanEvent.
+
+    A line is a JSON object such as
+    ``{"key": "hh-7-000123", "station": 3, "payload": "BC1:P-1"}``, where
+    ``payload`` is the scanned QR text; ``product`` may be given instead with a
+    plain product ID. ``scanned_at`` optionally holds the ISO time of the scan.
+
+    Raises:
+        ScanError: If the line is not a valid scan.
+    """
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise ScanError("Invalid JSON.") from None
+    if not isinstance(data, dict):
+        raise ScanError("Expected a JSON object.")
+
+    key = data.get("key")
+    if not isinstance(key, str) or not 0 < len(key) <= 100:
+        raise ScanError("Missing or invalid key.")
+    product_id = data.get("product") or parse_qr_payload(str(data.get("payload", "")))
+    if not isinstance(product_id, str) or not 0 < len(product_id) <= 50:
+        raise ScanError("Missing or unrecognised product.", key)
+    station_id = data.get("station")
+    if not isinstance(station_id, int) or isinstance(station_id, bool):
+        raise ScanError("Missing or invalid station.", key)
+    scanned_at = None
+    if data.get("scanned_at"):
+        try:
+            scanned_at = parse_datetime(str(data["scanned_at"]))
+        except ValueError:
+            scanned_at = None
+        if scanned_at is None:
+            raise ScanError("Invalid scanned_at.", key)
+
+    return ScanEvent(
+        key=key, product_id=product_id, station_id=station_id, scanned_at=scanned_at
+    )
+
+
+def scan_ack(key, error=None):
+    """
+    Return the acknowledgement of a scan, sent back to the device.
+    """
+    if error is None:
+        return {"key": key, "status": "queued"}
+    return {"key": key, "status": "rejected", "error": error}
+
+
+def _run_db(func, *args):
+    # Drop connections broken by an earlier failure before touching the database
+    close_old_connections()
+    return func(*args)
+
+
+class ScanGateway:
+    """
+    Lightweight ingestion service for the scans of the floor's handheld devices.
+
+    Devices connect over TCP and send one JSON scan per line (see
+    ``parse_scan``), or POST the same lines to ``/scans`` over plain HTTP. Every
+    scan is acknowledged with one JSON line once it is durably queued as a
+    ScanEvent; a device should resend scans it got no acknowledgement for, which
+    is safe because their keys are unique.
+
+    Scans go through a bounded in-memory queue. When it is full, connections
+    stop being read, so TCP flow control slows the devices down instead of the
+    gateway running out of memory. A single writer stores whatever is queued in
+    one ``INSERT`` per batch, and a single applier turns the stored scans into
+    moves with ``apply_scan_events``, in arrival order per product and station.
+    Both use their own thread and database connection, so a slow apply never
+    delays acknowledgements.
+
+    Attributes:
+        queue_size (int): Scans held in memory before devices are slowed down.
+        batch_size (int): Maximum scans stored or applied per transaction.
+        poll_interval (float): Seconds between checks for scans queued elsewhere.
+    """
+
+    def __init__(self, queue_size=10000, batch_size=500, poll_interval=1.0):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.server = None
+        self._queue = None
+        self._wake = None
+        self._tasks = []
+        self._store_executor = ThreadPoolExecutor(1, thread_name_prefix="scan-store")
+        self._apply_executor = ThreadPoolExecutor(1, thread_name_prefix="scan-apply")
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self, host="0.0.0.0", port=7070):
+        """
+        Start listening and processing scans; ``port`` 0 picks a free port.
+        """
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._wake = asyncio.Event()
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        self._tasks = [
+            asyncio.create_task(self._store_loop()),
+            asyncio.create_task(self._apply_loop()),
+        ]
+        return self.server
+
+    async def flush(self):
+        """
+        Wait until every scan received so far is stored and applied.
+        """
+        await self._queue.join()
+        while await self._run(self._apply_executor, apply_scan_events, self.batch_size):
+            pass
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for executor in (self._store_executor, self._apply_executor):
+            await self._run(executor, connections.close_all)
+            executor.shutdown()
+
+    async def submit(self, event):
+        """
+        Queue a scan, waiting for room if the queue is full.
+
+        Returns:
+            asyncio.Future: Resolves to the acknowledgement of the scan.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((event, future))
+        return future
+
+    async def handle_connection(self, reader, writer):
+        try:
+            first_line = await reader.readline()
+            request = HTTP_REQUEST_LINE.match(first_line)
+            if request:
+                await self._handle_http(*request.groups(), reader, writer)
+            elif first_line:
+                await self._handle_lines(first_line, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError:
+            # A line longer than the stream limit
+            logger.warning("Dropped a connection sending an oversized line")
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _accept(self, line):
+        try:
+            event = parse_scan(line)
+        except ScanError as exc:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(scan_ack(exc.key, str(exc)))
+            return future
+        return await self.submit(event)
+
+    async def _handle_lines(self, line, reader, writer):
+        # Acknowledgements are written by a separate task, so a connection keeps
+        # streaming scans while earlier ones are still being stored
+        acks = asyncio.Queue()
+        sender = asyncio.create_task(self._send_acks(acks, writer))
+        try:
+            while line:
+                if line.strip():
+                    await acks.put(await self._accept(line))
+                line = await reader.readline()
+        finally:
+            await acks.put(None)
+            await sender
+
+    async def _send_acks(self, acks, writer):
+        while True:
+            future = await acks.get()
+            if future is None:
+                break
+            writer.write(json.dumps(await future).encode() + b"\n")
+            if acks.empty():
+                await writer.drain()
+
+    async def _handle_http(self, method, path, reader, writer):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if path == b"/health" and method == b"GET":
+            payload = {"queued": self._queue.qsize()}
+            return await self._respond(writer, HTTPStatus.OK, payload)
+        if path != b"/scans":
+            return await self._respond(writer, HTTPStatus.NOT_FOUND, {})
+        if method != b"POST":
+            return await self._respond(writer, HTTPStatus.METHOD_NOT_ALLOWED, {})
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            return await self._respond(writer, HTTPStatus.BAD_REQUEST, {})
+        if length > MAX_HTTP_BODY:
+            return await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {})
+
+        body = await reader.readexactly(length)
+        futures = [
+            await self._accept(line) for line in body.splitlines() if line.strip()
+        ]
+        acks = [await future for future in futures]
+        await self._respond(writer, HTTPStatus.OK, {"acks": acks})
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _run(self, executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, _run_db, func, *args
+        )
+
+    async def _store_loop(self):
+        while True:
+            # Whatever queued up while the previous batch was stored goes into
+            # the next one, so batches grow with the load without adding latency
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            events = [event for event, _ in batch]
+            try:
+                errors = await self._run(
+                    self._store_executor, store_scan_events, events
+                )
+            except Exception:
+                logger.exception("Could not store %d scan events", len(batch))
+                errors = ["Not queued, resend the scan."] * len(batch)
+
+            for (event, future), error in zip(batch, errors):
+                if not future.done():
+                    future.set_result(scan_ack(event.key, error))
+                self._queue.task_done()
+            self._wake.set()
+
+    async def _apply_loop(self):
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            self._wake.clear()
+            try:
+                while (
+                    await self._run(
+                        self._apply_executor, apply_scan_events, self.batch_size
+                    )
+                    == self.batch_size
+                ):
+                    pass
+            except Exception:
+                logger.exception("Could not apply scan events")
+
+
+async def send_scans(host, port, scans):
+    """
+    Send scans to a gateway over the line protocol, as a device would.
+
+    Args:
+        host (str): Host of the gateway.
+        port (int): Port of the gateway.
+        scans (list): Scans, as dicts in the format read by ``parse_scan``.
+
+    Returns:
+        list: The acknowledgement of every scan.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.writelines(json.dumps(scan).encode() + b"\n" for scan in scans)
+    writer.write_eof()
+    await writer.drain()
+    acks = [json.loads(line) async for line in reader]
+    writer.close()
+    await writer.wait_closed()
+    return acks
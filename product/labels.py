@@ -0,0 +1,275 @@
+import zlib
+from io import BytesIO
+
+from .models import Product
+from .utils import make_qr, parallel_imap
+
+# Page sizes in PDF points (1/72 inch)
+PAGE_SIZES = {
+    "letter": (612, 792),
+    "a4": (595, 842),
+}
+
+QR_BORDER = 2
+FONT_SIZE = 8
+
+
+class LabelLayout:
+    """
+    Grid of labels on a print sheet.
+
+    Attributes:
+        columns (int): Number of labels across the page.
+        rows (int): Number of labels down the page.
+        page_size (str): One of ``PAGE_SIZES``.
+        margin (int): Page margin in points.
+    """
+
+    def __init__(self, columns=3, rows=8, page_size="letter", margin=36):
+        self.columns = columns
+        self.rows = rows
+        self.width, self.height = PAGE_SIZES[page_size]
+        self.margin = margin
+        self.cell_width = (self.width - 2 * margin) / columns
+        self.cell_height = (self.height - 2 * margin) / rows
+        self.qr_size = min(self.cell_height - 8, self.cell_width / 2)
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    def cell_origin(self, index):
+        """
+        Return the top-left corner of the ``index``-th cell, from the page's top-left.
+        """
+        row, column = divmod(index, self.columns)
+        return (
+            self.margin + column * self.cell_width,
+            self.margin + row * self.cell_height,
+        )
+
+    def max_chars(self):
+        text_width = self.cell_width - self.qr_size - 8
+        return max(4, int(text_width / (FONT_SIZE * 0.55)))
+
+
+def label_products(product_ids=None, station=None):
+    """
+    Return ``(product_id, product_name)`` pairs of the products to print.
+
+    Args:
+        product_ids (list): Only print these products.
+        station (int): Only print the products currently at this station.
+    """
+    queryset = Product.objects.order_by("pk")
+    if product_ids:
+        queryset = queryset.filter(pk__in=product_ids)
+    if station:
+        queryset = queryset.filter(current_station_id=station)
+    return queryset.values_list("product_id", "product_name")
+
+
+def label_modules(item):
+    """
+    Return ``(id, name, runs, size)`` for a label, where ``runs`` lists the dark
+    modules of the QR code as ``(row, column, length)`` horizontal runs and ``size``
+    is the number of modules per side.
+    """
+    id, name = item
+    matrix = make_qr(id).matrix
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                runs.append((y, start, x - start))
+            else:
+                x += 1
+    return id, name, runs, len(matrix)
+
+
+def _iter_pages(items, layout, max_workers):
+    page = []
+    for label in parallel_imap(label_modules, items, max_workers=max_workers):
+        page.append(label)
+        if len(page) == layout.per_page:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _pdf_text(value, max_chars):
+    value = str(value)[:max_chars]
+    return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class _PDFWriter:
+    """
+    Minimal PDF writer that emits each page as soon as it is drawn.
+
+    Object 1 is the catalog, 2 the page tree (written last, once every page is
+    known) and 3 the font; pages follow from object 4 on.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.xref = {}
+        self.page_ids = []
+        self.next_id = 4
+
+    def _write(self, data):
+        self.offset += len(data)
+        return data
+
+    def _object(self, obj_id, body):
+        self.xref[obj_id] = self.offset
+        return self._write(b"%d 0 obj\n%s\nendobj\n" % (obj_id, body))
+
+    def header(self):
+        return self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n") + self._object(
+            3,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+            b" /Encoding /WinAnsiEncoding >>",
+        )
+
+    def page(self, content, width, height):
+        stream = zlib.compress(content)
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        return self._object(
+            content_id,
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream"
+            % (len(stream), stream),
+        ) + self._object(
+            page_id,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d]"
+            b" /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (width, height, content_id),
+        )
+
+    def trailer(self):
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.page_ids)
+        data = self._object(
+            2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_ids))
+        )
+        data += self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.offset
+        xref = [b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id]
+        xref += [b"%010d 00000 n \n" % self.xref[i] for i in range(1, self.next_id)]
+        return (
+            data
+            + b"".join(xref)
+            + (
+                b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                % (self.next_id, xref_offset)
+            )
+        )
+
+
+def _pdf_page_content(page, layout):
+    commands = []
+    max_chars = layout.max_chars()
+    for index, (id, name, runs, size) in enumerate(page):
+        left, top = layout.cell_origin(index)
+        # PDF coordinates start at the bottom-left corner of the page
+        top = layout.height - top
+        module = layout.qr_size / (size + 2 * QR_BORDER)
+        qr_left = left + QR_BORDER * module
+        qr_top = top - 4 - QR_BORDER * module
+        for y, x, length in runs:
+            commands.append(
+                "%.2f %.2f %.2f %.2f re"
+                % (
+                    qr_left + x * module,
+                    qr_top - (y + 1) * module,
+                    length * module,
+                    module,
+                )
+            )
+        commands.append("f")
+
+        text_left = left + layout.qr_size + 4
+        text_top = top - 4 - layout.qr_size / 2
+        commands.append(
+            "BT /F1 %d Tf %.2f %.2f Td" % (FONT_SIZE + 2, text_left, text_top + 2)
+        )
+        commands.append("(%s) Tj" % _pdf_text(id, max_chars))
+        commands.append("0 %d Td /F1 %d Tf" % (-(FONT_SIZE + 4), FONT_SIZE))
+        commands.append("(%s) Tj ET" % _pdf_text(name, max_chars))
+    return "\n".join(commands).encode("latin-1", "replace")
+
+
+def iter_pdf_sheet(items, layout=None, max_workers=None):
+    """
+    Yield a PDF print sheet of QR labels chunk by chunk.
+
+    QR codes are computed across a process pool and drawn as vector shapes, so no
+    image is rasterized; each page is written out as soon as it is complete.
+
+    Args:
+        items (iterable): ``(product_id, product_name)`` pairs.
+        layout (LabelLayout): Label grid, defaults to 3 x 8 labels on letter paper.
+        max_workers (int): Size of the process pool, defaults to the CPU count.
+    """
+    layout = layout or LabelLayout()
+    writer = _PDFWriter()
+    yield writer.header()
+    for page in _iter_pages(items, layout, max_workers):
+        yield writer.page(_pdf_page_content(page, layout), layout.width, layout.height)
+    yield writer.trailer()
+
+
+def _png_page(page, layout, dpi):
+    from PIL import Image, ImageDraw
+
+    scale = dpi / 72
+    image = Image.new(
+        "1", (round(layout.width * scale), round(layout.height * scale)), 1
+    )
+    draw = ImageDraw.Draw(image)
+    max_chars = layout.max_chars()
+    for index, (id, name, runs, size) in enumerate(page):
+        left, top = layout.cell_origin(index)
+        module = layout.qr_size / (size + 2 * QR_BORDER)
+        qr_left = left + QR_BORDER * module
+        qr_top = top + 4 + QR_BORDER * module
+        for y, x, length in runs:
+            x0 = (qr_left + x * module) * scale
+            y0 = (qr_top + y * module) * scale
+            draw.rectangle(
+                [x0, y0, x0 + length * module * scale - 1, y0 + module * scale - 1],
+                fill=0,
+            )
+
+        text_left = (left + layout.qr_size + 4) * scale
+        text_top = (top + 4 + layout.qr_size / 2 - FONT_SIZE) * scale
+        draw.text((text_left, text_top), str(id)[:max_chars], fill=0)
+        draw.text(
+            (text_left, text_top + (FONT_SIZE + 4) * scale),
+            str(name)[:max_chars],
+            fill=0,
+        )
+
+    output = BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+
+def iter_png_pages(items, layout=None, dpi=150, max_workers=None):
+    """
+    Yield print sheet pages of QR labels as tiled PNG images, one page at a time.
+
+    Args:
+        items (iterable): ``(product_id, product_name)`` pairs.
+        layout (LabelLayout): Label grid, defaults to 3 x 8 labels on letter paper.
+        dpi (int): Resolution of the pages.
+        max_workers (int): Size of the process pool, defaults to the CPU count.
+    """
+    layout = layout or LabelLayout()
+    for page in _iter_pages(items, layout, max_workers):
+        yield _png_page(page, layout, dpi)
@@ -0,0 +1,52 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from product.archive import move_closed_processes
+
+
+class Command(BaseCommand):
+    help = (
+        "Move processes closed more than --days ago from the hot Process table "
+        "into the month-partitioned process history, in short batches. Safe to "
+        "run while serving; the first run converts the existing history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.PROCESS_HOT_DAYS,
+            help="Days closed processes stay in the hot table.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches, to spare a busy database.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        started = time.monotonic()
+        total = 0
+        while True:
+            moved = move_closed_processes(cutoff, options["batch_size"])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write(f"{total} processes moved")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {total} processes closed before {cutoff:%Y-%m-%d} "
+                f"in {elapsed:.1f}s"
+            )
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from product.stats import rebuild_station_stats
+
+
+def parse_since(value):
+    since = parse_datetime(value) if value else None
+    if value and since is None:
+        raise CommandError(f"Invalid --since {value!r}, expected an ISO date and time.")
+    if since is not None and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the hourly station stats from the process history. Moves keep "
+        "them up to date afterwards; run this once after deploying them, or to "
+        "repair hours reported by check_station_stats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since", help="Only rebuild the hours from this ISO date and time on."
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_station_stats(since=parse_since(options["since"]))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} station hours."))
@@ -0,0 +1,69 @@
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from product.models import Product, Station
+from product.services import move_products, open_entry_processes
+from product.views import StationViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the station list as products in work-in-progress grow, on temporary "
+        "products that are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="100,1000,5000",
+            help="Comma separated numbers of products in work-in-progress.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Requests timed per size."
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["sizes"].split(","))
+        station_ids = list(Station.objects.order_by("id").values_list("pk", flat=True))
+        if not station_ids:
+            raise CommandError("The benchmark needs at least one station.")
+
+        view = StationViewSet.as_view({"get": "list"})
+        factory = APIRequestFactory()
+        prefix = uuid.uuid4().hex[:8]
+        step = len(station_ids)
+        host = settings.ALLOWED_HOSTS[0].lstrip(".")
+        with transaction.atomic():
+            created = 0
+            for size in sizes:
+                products = Product.objects.bulk_create(
+                    [
+                        Product(product_id=f"bench-{prefix}-{i}", product_name="")
+                        for i in range(created, size)
+                    ]
+                )
+                open_entry_processes(products)
+                # Spread the new products over the stations
+                for offset, station_id in enumerate(station_ids[1:], 1):
+                    move_products([p.pk for p in products[offset::step]], station_id)
+                created = size
+
+                timings = []
+                for _ in range(options["repeat"]):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        view(factory.get("/api/v1/stations/", HTTP_HOST=host)).render()
+                        timings.append(time.perf_counter() - started)
+                self.stdout.write(
+                    f"{size:>7} products: {len(queries):>3} queries, "
+                    f"median {statistics.median(timings) * 1000:.1f}ms"
+                )
+            # Leave no trace of the temporary products
+            transaction.set_rollback(True)
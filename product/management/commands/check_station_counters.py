@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product.counters import drifted_station_counters, repair_station_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the station counters from the processes and list the stations "
+        "whose counts differ. Exits with an error if any do, unless --fix is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix", action="store_true", help="Overwrite the drifted counters."
+        )
+
+    def handle(self, *args, **options):
+        if options["fix"]:
+            drifted = repair_station_counters()
+        else:
+            drifted = drifted_station_counters()
+
+        for station_id, stored, counts in drifted:
+            self.stdout.write(
+                f"Station {station_id}: counted (wip, in, out) {stored}, "
+                f"processes give {counts}"
+            )
+        if options["fix"]:
+            self.stdout.write(
+                self.style.SUCCESS(f"Repaired {len(drifted)} station counters.")
+            )
+        elif drifted:
+            raise CommandError(
+                f"{len(drifted)} station counters differ, run with --fix."
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("Station counters match."))
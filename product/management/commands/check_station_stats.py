@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product.management.commands.backfill_station_stats import parse_since
+from product.stats import drifted_station_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the hourly station stats with the process history and list the "
+        "hours that differ. Exits with an error if any do."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since", help="Only check the hours from this ISO date and time on."
+        )
+
+    def handle(self, *args, **options):
+        drifted = drifted_station_stats(since=parse_since(options["since"]))
+        for station_id, hour in drifted:
+            self.stdout.write(f"Station {station_id} at {hour.isoformat()} differs")
+        if drifted:
+            raise CommandError(
+                f"{len(drifted)} station hours differ, run backfill_station_stats."
+            )
+        self.stdout.write(self.style.SUCCESS("Station stats match the history."))
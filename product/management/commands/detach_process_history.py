@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.archive import detach_history_partition, history_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive the process history of every month before --before into gzipped "
+        "CSV files and drop their partitions. Archived months stay readable "
+        "through /api/v1/process-archives/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before", required=True, help="First month to keep, as YYYY-MM."
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the months that would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            before = datetime.datetime.strptime(options["before"], "%Y-%m").date()
+        except ValueError:
+            raise CommandError("--before must be a month as YYYY-MM.") from None
+
+        for month in history_partitions():
+            if month >= before:
+                break
+            if options["dry_run"]:
+                self.stdout.write(f"{month:%Y-%m} would be archived")
+                continue
+            archive = detach_history_partition(month)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Archived {archive.rows} processes of {month:%Y-%m} "
+                    f"to {archive.file}"
+                )
+            )
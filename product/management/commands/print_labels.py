@@ -0,0 +1,58 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.labels import (
+    PAGE_SIZES,
+    LabelLayout,
+    iter_pdf_sheet,
+    iter_png_pages,
+    label_products,
+)
+
+
+class Command(BaseCommand):
+    help = "Write a print sheet of product QR labels as a PDF or as tiled PNG pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="PDF file, or directory for PNG pages.")
+        parser.add_argument("--ids", nargs="+", help="Product IDs to print.")
+        parser.add_argument(
+            "--station", type=int, help="Print the products currently at a station."
+        )
+        parser.add_argument("--format", choices=["pdf", "png"], default="pdf")
+        parser.add_argument("--page-size", choices=list(PAGE_SIZES), default="letter")
+        parser.add_argument("--columns", type=int, default=3)
+        parser.add_argument("--rows", type=int, default=8)
+        parser.add_argument("--dpi", type=int, default=150)
+        parser.add_argument("--workers", type=int, help="Size of the process pool.")
+
+    def handle(self, *args, **options):
+        if not options["ids"] and not options["station"]:
+            raise CommandError("Provide --ids or --station.")
+
+        layout = LabelLayout(
+            columns=options["columns"],
+            rows=options["rows"],
+            page_size=options["page_size"],
+        )
+        items = label_products(options["ids"], options["station"]).iterator(
+            chunk_size=500
+        )
+        output = options["output"]
+
+        if options["format"] == "pdf":
+            with open(output, "wb") as f:
+                for chunk in iter_pdf_sheet(items, layout, options["workers"]):
+                    f.write(chunk)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+            return
+
+        os.makedirs(output, exist_ok=True)
+        pages = iter_png_pages(items, layout, options["dpi"], options["workers"])
+        for number, content in enumerate(pages, start=1):
+            path = os.path.join(output, f"labels-{number:03d}.png")
+            with open(path, "wb") as f:
+                f.write(content)
+            self.stdout.write(path)
+        self.stdout.write(self.style.SUCCESS(f"Wrote pages to {output}"))
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from product.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the change feed entries older than --days, in batches. Clients "
+        "with a cursor older than that have to reload everything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.CHANGE_LOG_DAYS,
+            help="Days changes stay in the feed.",
+        )
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        total = 0
+        while True:
+            deleted = prune_changes(before, options["batch_size"])
+            if not deleted:
+                break
+            total += deleted
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Pruned {total} changes made before {before:%Y-%m-%d %H:%M}"
+            )
+        )
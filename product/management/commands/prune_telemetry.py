@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from product.telemetry import SOURCES, prune_telemetry
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the raw readings and rollups of the sensor telemetry older than "
+        "their retention (TELEMETRY_RETENTION_DAYS), in batches. Queries of older "
+        "ranges are then answered from the coarser rollups still kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for source, _ in SOURCES:
+            days = settings.TELEMETRY_RETENTION_DAYS.get(source)
+            if days is None:
+                continue
+            before = now - timedelta(days=days)
+            total = 0
+            while True:
+                deleted = prune_telemetry(source, before, options["batch_size"])
+                if not deleted:
+                    break
+                total += deleted
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Pruned {total} {source} rows from before {before:%Y-%m-%d %H:%M}"
+                )
+            )
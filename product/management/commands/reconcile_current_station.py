@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from product.services import reconcile_current_pointers
+
+
+class Command(BaseCommand):
+    help = (
+        "Repair Product.current_station and Product.current_process where they "
+        "disagree with the product's active Process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many products have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        repaired = reconcile_current_pointers(dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"{repaired} products have drifted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} products."))
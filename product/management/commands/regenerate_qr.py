@@ -0,0 +1,116 @@
+import os
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.models import Product
+from product.utils import atomic_write, parallel_imap, qr_filename, render_qr
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate the stored QR images of products, e.g. after the QR format or "
+        "scale changed. Products are rendered across a process pool and saved in "
+        "batches; progress can be checkpointed to resume an interrupted run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Products fetched and saved per batch.",
+        )
+        parser.add_argument("--workers", type=int, help="Size of the process pool.")
+        parser.add_argument(
+            "--only-stale",
+            action="store_true",
+            help="Only products whose QR image is not ready.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording the last saved product, used to resume a run.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be regenerated without rendering anything.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        checkpoint = options["checkpoint"]
+        field = Product._meta.get_field("qr_image")
+        if not hasattr(field.storage, "path"):
+            raise CommandError("QR images can only be regenerated on local storage.")
+
+        queryset = Product.objects.order_by("pk")
+        if options["only_stale"]:
+            queryset = queryset.exclude(qr_status=Product.QRStatus.READY)
+        last_pk = self.read_checkpoint(checkpoint)
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+            self.stdout.write(f"Resuming after product {last_pk}")
+
+        if options["dry_run"]:
+            self.stdout.write(f"{queryset.count()} products would be regenerated.")
+            return
+
+        products = queryset.only("product_id", "product_name", "qr_image")
+        pending = deque()
+
+        def product_ids():
+            for product in products.iterator(chunk_size=batch_size):
+                pending.append(product)
+                yield product.product_id
+
+        started = time.monotonic()
+        total = 0
+        batch = []
+        for content in parallel_imap(
+            render_qr, product_ids(), max_workers=options["workers"]
+        ):
+            product = pending.popleft()
+            name = field.generate_filename(
+                product, qr_filename(product.product_id, product.product_name)
+            )
+            atomic_write(field.storage.path(name), content)
+            product.qr_image.name = name
+            product.qr_status = Product.QRStatus.READY
+            batch.append(product)
+
+            if len(batch) >= batch_size:
+                total += self.save_batch(batch, checkpoint, started, total)
+                batch = []
+        if batch:
+            total += self.save_batch(batch, checkpoint, started, total)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Regenerated {total} QR images in {elapsed:.1f}s "
+                f"({total / max(elapsed, 1e-6):.0f}/s)"
+            )
+        )
+        if checkpoint and os.path.exists(checkpoint):
+            os.unlink(checkpoint)
+
+    def save_batch(self, batch, checkpoint, started, done):
+        Product.objects.bulk_update(batch, ["qr_image", "qr_status"])
+        if checkpoint:
+            atomic_write(checkpoint, batch[-1].pk.encode())
+
+        done += len(batch)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{done} products, {done / max(elapsed, 1e-6):.0f}/s, "
+            f"last {batch[-1].pk}"
+        )
+        return len(batch)
+
+    def read_checkpoint(self, checkpoint):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return None
+        with open(checkpoint) as f:
+            return f.read().strip() or None
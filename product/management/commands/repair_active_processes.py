@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from product.services import close_duplicate_active_processes
+
+
+class Command(BaseCommand):
+    help = (
+        "Close all but the latest active Process of every product, so that each "
+        "product is at exactly one station. Runs as a single set-based UPDATE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many processes would be closed.",
+        )
+
+    def handle(self, *args, **options):
+        closed = close_duplicate_active_processes(dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"{closed} duplicate active processes found.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Closed {closed} processes."))
@@ -0,0 +1,53 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from product.gateway import ScanGateway
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the scan gateway, which queues scans from handheld devices sent over "
+        "a line-delimited TCP protocol or plain HTTP, and applies them as moves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="0.0.0.0")
+        parser.add_argument("--port", type=int, default=7070)
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=10000,
+            help="Scans held in memory before devices are slowed down.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Maximum scans stored or applied per transaction.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds between checks for scans queued by other gateways.",
+        )
+
+    def handle(self, *args, **options):
+        gateway = ScanGateway(
+            queue_size=options["queue_size"],
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+        )
+        try:
+            asyncio.run(self.serve(gateway, options["host"], options["port"]))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, gateway, host, port):
+        server = await gateway.start(host, port)
+        self.stdout.write(f"Scan gateway listening on {host}:{gateway.port}")
+        try:
+            await server.serve_forever()
+        finally:
+            await gateway.close()
@@ -0,0 +1,108 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from product.models import ProcessingImages, Product
+
+# (model, field name) pairs whose files are moved into their sharded layout
+SHARDED_FIELDS = [
+    (Product, "qr_image"),
+    (ProcessingImages, "picture"),
+]
+
+
+def link_or_copy(source, target):
+    """
+    Make ``target`` point at the content of ``source`` without removing it.
+
+    A hard link is used where possible, falling back to an atomic copy across
+    file systems. An existing ``target`` (from an interrupted run) is kept.
+    """
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        tmp_path = f"{target}.tmp"
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move stored QR codes and process pictures into hash-sharded directories "
+        "and rewrite their file paths. Files stay reachable at their old path until "
+        "the rows pointing at them are updated, so this can run while serving."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--keep-old",
+            action="store_true",
+            help="Do not delete the files at their old paths.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report how many files would move without changing anything.",
+        )
+
+    def handle(self, *args, **options):
+        for model, field_name in SHARDED_FIELDS:
+            field = model._meta.get_field(field_name)
+            if not hasattr(field.storage, "path"):
+                raise CommandError("Media can only be sharded on local storage.")
+            moved = self.shard_field(model, field, options)
+            self.stdout.write(
+                self.style.SUCCESS(f"{model.__name__}.{field_name}: {moved} files")
+            )
+
+    def shard_field(self, model, field, options):
+        upload_to = field.upload_to
+        queryset = (
+            model.objects.exclude(**{field.name: ""})
+            .exclude(**{f"{field.name}__isnull": True})
+            .order_by("pk")
+            .only(field.name)
+        )
+
+        moved = 0
+        batch = []
+        for instance in queryset.iterator(chunk_size=options["batch_size"]):
+            name = getattr(instance, field.name).name
+            if upload_to.is_sharded(name):
+                continue
+            target_name = upload_to.path_for(name)
+            if options["dry_run"]:
+                moved += 1
+                continue
+
+            source = field.storage.path(name)
+            if not os.path.exists(source):
+                self.stderr.write(f"Missing file {name}, skipped")
+                continue
+            link_or_copy(source, field.storage.path(target_name))
+            getattr(instance, field.name).name = target_name
+            batch.append((instance, source))
+
+            if len(batch) >= options["batch_size"]:
+                moved += self.save_batch(model, field, batch, options["keep_old"])
+                batch = []
+        if batch:
+            moved += self.save_batch(model, field, batch, options["keep_old"])
+        return moved
+
+    def save_batch(self, model, field, batch, keep_old):
+        with transaction.atomic():
+            model.objects.bulk_update([instance for instance, _ in batch], [field.name])
+        # Old paths are only removed once no row refers to them anymore
+        if not keep_old:
+            for _, source in batch:
+                if os.path.exists(source):
+                    os.unlink(source)
+        self.stdout.write(f"{model.__name__}: moved {len(batch)} files")
+        return len(batch)
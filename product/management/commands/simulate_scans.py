@@ -0,0 +1,61 @@
+import asyncio
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.gateway import send_scans
+from product.models import Product, Station
+from product.utils import qr_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Send random scans of existing products to a running scan gateway from "
+        "several simulated devices, and report the acknowledgement throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=7070)
+        parser.add_argument("--devices", type=int, default=10)
+        parser.add_argument(
+            "--scans", type=int, default=1000, help="Scans sent by every device."
+        )
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list("pk", flat=True)[:10000])
+        station_ids = list(Station.objects.values_list("pk", flat=True))
+        if not product_ids or not station_ids:
+            raise CommandError("Scans need at least one product and one station.")
+
+        devices = [
+            [
+                {
+                    "key": uuid.uuid4().hex,
+                    "station": random.choice(station_ids),
+                    "payload": qr_payload(random.choice(product_ids)),
+                }
+                for _ in range(options["scans"])
+            ]
+            for _ in range(options["devices"])
+        ]
+
+        started = time.monotonic()
+        acks = asyncio.run(self.send(options["host"], options["port"], devices))
+        elapsed = time.monotonic() - started
+
+        queued = sum(ack["status"] == "queued" for ack in acks)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{queued}/{len(acks)} scans queued in {elapsed:.1f}s "
+                f"({len(acks) / max(elapsed, 1e-6):.0f}/s)"
+            )
+        )
+
+    async def send(self, host, port, devices):
+        results = await asyncio.gather(
+            *(send_scans(host, port, scans) for scans in devices)
+        )
+        return [ack for acks in results for ack in acks]
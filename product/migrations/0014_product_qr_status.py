@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+def mark_rendered_products_ready(apps, schema_editor):
+    Product = apps.get_model("product", "Product")
+    Product.objects.exclude(qr_image="").exclude(qr_image__isnull=True).update(
+        qr_status="ready"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0013_process_is_active"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="qr_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=20,
+                verbose_name="QR render status",
+            ),
+        ),
+        migrations.RunPython(
+            mark_rendered_products_ready, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:14
+
+from django.db import migrations, models
+import product.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0014_product_qr_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="processingimages",
+            name="picture",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                upload_to=product.storage.ShardedUploadTo("process_pictures"),
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="qr_image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                upload_to=product.storage.ShardedUploadTo("qr_codes"),
+            ),
+        ),
+    ]
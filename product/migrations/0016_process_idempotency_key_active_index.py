@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0015_sharded_media_upload_to"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="process",
+            name="idempotency_key",
+            field=models.CharField(
+                blank=True,
+                max_length=100,
+                null=True,
+                unique=True,
+                verbose_name="Idempotency key of the move that opened this process",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="process",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["product"],
+                name="process_active_product_idx",
+            ),
+        ),
+    ]
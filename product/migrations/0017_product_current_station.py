@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BACKFILL_CURRENT_POINTERS_SQL = """
+    UPDATE product_product p
+    SET current_process_id = active.id, current_station_id = active.station_id
+    FROM (
+        SELECT DISTINCT ON (product_id) product_id, id, station_id
+        FROM product_process
+        WHERE is_active
+        ORDER BY product_id, id DESC
+    ) active
+    WHERE p.product_id = active.product_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0016_process_idempotency_key_active_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="current_process",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="product.process",
+                verbose_name="Current process",
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="current_station",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="current_products",
+                to="product.station",
+                verbose_name="Current station",
+            ),
+        ),
+        migrations.RunSQL(
+            BACKFILL_CURRENT_POINTERS_SQL, reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
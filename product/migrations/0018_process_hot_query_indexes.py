@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:21
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built concurrently so moves keep flowing while the history table is indexed
+    atomic = False
+
+    dependencies = [
+        ("product", "0017_product_current_station"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="process",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["station"],
+                name="process_active_station_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="process",
+            index=models.Index(
+                fields=["product", "id"], name="process_product_history_idx"
+            ),
+        ),
+    ]
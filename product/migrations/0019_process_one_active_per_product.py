@@ -0,0 +1,67 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:22
+
+from django.db import migrations, models
+
+# Close every active process but the latest one of its product, as of the entry
+# into the next one, so that the unique constraint can be created.
+CLOSE_DUPLICATE_ACTIVE_PROCESSES_SQL = """
+    UPDATE product_process pr
+    SET is_active = FALSE,
+        exit_time = COALESCE(pr.exit_time, duplicate.next_entry_time, now())
+    FROM (
+        SELECT id, next_entry_time
+        FROM (
+            SELECT
+                id,
+                row_number() OVER (
+                    PARTITION BY product_id
+                    ORDER BY entry_time DESC NULLS LAST, id DESC
+                ) AS recency,
+                lead(entry_time) OVER (
+                    PARTITION BY product_id ORDER BY entry_time ASC NULLS FIRST, id ASC
+                ) AS next_entry_time
+            FROM product_process
+            WHERE is_active
+        ) ranked
+        WHERE recency > 1
+    ) duplicate
+    WHERE pr.id = duplicate.id
+"""
+
+# Point products whose current process was just closed at the remaining one
+SYNC_CURRENT_POINTERS_SQL = """
+    UPDATE product_product p
+    SET current_process_id = active.id, current_station_id = active.station_id
+    FROM product_process active
+    WHERE active.product_id = p.product_id
+        AND active.is_active
+        AND p.current_process_id IS DISTINCT FROM active.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0018_process_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CLOSE_DUPLICATE_ACTIVE_PROCESSES_SQL, reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            SYNC_CURRENT_POINTERS_SQL, reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.AddConstraint(
+            model_name="process",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_active", True)),
+                fields=("product",),
+                name="process_one_active_per_product",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="process",
+            name="process_active_product_idx",
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:27
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0020_scanevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StationHourlyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField()),
+                ("count_in", models.IntegerField(default=0)),
+                ("count_out", models.IntegerField(default=0)),
+                ("dwell_sum", models.FloatField(default=0)),
+                ("dwell_min", models.FloatField(blank=True, null=True)),
+                ("dwell_max", models.FloatField(blank=True, null=True)),
+                (
+                    "dwell_histogram",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.IntegerField(), default=list, size=None
+                    ),
+                ),
+                (
+                    "station",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="product.station",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="stationhourlystats",
+            constraint=models.UniqueConstraint(
+                fields=("station", "hour"), name="station_hourly_stats_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# History of closed processes, partitioned by month of entry_time; the monthly
+# partitions are created on demand by product.archive
+CREATE_PROCESS_HISTORY_SQL = """
+    CREATE TABLE product_processhistory (
+        id bigint NOT NULL,
+        station_id bigint NOT NULL,
+        product_id varchar(50) NOT NULL,
+        process_number integer NOT NULL,
+        entry_time timestamp with time zone,
+        exit_time timestamp with time zone,
+        idempotency_key varchar(100)
+    ) PARTITION BY RANGE (entry_time);
+    CREATE TABLE product_processhistory_default
+        PARTITION OF product_processhistory DEFAULT;
+    CREATE INDEX product_processhistory_id_idx ON product_processhistory (id);
+    CREATE INDEX product_processhistory_product_idx
+        ON product_processhistory (product_id, entry_time);
+    CREATE INDEX product_processhistory_station_idx
+        ON product_processhistory (station_id, exit_time);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0021_stationhourlystats"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CREATE_PROCESS_HISTORY_SQL,
+            reverse_sql="DROP TABLE product_processhistory",
+        ),
+        migrations.CreateModel(
+            name="ProcessHistory",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("process_number", models.IntegerField()),
+                ("entry_time", models.DateTimeField(blank=True, null=True)),
+                ("exit_time", models.DateTimeField(blank=True, null=True)),
+                (
+                    "idempotency_key",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+            ],
+            options={
+                "db_table": "product_processhistory",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="ProcessArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(unique=True)),
+                ("file", models.CharField(max_length=255)),
+                ("rows", models.IntegerField()),
+                ("last_exit_time", models.DateTimeField(blank=True, null=True)),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,113 @@
+from django.db import migrations, models
+
+# Resources of the change feed: table, resource name and primary key column
+SYNCED_TABLES = [
+    ("product_product", "product", "product_id"),
+    ("product_process", "process", "id"),
+    ("product_castingsnapshot", "casting_snapshot", "id"),
+]
+
+# Station sections of a casting snapshot, with the snapshot column referencing
+# them; an update of a section is a change of its snapshot
+SNAPSHOT_SECTION_TABLES = [
+    ("product_stationone", "station_one_id"),
+    ("product_rammingfloor", "ramming_floor_id"),
+    ("product_moldingfloor", "molding_floor_id"),
+    ("product_pour", "pour_id"),
+    ("product_shakeout", "shakeout_id"),
+    ("product_quality", "quality_id"),
+]
+
+# Statement level triggers, so a bulk write logs all its rows with one insert
+CREATE_CHANGELOG_SQL = """
+    CREATE TABLE product_changelog (
+        id bigserial PRIMARY KEY,
+        txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+        resource varchar(32) NOT NULL,
+        object_id varchar(50) NOT NULL,
+        changed_at timestamp with time zone NOT NULL DEFAULT now()
+    );
+    CREATE INDEX product_changelog_cursor_idx ON product_changelog (txid, id);
+
+    CREATE FUNCTION product_log_changes() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        EXECUTE format(
+            'INSERT INTO product_changelog (resource, object_id) '
+            'SELECT DISTINCT %L, %I::text FROM %I',
+            TG_ARGV[0],
+            TG_ARGV[1],
+            CASE TG_OP WHEN 'DELETE' THEN 'old_rows' ELSE 'new_rows' END
+        );
+        RETURN NULL;
+    END
+    $$;
+
+    CREATE FUNCTION product_log_snapshot_section_changes() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        EXECUTE format(
+            'INSERT INTO product_changelog (resource, object_id) '
+            'SELECT DISTINCT ''casting_snapshot'', s.id::text '
+            'FROM product_castingsnapshot s JOIN new_rows r ON s.%I = r.id',
+            TG_ARGV[0]
+        );
+        RETURN NULL;
+    END
+    $$;
+"""
+
+DROP_CHANGELOG_SQL = """
+    DROP FUNCTION product_log_changes() CASCADE;
+    DROP FUNCTION product_log_snapshot_section_changes() CASCADE;
+    DROP TABLE product_changelog;
+"""
+
+
+def create_triggers_sql():
+    statements = []
+    for table, resource, key in SYNCED_TABLES:
+        for event, transition in [
+            ("INSERT", "NEW TABLE AS new_rows"),
+            ("UPDATE", "NEW TABLE AS new_rows"),
+            ("DELETE", "OLD TABLE AS old_rows"),
+        ]:
+            statements.append(f"""
+                CREATE TRIGGER {table}_log_{event.lower()}
+                AFTER {event} ON {table}
+                REFERENCING {transition} FOR EACH STATEMENT
+                EXECUTE FUNCTION product_log_changes('{resource}', '{key}')
+                """)
+    for table, column in SNAPSHOT_SECTION_TABLES:
+        statements.append(f"""
+            CREATE TRIGGER {table}_log_update
+            AFTER UPDATE ON {table}
+            REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+            EXECUTE FUNCTION product_log_snapshot_section_changes('{column}')
+            """)
+    return ";".join(statements)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0022_process_history_partitions"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_CHANGELOG_SQL, reverse_sql=DROP_CHANGELOG_SQL),
+        migrations.RunSQL(create_triggers_sql(), reverse_sql=migrations.RunSQL.noop),
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("resource", models.CharField(max_length=32)),
+                ("object_id", models.CharField(max_length=50)),
+                ("changed_at", models.DateTimeField()),
+            ],
+            options={
+                "db_table": "product_changelog",
+                "managed": False,
+            },
+        ),
+    ]
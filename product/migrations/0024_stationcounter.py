@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Counters of the existing stations, from their hot and historical processes
+FILL_COUNTERS_SQL = """
+    INSERT INTO product_stationcounter (station_id, wip, count_in, count_out)
+    WITH processes AS (
+        SELECT station_id, is_active FROM product_process
+        UNION ALL
+        SELECT station_id, FALSE FROM product_processhistory
+    )
+    SELECT s.id,
+           count(*) FILTER (WHERE p.is_active),
+           count(p.station_id),
+           count(*) FILTER (WHERE NOT p.is_active)
+    FROM product_station s
+    LEFT JOIN processes p ON p.station_id = s.id
+    GROUP BY s.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0023_changelog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StationCounter",
+            fields=[
+                (
+                    "station",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="counter",
+                        serialize=False,
+                        to="product.station",
+                    ),
+                ),
+                ("wip", models.IntegerField(default=0)),
+                ("count_in", models.BigIntegerField(default=0)),
+                ("count_out", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(FILL_COUNTERS_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
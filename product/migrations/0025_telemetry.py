@@ -0,0 +1,105 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:53
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("product", "0024_stationcounter"),
+    ]
+
+    operations = [
+        # Added without the default first, so the existing snapshots keep no time
+        migrations.AddField(
+            model_name="castingsnapshot",
+            name="recorded_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Time the snapshot was taken; its telemetry is read around it.",
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="castingsnapshot",
+            name="recorded_at",
+            field=models.DateTimeField(
+                blank=True,
+                default=django.utils.timezone.now,
+                help_text="Time the snapshot was taken; its telemetry is read around it.",
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="TelemetryReading",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("sensor", models.CharField(max_length=50)),
+                ("recorded_at", models.DateTimeField()),
+                ("value", models.FloatField()),
+                (
+                    "station",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="product.station",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TelemetryRollup",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("sensor", models.CharField(max_length=50)),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("1m", "1 minute"), ("1h", "1 hour"), ("1d", "1 day")],
+                        max_length=2,
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("count", models.IntegerField()),
+                ("value_sum", models.FloatField()),
+                ("value_min", models.FloatField()),
+                ("value_max", models.FloatField()),
+                (
+                    "station",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="product.station",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "bucket"], name="telemetry_rollup_age_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="telemetryrollup",
+            constraint=models.UniqueConstraint(
+                fields=("station", "resolution", "sensor", "bucket"),
+                name="telemetry_rollup_unique",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="telemetryreading",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                fields=["recorded_at"], name="telemetry_reading_time_brin"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="telemetryreading",
+            constraint=models.UniqueConstraint(
+                fields=("station", "sensor", "recorded_at"),
+                name="telemetry_reading_unique",
+            ),
+        ),
+    ]
@@ -1,11 +1,50 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .storage import ShardedUploadTo
+
 
 class Product(models.Model):
+    class QRStatus(models.TextChoices):
+        """
+        Render state of the product's QR image, which is produced in the background.
+        """
+
+        PENDING = "pending", _("Pending")
+        READY = "ready", _("Ready")
+        FAILED = "failed", _("Failed")
+
     product_id = models.CharField(max_length=50, primary_key=True)
     product_name = models.CharField(max_length=100)
-    qr_image = models.ImageField(upload_to="qr_codes/", null=True, blank=True)
+    qr_image = models.ImageField(
+        upload_to=ShardedUploadTo("qr_codes"), null=True, blank=True
+    )
+    qr_status = models.CharField(
+        verbose_name=_("QR render status"),
+        max_length=20,
+        choices=QRStatus.choices,
+        default=QRStatus.PENDING,
+    )
+    # Denormalized from the product's active Process, maintained by every move
+    current_station = models.ForeignKey(
+        "Station",
+        verbose_name=_("Current station"),
+        on_delete=models.SET_NULL,
+        related_name="current_products",
+        null=True,
+        blank=True,
+    )
+    current_process = models.OneToOneField(
+        "Process",
+        verbose_name=_("Current process"),
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
 
     def __str__(self):
         return f"ID: {self.product_id}, Name: {self.product_name}"
@@ -28,6 +67,8 @@ class Process(models.Model):
         stage (CharField): A choice field representing different stages in the process.
         entry_time (DateTimeField): The time when the product enters this process.
         exit_time (DateTimeField): The time when the product exits this process.
+        idempotency_key (CharField): Client supplied key of the move that opened this process,
+            so that retried moves are only applied once.
     """
 
     station = models.ForeignKey(Station, on_delete=models.CASCADE)
@@ -44,6 +85,33 @@ class Process(models.Model):
         null=True,
         blank=True,
     )
+    idempotency_key = models.CharField(
+        verbose_name=_("Idempotency key of the move that opened this process"),
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        constraints = [
+            # A product is at one station at a time
+            models.UniqueConstraint(
+                fields=["product"],
+                condition=models.Q(is_active=True),
+                name="process_one_active_per_product",
+            ),
+        ]
+        indexes = [
+            # Products currently at a station
+            models.Index(
+                fields=["station"],
+                condition=models.Q(is_active=True),
+                name="process_active_station_idx",
+            ),
+            # Process history of a product, in order
+            models.Index(fields=["product", "id"], name="process_product_history_idx"),
+        ]
 
     def __str__(self):
         """
@@ -52,6 +120,190 @@ class Process(models.Model):
         return f"Process {self.process_number} for {self.product}"
 
 
+class ProcessHistory(models.Model):
+    """
+    Closed processes moved out of the hot Process table.
+
+    The table is partitioned by month of ``entry_time`` and managed with raw SQL
+    (see ``product.archive``); processes without an entry time go to its default
+    partition. Old months are detached into ProcessArchive files.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    station = models.ForeignKey(
+        Station, on_delete=models.DO_NOTHING, db_constraint=False
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False
+    )
+    process_number = models.IntegerField()
+    entry_time = models.DateTimeField(null=True, blank=True)
+    exit_time = models.DateTimeField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
+
+    class Meta:
+        managed = False
+        db_table = "product_processhistory"
+
+    def __str__(self):
+        return f"Process {self.process_number} for {self.product_id}"
+
+
+class ProcessArchive(models.Model):
+    """
+    A month of process history detached from the database into a compressed file.
+
+    Attributes:
+        month (DateField): First day of the archived month of ``entry_time``.
+        file (CharField): Name of the gzipped CSV file in the archive storage.
+        rows (IntegerField): Number of archived processes.
+        last_exit_time (DateTimeField): Latest exit time of the archived processes;
+            the database holds the complete history after it.
+        archived_at (DateTimeField): Time the month was detached.
+    """
+
+    month = models.DateField(unique=True)
+    file = models.CharField(max_length=255)
+    rows = models.IntegerField()
+    last_exit_time = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Process archive {self.month:%Y-%m}"
+
+
+class StationHourlyStats(models.Model):
+    """
+    Flow of products through a station during one hour, kept up to date by every
+    move so that dashboards never have to scan the process history.
+
+    Attributes:
+        station (ForeignKey): The station.
+        hour (DateTimeField): Start of the hour, in UTC.
+        count_in (IntegerField): Processes entered during the hour.
+        count_out (IntegerField): Processes exited during the hour.
+        dwell_sum (FloatField): Total dwell time in seconds of the processes exited during the hour.
+        dwell_min (FloatField): Shortest of those dwell times.
+        dwell_max (FloatField): Longest of those dwell times.
+        dwell_histogram (ArrayField): Number of those dwell times per bucket of
+            ``product.stats.DWELL_HISTOGRAM_EDGES``.
+    """
+
+    station = models.ForeignKey(Station, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    count_in = models.IntegerField(default=0)
+    count_out = models.IntegerField(default=0)
+    dwell_sum = models.FloatField(default=0)
+    dwell_min = models.FloatField(null=True, blank=True)
+    dwell_max = models.FloatField(null=True, blank=True)
+    dwell_histogram = ArrayField(models.IntegerField(), default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["station", "hour"], name="station_hourly_stats_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.station} at {self.hour:%Y-%m-%d %H}:00"
+
+
+class StationCounter(models.Model):
+    """
+    Products at a station and through it, kept up to date by every move so that
+    count badges are a primary key read.
+
+    Attributes:
+        station (OneToOneField): The station.
+        wip (IntegerField): Products currently at the station (active processes).
+        count_in (BigIntegerField): Processes ever opened at the station.
+        count_out (BigIntegerField): Processes ever closed at the station.
+    """
+
+    station = models.OneToOneField(
+        Station, on_delete=models.CASCADE, primary_key=True, related_name="counter"
+    )
+    wip = models.IntegerField(default=0)
+    count_in = models.BigIntegerField(default=0)
+    count_out = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.station}: {self.wip} in progress"
+
+
+class ScanEvent(models.Model):
+    """
+    A scan from a floor device, durably queued by the scan gateway before it is
+    acknowledged and applied as a move later on.
+
+    Attributes:
+        key (CharField): Device supplied unique key, so that resent scans are only queued once.
+        product_id (CharField): Scanned product, resolved when the scan is applied.
+        station (ForeignKey): Station the product was scanned into.
+        scanned_at (DateTimeField): Time of the scan on the device, if it sent one.
+        received_at (DateTimeField): Time the gateway queued the scan.
+        status (CharField): Whether the scan is still pending or how it was applied.
+        applied_at (DateTimeField): Time the scan was applied.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        APPLIED = "applied", _("Applied")
+        SKIPPED = "skipped", _("Already at station")
+        FAILED = "failed", _("Unknown product")
+
+    key = models.CharField(max_length=100, unique=True)
+    product_id = models.CharField(max_length=50)
+    station = models.ForeignKey(Station, on_delete=models.CASCADE)
+    scanned_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(default=timezone.now)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    applied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Queue of scans still to apply, in arrival order
+            models.Index(
+                fields=["id"],
+                condition=models.Q(status="pending"),
+                name="scanevent_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Scan {self.key}: {self.product_id} to {self.station_id}"
+
+
+class ChangeLog(models.Model):
+    """
+    A row of a synced resource that was written, appended by database triggers in
+    the transaction that wrote it, including bulk and raw SQL writes.
+
+    The table also has a ``txid`` column, the ``xid8`` of the writing transaction,
+    which orders the change feed together with ``id`` (see ``product.changes``).
+
+    Attributes:
+        resource (CharField): Name of the changed resource, e.g. ``process``.
+        object_id (CharField): Primary key of the changed row.
+        changed_at (DateTimeField): Start of the writing transaction.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    resource = models.CharField(max_length=32)
+    object_id = models.CharField(max_length=50)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "product_changelog"
+
+    def __str__(self):
+        return f"Change of {self.resource} {self.object_id}"
+
+
 class ProcessingImages(models.Model):
     """
     Model to store images associated with manufacturing processes.
@@ -60,7 +312,9 @@ class ProcessingImages(models.Model):
         picture (ImageField): Represents an image associated with the process.
     """
 
-    picture = models.ImageField(upload_to="process_pictures/", null=True, blank=True)
+    picture = models.ImageField(
+        upload_to=ShardedUploadTo("process_pictures"), null=True, blank=True
+    )
 
 
 class RammingFloor(models.Model):
@@ -355,6 +609,14 @@ class CastingSnapshot(models.Model):
         Quality, on_delete=models.CASCADE, null=True, blank=True
     )
 
+    # Null for the snapshots taken before it was recorded
+    recorded_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        default=timezone.now,
+        help_text="Time the snapshot was taken; its telemetry is read around it.",
+    )
+
     def __str__(self):
 
         return f"Casting Snapshot {self.control_no}"
@@ -364,3 +626,91 @@ class CastingSnapshot(models.Model):
         verbose_name = "Casting Snapshot"
 
         verbose_name_plural = "Casting Snapshots"
+
+
+class TelemetryReading(models.Model):
+    """
+    A sample of a floor sensor, e.g. the sand temperature at a ramming floor.
+
+    Readings are only inserted by ``product.telemetry.record_telemetry``, which
+    adds them to the rollups in the same statement.
+
+    Attributes:
+        station (ForeignKey): Station of the sensor.
+        sensor (CharField): Name of the sensor, e.g. ``cope_temperature``.
+        recorded_at (DateTimeField): Time of the sample on the device.
+        value (FloatField): The sampled value.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    station = models.ForeignKey(Station, on_delete=models.CASCADE)
+    sensor = models.CharField(max_length=50)
+    recorded_at = models.DateTimeField()
+    value = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Resent readings are only stored once
+            models.UniqueConstraint(
+                fields=["station", "sensor", "recorded_at"],
+                name="telemetry_reading_unique",
+            ),
+        ]
+        indexes = [
+            # Readings are appended in time order, so retention is a range scan
+            BrinIndex(fields=["recorded_at"], name="telemetry_reading_time_brin"),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor} at {self.station_id}: {self.value}"
+
+
+class TelemetryRollup(models.Model):
+    """
+    Aggregate of the readings of a sensor during one bucket of time, kept up to
+    date by every ingestion so that long ranges never scan the readings.
+
+    Attributes:
+        station (ForeignKey): Station of the sensor.
+        sensor (CharField): Name of the sensor.
+        resolution (CharField): Width of the bucket.
+        bucket (DateTimeField): Start of the bucket, in UTC.
+        count (IntegerField): Readings during the bucket.
+        value_sum (FloatField): Sum of their values.
+        value_min (FloatField): Lowest of their values.
+        value_max (FloatField): Highest of their values.
+    """
+
+    class Resolution(models.TextChoices):
+        MINUTE = "1m", _("1 minute")
+        HOUR = "1h", _("1 hour")
+        DAY = "1d", _("1 day")
+
+    id = models.BigAutoField(primary_key=True)
+    station = models.ForeignKey(Station, on_delete=models.CASCADE)
+    sensor = models.CharField(max_length=50)
+    resolution = models.CharField(max_length=2, choices=Resolution.choices)
+    bucket = models.DateTimeField()
+    count = models.IntegerField()
+    value_sum = models.FloatField()
+    value_min = models.FloatField()
+    value_max = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["station", "resolution", "sensor", "bucket"],
+                name="telemetry_rollup_unique",
+            ),
+        ]
+        indexes = [
+            # Retention deletes the oldest buckets of each resolution
+            models.Index(
+                fields=["resolution", "bucket"], name="telemetry_rollup_age_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.sensor} at {self.station_id}, {self.resolution} from {self.bucket}"
+        )
@@ -1,11 +1,22 @@
+from datetime import timedelta
+from urllib.parse import quote
+
 from rest_framework import serializers
 
+from django.db import transaction
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.http import RFC3986_SUBDELIMS
 from django.utils import timezone
 
 from .models import (
     Product,
     Process,
     Station,
+    StationCounter,
+    StationHourlyStats,
+    ProcessHistory,
+    ProcessArchive,
     ProcessingImages,
     MoldingFloor,
     StationOne,
@@ -14,33 +25,50 @@ from .models import (
     Quality,
     CastingSnapshot,
     RammingFloor,
+    TelemetryReading,
 )
-from .utils import generate_qr
+from .cache import CASTING_SNAPSHOTS, invalidate_collection
+from .changes import parse_cursor
+from .labels import PAGE_SIZES
+from .services import open_entry_processes
+from .tasks import render_product_qr, render_products_qr
+from .telemetry import EPOCH, record_telemetry
+
+# Stands in for the product id in the QR URL resolved once per station list
+QR_URL_PLACEHOLDER = "__product_id__"
+
+# Characters ``reverse`` leaves unquoted in URL arguments
+URL_SAFE = RFC3986_SUBDELIMS + "/~:@"
 
 
 class ProductSerializer(serializers.ModelSerializer):
     """
     Serializer for the Product model.
 
-    This serializer automatically generates a QR image for the product
-    based on its ID and name before creating it.
+    The QR image is rendered in the background once the product row is committed;
+    ``qr_status`` reports whether ``qr_image`` is ready yet.
 
     Attributes:
         model: The Product model class.
         fields: Specifies that all fields of the model should be included in serialization.
 
     Methods:
-        create: Overrides the default create method to generate a QR image for the product
-                before creating it.
+        create: Creates the product and its entry process, then queues the QR render.
     """
 
     class Meta:
         model = Product
         fields = "__all__"
+        read_only_fields = (
+            "qr_image",
+            "qr_status",
+            "current_station",
+            "current_process",
+        )
 
     def create(self, validated_data):
         """
-        Create method override to generate a QR image for the product before creating it.
+        Create the product with its entry-station process and queue its QR render.
 
         Args:
             validated_data (dict): Validated data for the product.
@@ -49,16 +77,313 @@ class ProductSerializer(serializers.ModelSerializer):
             Product: The newly created product instance.
         """
 
-        product_id = validated_data.get("product_id")
-        product_name = validated_data.get("product_name")
-        validated_data["qr_image"] = generate_qr(product_id, product_name)
-        product = super().create(validated_data)
+        with transaction.atomic():
+            product = super().create(validated_data)
+
+            # create corresponding process as well
+            open_entry_processes([product])
 
-        # create corresponding process as well
-        Process.objects.create(product=product, station_id=1, entry_time=timezone.now())
+            transaction.on_commit(lambda: render_product_qr.delay(product.pk))
         return product
 
 
+class ProductBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a single item of a bulk product registration.
+    """
+
+    class Meta:
+        model = Product
+        fields = ("product_id", "product_name")
+        extra_kwargs = {
+            # Uniqueness is checked for the whole batch with a single query
+            "product_id": {"validators": []},
+        }
+
+
+class ProductBulkCreateSerializer(serializers.Serializer):
+    """
+    Serializer to register a batch of products at once.
+
+    Every item is validated before anything is written; if any item is invalid the
+    whole batch is rejected with the errors listed per item, in request order.
+    The products and their entry-station processes are inserted with one
+    ``bulk_create`` each, in a single transaction, and their QR images are rendered
+    in the background once it commits.
+    """
+
+    products = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=1000
+    )
+
+    def validate_products(self, products):
+        items = []
+        errors = []
+        for data in products:
+            item_serializer = ProductBulkItemSerializer(data=data)
+            if item_serializer.is_valid():
+                items.append(item_serializer.validated_data)
+                errors.append({})
+            else:
+                items.append(None)
+                errors.append(item_serializer.errors)
+
+        product_ids = [item["product_id"] for item in items if item is not None]
+        existing = set(
+            Product.objects.filter(pk__in=product_ids).values_list("pk", flat=True)
+        )
+        seen = set()
+        for index, item in enumerate(items):
+            if item is None:
+                continue
+            product_id = item["product_id"]
+            if product_id in existing:
+                errors[index] = {
+                    "product_id": ["product with this product id already exists."]
+                }
+            elif product_id in seen:
+                errors[index] = {"product_id": ["Duplicate product id in batch."]}
+            seen.add(product_id)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def create(self, validated_data):
+        products = [Product(**item) for item in validated_data["products"]]
+
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            open_entry_processes(products)
+
+            product_ids = [product.pk for product in products]
+            transaction.on_commit(lambda: render_products_qr.delay(product_ids))
+        return products
+
+
+class LabelSelectionSerializer(serializers.Serializer):
+    """
+    Query parameters selecting the products to print labels for.
+    """
+
+    ids = serializers.CharField(
+        required=False, help_text="Comma separated product IDs."
+    )
+    station = serializers.IntegerField(required=False)
+
+    def validate_ids(self, ids):
+        return [product_id for product_id in ids.split(",") if product_id]
+
+    def validate(self, attrs):
+        if not attrs.get("ids") and not attrs.get("station"):
+            raise serializers.ValidationError("Provide product ids or a station.")
+        return attrs
+
+
+class LabelSheetQuerySerializer(LabelSelectionSerializer):
+    """
+    Query parameters selecting the products and layout of a label print sheet.
+    """
+
+    # Not "format", which DRF reserves for selecting the response renderer
+    kind = serializers.ChoiceField(choices=["pdf", "png"], default="pdf")
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.ChoiceField(choices=list(PAGE_SIZES), default="letter")
+    columns = serializers.IntegerField(min_value=1, max_value=10, default=3)
+    rows = serializers.IntegerField(min_value=1, max_value=20, default=8)
+
+
+class ZPLQuerySerializer(LabelSelectionSerializer):
+    """
+    Query parameters selecting the products and size of ZPL labels.
+    """
+
+    dpi = serializers.ChoiceField(choices=[203, 300, 600], default=203)
+    width = serializers.FloatField(min_value=0.5, max_value=8, default=2)
+    height = serializers.FloatField(min_value=0.5, max_value=8, default=1)
+
+
+class ScanSerializer(serializers.Serializer):
+    """
+    Product and current station resolved from a scanned QR payload.
+    """
+
+    product_id = serializers.CharField()
+    product_name = serializers.CharField()
+    process_id = serializers.IntegerField(allow_null=True)
+    station_id = serializers.IntegerField(allow_null=True)
+    station_name = serializers.CharField(allow_null=True)
+    entry_time = serializers.DateTimeField(allow_null=True)
+
+
+class StationStatsQuerySerializer(serializers.Serializer):
+    """
+    Query parameters selecting the hours of station stats, by default the last day.
+    """
+
+    # Longest range served, so that a query reads a bounded number of rows
+    MAX_RANGE = timedelta(days=31)
+
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault("until", timezone.now())
+        attrs.setdefault("since", attrs["until"] - timedelta(days=1))
+        if attrs["since"] >= attrs["until"]:
+            raise serializers.ValidationError("since must be before until.")
+        if attrs["until"] - attrs["since"] > self.MAX_RANGE:
+            raise serializers.ValidationError("Ranges are limited to 31 days.")
+        return attrs
+
+
+class TelemetryQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the telemetry of a station, by default the last hour in
+    points of a minute.
+    """
+
+    # Most points served per sensor, so that a query reads a bounded number of rows
+    MAX_POINTS = 5000
+
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    resolution = serializers.IntegerField(
+        min_value=1, default=60, help_text="Width of the points, in seconds."
+    )
+    sensor = serializers.ListField(
+        child=serializers.CharField(max_length=50), required=False
+    )
+
+    def validate(self, attrs):
+        attrs.setdefault("until", timezone.now())
+        attrs.setdefault("since", attrs["until"] - timedelta(hours=1))
+        if attrs["since"] >= attrs["until"]:
+            raise serializers.ValidationError("since must be before until.")
+        # Points start at whole multiples of the resolution
+        step = timedelta(seconds=attrs["resolution"])
+        attrs["since"] -= (attrs["since"] - EPOCH) % step
+        if (attrs["until"] - attrs["since"]) / step > self.MAX_POINTS:
+            raise serializers.ValidationError(
+                f"Ranges are limited to {self.MAX_POINTS} points, "
+                "use a coarser resolution."
+            )
+        attrs["step"] = step
+        return attrs
+
+
+class SnapshotTelemetryQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the telemetry around a casting snapshot.
+    """
+
+    minutes = serializers.IntegerField(min_value=0, max_value=24 * 60, default=10)
+
+
+class TelemetryReadingSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a single reading of a telemetry batch.
+    """
+
+    # Existence is checked for the whole batch with a single query
+    station = serializers.IntegerField()
+
+    class Meta:
+        model = TelemetryReading
+        fields = ("station", "sensor", "recorded_at", "value")
+        # Resent readings are skipped when they are stored
+        validators = []
+
+
+class TelemetryBatchSerializer(serializers.Serializer):
+    """
+    Serializer to ingest a batch of sensor readings.
+
+    If any reading is invalid the whole batch is rejected with the errors listed
+    per reading, in request order. The readings are stored and added to every
+    rollup with one query; resent readings are skipped.
+    """
+
+    readings = TelemetryReadingSerializer(many=True, allow_empty=False, max_length=5000)
+
+    def validate_readings(self, readings):
+        stations = set(
+            Station.objects.filter(
+                pk__in={reading["station"] for reading in readings}
+            ).values_list("pk", flat=True)
+        )
+        does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages[
+            "does_not_exist"
+        ]
+        errors = [
+            (
+                {}
+                if reading["station"] in stations
+                else {"station": [does_not_exist.format(pk_value=reading["station"])]}
+            )
+            for reading in readings
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return readings
+
+    def create(self, validated_data):
+        return record_telemetry(
+            [
+                (
+                    reading["station"],
+                    reading["sensor"],
+                    reading["recorded_at"],
+                    reading["value"],
+                )
+                for reading in validated_data["readings"]
+            ]
+        )
+
+
+class StationHourlyStatsSerializer(serializers.ModelSerializer):
+    dwell_mean = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StationHourlyStats
+        fields = [
+            "hour",
+            "count_in",
+            "count_out",
+            "dwell_mean",
+            "dwell_min",
+            "dwell_max",
+            "dwell_histogram",
+        ]
+
+    def get_dwell_mean(self, obj):
+        dwell_count = sum(obj.dwell_histogram)
+        return obj.dwell_sum / dwell_count if dwell_count else None
+
+
+class ProductMoveSerializer(serializers.Serializer):
+    """
+    Serializer for moving a product to another station.
+    """
+
+    is_checked = serializers.BooleanField(default=False)
+    move_to = serializers.PrimaryKeyRelatedField(queryset=Station.objects.all())
+    idempotency_key = serializers.CharField(
+        max_length=100, required=False, allow_blank=True
+    )
+
+
+class ProductBulkMoveSerializer(serializers.Serializer):
+    """
+    Serializer for moving many products to the same station.
+    """
+
+    product_ids = serializers.ListField(
+        child=serializers.CharField(max_length=50), allow_empty=False, max_length=1000
+    )
+    move_to = serializers.PrimaryKeyRelatedField(queryset=Station.objects.all())
+
+
 class ProcessSerializer(serializers.ModelSerializer):
     """
     Serializer for the Process model.
@@ -74,8 +399,71 @@ class ProcessSerializer(serializers.ModelSerializer):
         model = Process
         fields = "__all__"
 
+    def validate(self, attrs):
+        product = attrs.get("product", getattr(self.instance, "product", None))
+        is_active = attrs.get("is_active", getattr(self.instance, "is_active", True))
+        if product is not None and is_active:
+            active = Process.objects.filter(product=product, is_active=True)
+            if self.instance is not None:
+                active = active.exclude(pk=self.instance.pk)
+            if active.exists():
+                raise serializers.ValidationError(
+                    "Product already has an active process; move it instead."
+                )
+        return attrs
+
+
+class ProcessHistorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProcessHistory
+        fields = "__all__"
+
+
+class ProcessArchiveSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProcessArchive
+        fields = ["id", "month", "rows", "last_exit_time", "archived_at"]
+
+
+class ProcessArchiveQuerySerializer(serializers.Serializer):
+    """
+    Query parameters filtering the processes read from an archive.
+    """
+
+    product = serializers.CharField(required=False)
+    station = serializers.IntegerField(required=False)
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of a read of the change feed.
+    """
+
+    since = serializers.CharField(required=False)
+    resource = serializers.ListField(
+        child=serializers.ChoiceField(
+            choices=["product", "process", "casting_snapshot"]
+        ),
+        required=False,
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=5000, default=500)
+
+    def validate_since(self, since):
+        if parse_cursor(since) is None:
+            raise serializers.ValidationError("Not a change feed cursor.")
+        return since
+
 
 class StationSerialzier(serializers.ModelSerializer):
+    """
+    Serializer for a station with the products currently at it.
+
+    ``number_of_products`` is the station's work in progress, read from its
+    counter. The counter and the ``active_processes`` are joined and prefetched
+    by ``StationViewSet``, so a list of stations costs a fixed number of queries;
+    stations loaded otherwise fall back to a query each.
+    """
+
     number_of_products = serializers.SerializerMethodField()
     products = serializers.SerializerMethodField()
 
@@ -84,24 +472,34 @@ class StationSerialzier(serializers.ModelSerializer):
         fields = "__all__"
 
     def get_number_of_products(self, obj):
-        return Product.objects.filter(process__station=obj).count()
+        try:
+            return obj.counter.wip
+        except StationCounter.DoesNotExist:
+            return 0
+
+    @cached_property
+    def qr_url_template(self):
+        # Resolved once, not per product, as the serializer is shared by the list
+        return self.context["request"].build_absolute_uri(
+            reverse("product-qr", kwargs={"pk": QR_URL_PLACEHOLDER, "kind": "png"})
+        )
 
     def get_products(self, obj):
-        queryset = Process.objects.filter(station=obj, is_active=True).select_related(
-            "product"
-        )
+        processes = getattr(obj, "active_processes", None)
+        if processes is None:
+            processes = obj.process_set.filter(is_active=True).select_related("product")
 
         return [
             {
-                "id": process.product.product_id,
+                "id": process.product_id,
                 "product_name": process.product.product_name,
                 "entry_time": process.entry_time,
                 "exit_time": process.exit_time,
-                "qr_image": self.context.get("request").build_absolute_uri(
-                    process.product.qr_image.url
+                "qr_image": self.qr_url_template.replace(
+                    QR_URL_PLACEHOLDER, quote(process.product_id, safe=URL_SAFE)
                 ),
             }
-            for process in queryset
+            for process in processes
         ]
 
 
@@ -153,6 +551,44 @@ class RammingFloorSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+# Station sections of a casting snapshot, by field name
+SECTIONS = {
+    "station_one": StationOne,
+    "ramming_floor": RammingFloor,
+    "molding_floor": MoldingFloor,
+    "pour": Pour,
+    "shakeout": Shakeout,
+    "quality": Quality,
+}
+
+
+def update_changed_fields(instance, data):
+    """
+    Set ``data`` on a model instance and save only the fields it changes.
+
+    Related objects are compared by primary key, without loading the current ones.
+
+    Returns:
+        list: Names of the changed fields.
+    """
+    changed = []
+    for attr, value in data.items():
+        field = instance._meta.get_field(attr)
+        if field.is_relation:
+            current, value_key = getattr(instance, field.attname), getattr(
+                value, "pk", value
+            )
+        else:
+            current, value_key = getattr(instance, attr), value
+        if current != value_key:
+            changed.append(attr)
+    for attr in changed:
+        setattr(instance, attr, data[attr])
+    if changed:
+        instance.save(update_fields=changed)
+    return changed
+
+
 class CastingSnapshotSerializer(serializers.ModelSerializer):
     """
     Serializer for the CastingSnapshot model, with nested station-specific serializers.
@@ -177,6 +613,7 @@ class CastingSnapshotSerializer(serializers.ModelSerializer):
             "pour",
             "shakeout",
             "quality",
+            "recorded_at",
         ]
 
     def has_significant_value(self, data):
@@ -201,136 +638,151 @@ class CastingSnapshotSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """
-        Custom create method to handle nested writes for station-specific data.
+        Create the snapshot with its station sections, in one transaction.
+
+        The sections are inserted first, so the snapshot is inserted once with
+        all of them linked: one query per section given, plus one.
         """
-        station_one_data = validated_data.pop("station_one", None)
-        molding_floor_data = validated_data.pop("molding_floor", None)
-        pour_data = validated_data.pop("pour", None)
-        shakeout_data = validated_data.pop("shakeout", None)
-        quality_data = validated_data.pop("quality", None)
-        ramming_floor_data = validated_data.pop("ramming_floor", None)
-
-        # Create the CastingSnapshot first
-        snapshot = CastingSnapshot.objects.create(**validated_data)
-
-        # If station_one data was provided, create a StationOne record and link it
-        if self.has_significant_value(station_one_data):
-            station_one_obj = StationOne.objects.create(**station_one_data)
-            snapshot.station_one = station_one_obj
-            snapshot.save()
-
-        # If molding_floor data was provided, create a MoldingFloor record and link it
-        if self.has_significant_value(molding_floor_data):
-            molding_floor_obj = MoldingFloor.objects.create(**molding_floor_data)
-            snapshot.molding_floor = molding_floor_obj
-            snapshot.save()
-
-        if self.has_significant_value(ramming_floor_data):
-            ramming_floor_obj = RammingFloor.objects.create(**ramming_floor_data)
-            snapshot.ramming_floor = ramming_floor_obj
-            snapshot.save()
-
-        # If pour data was provided
-        if self.has_significant_value(pour_data):
-            pour_obj = Pour.objects.create(**pour_data)
-            snapshot.pour = pour_obj
-            snapshot.save()
-
-        # If shakeout data was provided
-        if self.has_significant_value(shakeout_data):
-            shakeout_obj = Shakeout.objects.create(**shakeout_data)
-            snapshot.shakeout = shakeout_obj
-            snapshot.save()
-
-        # If quality data was provided
-        if self.has_significant_value(quality_data):
-            quality_obj = Quality.objects.create(**quality_data)
-            snapshot.quality = quality_obj
-            snapshot.save()
-
-        return snapshot
+        sections = {name: validated_data.pop(name, None) for name in SECTIONS}
+
+        with transaction.atomic():
+            for name, data in sections.items():
+                if self.has_significant_value(data):
+                    validated_data[name] = SECTIONS[name].objects.create(**data)
+            return CastingSnapshot.objects.create(**validated_data)
 
     def update(self, instance, validated_data):
         """
-        Custom update method for nested writes.
-        """
-        station_one_data = validated_data.pop("station_one", None)
-        molding_floor_data = validated_data.pop("molding_floor", None)
-        pour_data = validated_data.pop("pour", None)
-        shakeout_data = validated_data.pop("shakeout", None)
-        quality_data = validated_data.pop("quality", None)
-        ramming_floor_data = validated_data.pop("ramming_floor", None)
-
-        # Update the CastingSnapshot's own fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-
-        # Update or create StationOne
-        if station_one_data is not None:
-            if instance.station_one:
-                # Update existing StationOne
-                for attr, value in station_one_data.items():
-                    setattr(instance.station_one, attr, value)
-                instance.station_one.save()
-            else:
-                station_one_obj = StationOne.objects.create(**station_one_data)
-                instance.station_one = station_one_obj
-                instance.save()
-
-        # Update or create MoldingFloor
-        if molding_floor_data is not None:
-            if instance.molding_floor:
-                for attr, value in molding_floor_data.items():
-                    setattr(instance.molding_floor, attr, value)
-                instance.molding_floor.save()
-            else:
-                molding_floor_obj = MoldingFloor.objects.create(**molding_floor_data)
-                instance.molding_floor = molding_floor_obj
-                instance.save()
-
-        # Update or create MoldingFloor
-        if ramming_floor_data is not None:
-            if instance.ramming_floor:
-                for attr, value in ramming_floor_data.items():
-                    setattr(instance.ramming_floor, attr, value)
-                instance.ramming_floor.save()
-            else:
-                ramming_floor_obj = RammingFloor.objects.create(**ramming_floor_data)
-                instance.ramming_floor = ramming_floor_obj
-                instance.save()
-
-        # Update or create Pour
-        if pour_data is not None:
-            if instance.pour:
-                for attr, value in pour_data.items():
-                    setattr(instance.pour, attr, value)
-                instance.pour.save()
-            else:
-                pour_obj = Pour.objects.create(**pour_data)
-                instance.pour = pour_obj
-                instance.save()
-
-        # Update or create Shakeout
-        if shakeout_data is not None:
-            if instance.shakeout:
-                for attr, value in shakeout_data.items():
-                    setattr(instance.shakeout, attr, value)
-                instance.shakeout.save()
-            else:
-                shakeout_obj = Shakeout.objects.create(**shakeout_data)
-                instance.shakeout = shakeout_obj
-                instance.save()
-
-        # Update or create Quality
-        if quality_data is not None:
-            if instance.quality:
-                for attr, value in quality_data.items():
-                    setattr(instance.quality, attr, value)
-                instance.quality.save()
-            else:
-                quality_obj = Quality.objects.create(**quality_data)
-                instance.quality = quality_obj
-                instance.save()
+        Update the snapshot and its station sections, in one transaction.
 
+        Given sections the snapshot does not have yet are created and linked;
+        only the columns whose values change are written, and rows without any
+        change are not written at all.
+        """
+        sections = {name: validated_data.pop(name, None) for name in SECTIONS}
+
+        with transaction.atomic():
+            for name, data in sections.items():
+                if data is None:
+                    continue
+                section = getattr(instance, name)
+                if section is None:
+                    validated_data[name] = SECTIONS[name].objects.create(**data)
+                else:
+                    update_changed_fields(section, data)
+            update_changed_fields(instance, validated_data)
         return instance
+
+
+class CastingSnapshotBulkItemSerializer(CastingSnapshotSerializer):
+    """
+    Serializer for a single item of a bulk snapshot ingestion.
+    """
+
+    # Existence is checked for the whole batch with one query per model
+    product = serializers.CharField(max_length=50)
+    station = serializers.IntegerField()
+
+    def validate(self, attrs):
+        # Sections without any value are not inserted, as by a single create
+        return {
+            attr: value
+            for attr, value in attrs.items()
+            if attr not in SECTIONS or self.has_significant_value(value)
+        }
+
+
+class CastingSnapshotBulkCreateSerializer(serializers.Serializer):
+    """
+    Serializer to ingest a batch of casting snapshots at once.
+
+    Items are independent: the valid ones are stored even when others are not,
+    and every item gets its result, in request order. Every section model is
+    inserted with one ``bulk_create``, then the snapshots linking them with one
+    more, in a single transaction.
+    """
+
+    snapshots = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=1000
+    )
+
+    def validate_snapshots(self, snapshots):
+        # One serializer validates every item, as a ``many=True`` one would, so its
+        # fields are built once rather than once per item
+        item_serializer = CastingSnapshotBulkItemSerializer()
+        items = []
+        errors = []
+        for data in snapshots:
+            try:
+                items.append(item_serializer.run_validation(data))
+                errors.append({})
+            except serializers.ValidationError as exc:
+                items.append(None)
+                errors.append(exc.detail)
+
+        valid = [item for item in items if item is not None]
+        existing = {
+            "product": set(
+                Product.objects.filter(
+                    pk__in={item["product"] for item in valid}
+                ).values_list("pk", flat=True)
+            ),
+            "station": set(
+                Station.objects.filter(
+                    pk__in={item["station"] for item in valid}
+                ).values_list("pk", flat=True)
+            ),
+        }
+        does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages[
+            "does_not_exist"
+        ]
+        for index, item in enumerate(items):
+            if item is None:
+                continue
+            for attr, pks in existing.items():
+                if item[attr] not in pks:
+                    errors[index][attr] = [does_not_exist.format(pk_value=item[attr])]
+            if errors[index]:
+                items[index] = None
+        return list(zip(items, errors))
+
+    def create(self, validated_data):
+        """
+        Insert the valid snapshots of the batch.
+
+        Returns:
+            list: ``(snapshot, errors)`` of every item, in request order, with
+            ``snapshot`` None if the item is invalid.
+        """
+        valid = [item for item, _ in validated_data["snapshots"] if item is not None]
+
+        with transaction.atomic():
+            for name, model in SECTIONS.items():
+                given = [item for item in valid if name in item]
+                created = model.objects.bulk_create(
+                    [model(**item[name]) for item in given]
+                )
+                for item, section in zip(given, created):
+                    item[name] = section
+            snapshots = CastingSnapshot.objects.bulk_create(
+                [
+                    CastingSnapshot(
+                        product_id=item["product"],
+                        station_id=item["station"],
+                        **{
+                            attr: value
+                            for attr, value in item.items()
+                            if attr not in ("product", "station")
+                        },
+                    )
+                    for item in valid
+                ]
+            )
+            # Bulk inserts send no signals
+            invalidate_collection(CASTING_SNAPSHOTS)
+
+        created = iter(snapshots)
+        return [
+            (None if item is None else next(created), errors)
+            for item, errors in validated_data["snapshots"]
+        ]
@@ -0,0 +1,482 @@
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .broker import board_broker
+from .cache import bump_board_version, invalidate_board
+from .counters import record_station_moves
+from .models import Process, Product, ScanEvent, Station
+from .stats import record_process_flows
+
+# Station every new product starts at
+ENTRY_STATION_ID = 1
+
+# Advisory lock held while scan events are applied, so that concurrent appliers
+# cannot reorder the moves of a product
+SCAN_APPLY_LOCK_ID = 0x5CA9
+
+# Products whose current_station/current_process pointers disagree with their
+# active Process, with the values they should have.
+DRIFTED_POINTERS_SQL = """
+    SELECT p.product_id, active.id, active.station_id
+    FROM product_product p
+    LEFT JOIN product_process active
+        ON active.product_id = p.product_id AND active.is_active
+    WHERE (p.current_process_id IS DISTINCT FROM active.id
+           OR p.current_station_id IS DISTINCT FROM active.station_id)
+"""
+
+# Active processes that are not the latest active one of their product, with the
+# entry time of the next active one as their exit time. Only the active rows are
+# read, through the partial index on them.
+DUPLICATE_ACTIVE_PROCESSES_SQL = """
+    SELECT id, next_entry_time
+    FROM (
+        SELECT
+            id,
+            row_number() OVER (
+                PARTITION BY product_id ORDER BY entry_time DESC NULLS LAST, id DESC
+            ) AS recency,
+            lead(entry_time) OVER (
+                PARTITION BY product_id ORDER BY entry_time ASC NULLS FIRST, id ASC
+            ) AS next_entry_time
+        FROM product_process
+        WHERE is_active
+    ) ranked
+    WHERE recency > 1
+"""
+
+
+def entered_delta(station_id, product_id, product_name, entry_time):
+    return {
+        "event": "entered",
+        "station": station_id,
+        "product_id": product_id,
+        "product_name": product_name,
+        "entry_time": entry_time,
+    }
+
+
+def left_delta(station_id, product_id):
+    return {"event": "left", "station": station_id, "product_id": product_id}
+
+
+def publish_board_deltas(deltas):
+    """
+    Invalidate the cached station board and publish its deltas once the current
+    transaction commits.
+    """
+
+    def publish():
+        bump_board_version()
+        board_broker.publish(deltas)
+
+    transaction.on_commit(publish)
+
+
+class MoveError(Exception):
+    """
+    Base class of the reasons a product move is refused.
+    """
+
+
+class AlreadyAtStation(MoveError):
+    def __init__(self):
+        super().__init__("Product is already in the specified station.")
+
+
+class IdempotencyConflict(MoveError):
+    def __init__(self):
+        super().__init__("Idempotency key was already used for a different move.")
+
+
+def move_product(product_id, station_id, idempotency_key=None):
+    """
+    Move a product to a station: close its active process and open a new one.
+
+    The move is a single transaction. The product row is locked first, so
+    concurrent moves of the same product are applied one after the other and can
+    never leave two active processes; the active process is then fetched through
+    its partial index and locked as well.
+
+    A retried move with the same ``idempotency_key`` is not applied twice; the
+    process opened by the first attempt is returned instead.
+
+    Args:
+        product_id (str): Primary key of the product.
+        station_id (int): Primary key of the target station.
+        idempotency_key (str): Optional client supplied key of the move.
+
+    Returns:
+        tuple: ``(process, created)``, the active process after the move and
+        whether this call opened it.
+
+    Raises:
+        Product.DoesNotExist: If the product does not exist.
+        AlreadyAtStation: If the product is already at the target station.
+        IdempotencyConflict: If the key was used for another product or station.
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+
+        if idempotency_key:
+            previous = Process.objects.filter(idempotency_key=idempotency_key).first()
+            if previous is not None:
+                return replayed_move(previous, product.pk, station_id), False
+
+        current_process = (
+            Process.objects.select_for_update()
+            .filter(product=product, is_active=True)
+            .first()
+        )
+        if current_process is not None and current_process.station_id == station_id:
+            raise AlreadyAtStation()
+
+        now = timezone.now()
+        closed = []
+        try:
+            # A concurrent first use of the key on another product is only caught
+            # by its unique index, so closing and opening are undone together
+            with transaction.atomic():
+                if current_process is not None:
+                    current_process.exit_time = now
+                    current_process.is_active = False
+                    current_process.save(update_fields=["exit_time", "is_active"])
+                    closed.append(
+                        (current_process.station_id, current_process.entry_time, now)
+                    )
+
+                process = Process.objects.create(
+                    product=product,
+                    station_id=station_id,
+                    entry_time=now,
+                    idempotency_key=idempotency_key or None,
+                )
+        except IntegrityError:
+            previous = idempotency_key and (
+                Process.objects.filter(idempotency_key=idempotency_key).first()
+            )
+            if not previous:
+                raise
+            return replayed_move(previous, product.pk, station_id), False
+        product.current_station_id = station_id
+        product.current_process = process
+        product.save(update_fields=["current_station", "current_process"])
+        record_process_flows(opened=[(station_id, now)], closed=closed)
+        record_station_moves(
+            entered=[station_id], left=[station for station, _, _ in closed]
+        )
+
+        deltas = [entered_delta(station_id, product.pk, product.product_name, now)]
+        if current_process is not None:
+            deltas.insert(0, left_delta(current_process.station_id, product.pk))
+        publish_board_deltas(deltas)
+    return process, True
+
+
+def replayed_move(process, product_id, station_id):
+    """
+    Return the process opened by an earlier move with the same idempotency key.
+
+    Raises:
+        IdempotencyConflict: If that move was of another product or station.
+    """
+    if process.product_id != product_id or process.station_id != station_id:
+        raise IdempotencyConflict()
+    return process
+
+
+class MoveOutcome:
+    """
+    Per-product results of a bulk move.
+    """
+
+    MOVED = "moved"
+    ALREADY_AT_STATION = "already_at_station"
+    NOT_FOUND = "not_found"
+
+
+def move_products(product_ids, station_id):
+    """
+    Move many products to a station at once, e.g. a whole flask at shakeout.
+
+    All the current processes are closed with one ``UPDATE`` and the new ones are
+    opened with one ``bulk_create``, in a single transaction. Products are locked
+    in primary key order, like ``move_product`` locks them, so bulk and single
+    moves of the same products are serialized without deadlocks.
+
+    Args:
+        product_ids (list): Primary keys of the products to move.
+        station_id (int): Primary key of the target station.
+
+    Returns:
+        dict: ``MoveOutcome`` of every requested product, by product ID.
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+
+    with transaction.atomic():
+        found = dict(
+            Product.objects.select_for_update()
+            .filter(pk__in=product_ids)
+            .order_by("pk")
+            .values_list("pk", "product_name")
+        )
+        current = {
+            product_id: (current_station_id, entry_time)
+            for product_id, current_station_id, entry_time in Process.objects.filter(
+                product_id__in=list(found), is_active=True
+            ).values_list("product_id", "station_id", "entry_time")
+        }
+
+        outcomes = {}
+        to_move = []
+        for product_id in product_ids:
+            if product_id not in found:
+                outcomes[product_id] = MoveOutcome.NOT_FOUND
+            elif current.get(product_id, (None,))[0] == station_id:
+                outcomes[product_id] = MoveOutcome.ALREADY_AT_STATION
+            else:
+                outcomes[product_id] = MoveOutcome.MOVED
+                to_move.append(product_id)
+
+        if to_move:
+            now = timezone.now()
+            Process.objects.filter(product_id__in=to_move, is_active=True).update(
+                exit_time=now, is_active=False
+            )
+            processes = Process.objects.bulk_create(
+                [
+                    Process(
+                        product_id=product_id, station_id=station_id, entry_time=now
+                    )
+                    for product_id in to_move
+                ]
+            )
+            Product.objects.bulk_update(
+                [
+                    Product(
+                        pk=process.product_id,
+                        current_station_id=station_id,
+                        current_process=process,
+                    )
+                    for process in processes
+                ],
+                ["current_station", "current_process"],
+            )
+            left = [product_id for product_id in to_move if product_id in current]
+            record_process_flows(
+                opened=[(station_id, now)] * len(to_move),
+                closed=[(*current[product_id], now) for product_id in left],
+            )
+            record_station_moves(
+                entered=[station_id] * len(to_move),
+                left=[current[product_id][0] for product_id in left],
+            )
+            publish_board_deltas(
+                [left_delta(current[product_id][0], product_id) for product_id in left]
+                + [
+                    entered_delta(station_id, product_id, found[product_id], now)
+                    for product_id in to_move
+                ]
+            )
+    return outcomes
+
+
+def open_entry_processes(products):
+    """
+    Open the entry-station process of newly created products.
+
+    Must run in the transaction that created the products.
+
+    Args:
+        products (list): The new Product instances.
+    """
+    now = timezone.now()
+    processes = Process.objects.bulk_create(
+        [
+            Process(product=product, station_id=ENTRY_STATION_ID, entry_time=now)
+            for product in products
+        ]
+    )
+    for product, process in zip(products, processes):
+        product.current_station_id = ENTRY_STATION_ID
+        product.current_process = process
+    Product.objects.bulk_update(products, ["current_station", "current_process"])
+    record_process_flows(opened=[(ENTRY_STATION_ID, now)] * len(products))
+    record_station_moves(entered=[ENTRY_STATION_ID] * len(products))
+    publish_board_deltas(
+        [
+            entered_delta(ENTRY_STATION_ID, product.pk, product.product_name, now)
+            for product in products
+        ]
+    )
+
+
+def reconcile_current_pointers(product_ids=None, dry_run=False):
+    """
+    Repair ``Product.current_station``/``current_process`` from the active processes.
+
+    Drift is found and fixed with set-based SQL, so this is cheap enough to run
+    after writes that bypass the move functions (admin and raw Process edits) as
+    well as periodically over the whole table.
+
+    Args:
+        product_ids (list): Only reconcile these products; all of them when None.
+        dry_run (bool): Only count the drifted products.
+
+    Returns:
+        int: Number of products whose pointers were (or would be) repaired.
+    """
+    sql = DRIFTED_POINTERS_SQL
+    params = []
+    if product_ids is not None:
+        sql += " AND p.product_id = ANY(%s)"
+        params.append(list(product_ids))
+
+    with connection.cursor() as cursor:
+        if dry_run:
+            cursor.execute(f"SELECT count(*) FROM ({sql}) drifted", params)
+            return cursor.fetchone()[0]
+
+        cursor.execute(
+            f"""
+            UPDATE product_product p
+            SET current_process_id = drifted.process_id,
+                current_station_id = drifted.station_id
+            FROM ({sql}) AS drifted (product_id, process_id, station_id)
+            WHERE p.product_id = drifted.product_id
+            """,
+            params,
+        )
+        repaired = cursor.rowcount
+    if repaired:
+        # Boards cannot be told what changed, so screens reload them
+        invalidate_board()
+        transaction.on_commit(board_broker.publish_resync)
+    return repaired
+
+
+def close_duplicate_active_processes(dry_run=False):
+    """
+    Leave every product with at most one active process.
+
+    Of several active processes, the one entered last is kept; the others are
+    closed as of the entry into the next one. This runs as one set-based
+    ``UPDATE`` over the active rows only, followed by a reconcile of the current
+    station pointers, so it stays fast on a history of millions of processes.
+
+    Args:
+        dry_run (bool): Only count the processes that would be closed.
+
+    Returns:
+        int: Number of processes that were (or would be) closed.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if dry_run:
+            cursor.execute(
+                f"SELECT count(*) FROM ({DUPLICATE_ACTIVE_PROCESSES_SQL}) duplicate"
+            )
+            return cursor.fetchone()[0]
+
+        cursor.execute(f"""
+            UPDATE product_process pr
+            SET is_active = FALSE,
+                exit_time = COALESCE(pr.exit_time, duplicate.next_entry_time, now())
+            FROM ({DUPLICATE_ACTIVE_PROCESSES_SQL}) duplicate
+            WHERE pr.id = duplicate.id
+            RETURNING pr.station_id
+            """)
+        closed = [station_id for (station_id,) in cursor.fetchall()]
+        if closed:
+            record_station_moves(left=closed)
+            invalidate_board()
+            reconcile_current_pointers()
+    return len(closed)
+
+
+# Status of an applied scan event, by outcome of its move
+SCAN_EVENT_STATUSES = {
+    MoveOutcome.MOVED: ScanEvent.Status.APPLIED,
+    MoveOutcome.ALREADY_AT_STATION: ScanEvent.Status.SKIPPED,
+    MoveOutcome.NOT_FOUND: ScanEvent.Status.FAILED,
+}
+
+
+def store_scan_events(events):
+    """
+    Durably queue scan events, in the given order.
+
+    Events with an unknown station are refused. Events whose key was queued
+    before count as queued, so a device resending a scan whose acknowledgement
+    it missed is acknowledged without queueing the scan twice.
+
+    Args:
+        events (list): Unsaved ScanEvent instances.
+
+    Returns:
+        list: The error of every event, None for the queued ones.
+    """
+    station_ids = {event.station_id for event in events}
+    known = set(Station.objects.filter(pk__in=station_ids).values_list("pk", flat=True))
+    errors = [
+        None if event.station_id in known else "Unknown station." for event in events
+    ]
+    ScanEvent.objects.bulk_create(
+        [event for event, error in zip(events, errors) if error is None],
+        ignore_conflicts=True,
+    )
+    return errors
+
+
+def apply_scan_events(batch_size=500):
+    """
+    Apply the oldest pending scan events as moves, in one transaction.
+
+    Scans of different products do not affect each other, so only the order of
+    the scans of each product has to be kept. The batch is split into waves,
+    where a product's n-th scan in the batch goes into wave n, and every wave is
+    applied with one ``move_products`` call per station. A batch therefore costs
+    a handful of statements however many scans it holds, while the scans of each
+    product, and of each station, are applied in arrival order.
+
+    Args:
+        batch_size (int): Maximum number of scan events to apply.
+
+    Returns:
+        int: Number of scan events applied.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SCAN_APPLY_LOCK_ID])
+        pending = ScanEvent.objects.filter(status=ScanEvent.Status.PENDING)
+        events = list(pending.order_by("id")[:batch_size])
+
+        waves = []
+        seen = {}
+        for event in events:
+            wave = seen.get(event.product_id, 0)
+            seen[event.product_id] = wave + 1
+            if wave == len(waves):
+                waves.append({})
+            waves[wave].setdefault(event.station_id, []).append(event)
+
+        # Every product of the batch is locked up front in primary key order, as
+        # each move_products call would only lock its own slice of them, and
+        # slices taken one after the other could deadlock with concurrent moves
+        list(
+            Product.objects.select_for_update()
+            .filter(pk__in={event.product_id for event in events})
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        now = timezone.now()
+        for wave in waves:
+            for station_id, station_events in wave.items():
+                outcomes = move_products(
+                    [event.product_id for event in station_events], station_id
+                )
+                for event in station_events:
+                    event.status = SCAN_EVENT_STATUSES[outcomes[event.product_id]]
+                    event.applied_at = now
+        ScanEvent.objects.bulk_update(events, ["status", "applied_at"])
+    return len(events)
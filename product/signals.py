@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import BOARD, CASTING_SNAPSHOTS, invalidate_collection
+from .models import (
+    CastingSnapshot,
+    MoldingFloor,
+    Pour,
+    Process,
+    Product,
+    Quality,
+    RammingFloor,
+    Shakeout,
+    Station,
+    StationCounter,
+    StationOne,
+)
+
+# Collections whose cached payloads and ETags depend on each model
+COLLECTIONS = {
+    Process: BOARD,
+    Product: BOARD,
+    Station: BOARD,
+    CastingSnapshot: CASTING_SNAPSHOTS,
+    StationOne: CASTING_SNAPSHOTS,
+    RammingFloor: CASTING_SNAPSHOTS,
+    MoldingFloor: CASTING_SNAPSHOTS,
+    Pour: CASTING_SNAPSHOTS,
+    Shakeout: CASTING_SNAPSHOTS,
+    Quality: CASTING_SNAPSHOTS,
+}
+
+
+@receiver(post_save, sender=Station)
+def create_station_counter(sender, instance, created, **kwargs):
+    if created:
+        StationCounter.objects.get_or_create(station=instance)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_collection_on_change(sender, **kwargs):
+    # Bulk writes send no signals; the services invalidate the board themselves
+    if sender in COLLECTIONS:
+        invalidate_collection(COLLECTIONS[sender])
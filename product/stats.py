@@ -0,0 +1,267 @@
+import bisect
+import datetime
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import ProcessArchive
+
+# Upper bounds in seconds of the dwell time histogram buckets, from a minute to
+# a week; a last bucket holds everything longer
+DWELL_HISTOGRAM_EDGES = [
+    60,
+    5 * 60,
+    15 * 60,
+    30 * 60,
+    3600,
+    2 * 3600,
+    4 * 3600,
+    8 * 3600,
+    24 * 3600,
+    3 * 24 * 3600,
+    7 * 24 * 3600,
+]
+
+UPSERT_STATS_SQL = """
+    INSERT INTO product_stationhourlystats AS s (
+        station_id, hour, count_in, count_out,
+        dwell_sum, dwell_min, dwell_max, dwell_histogram
+    )
+    VALUES {values}
+    ON CONFLICT (station_id, hour) DO UPDATE SET
+        count_in = s.count_in + EXCLUDED.count_in,
+        count_out = s.count_out + EXCLUDED.count_out,
+        dwell_sum = s.dwell_sum + EXCLUDED.dwell_sum,
+        dwell_min = LEAST(s.dwell_min, EXCLUDED.dwell_min),
+        dwell_max = GREATEST(s.dwell_max, EXCLUDED.dwell_max),
+        dwell_histogram = ARRAY(
+            SELECT old + new
+            FROM unnest(s.dwell_histogram, EXCLUDED.dwell_histogram)
+                WITH ORDINALITY AS buckets (old, new, position)
+            ORDER BY position
+        )
+"""
+
+# Hourly stats computed from the raw process rows, hot and historical, for the
+# hours from %(since)s
+RAW_STATS_SQL = """
+    WITH processes AS (
+        SELECT station_id, entry_time, exit_time FROM product_process
+        UNION ALL
+        SELECT station_id, entry_time, exit_time FROM product_processhistory
+    ),
+    flows AS (
+        SELECT station_id, date_trunc('hour', entry_time, 'UTC') AS hour,
+               1 AS count_in, 0 AS count_out, NULL::float AS dwell
+        FROM processes
+        WHERE entry_time >= %(since)s
+        UNION ALL
+        SELECT station_id, date_trunc('hour', exit_time, 'UTC'),
+               0, 1, extract(epoch FROM exit_time - entry_time)::float
+        FROM processes
+        WHERE exit_time >= %(since)s
+    )
+    SELECT station_id, hour, sum(count_in)::int AS count_in,
+           sum(count_out)::int AS count_out, coalesce(sum(dwell), 0) AS dwell_sum,
+           min(dwell) AS dwell_min, max(dwell) AS dwell_max,
+           ARRAY[{histogram}] AS dwell_histogram
+    FROM flows
+    GROUP BY station_id, hour
+"""
+
+# Hours whose stored stats differ from the raw process rows
+DRIFTED_STATS_SQL = """
+    SELECT coalesce(raw.station_id, stored.station_id),
+           coalesce(raw.hour, stored.hour)
+    FROM ({raw}) raw
+    FULL OUTER JOIN (
+        SELECT * FROM product_stationhourlystats WHERE hour >= %(since)s
+    ) stored ON stored.station_id = raw.station_id AND stored.hour = raw.hour
+    WHERE raw.count_in IS DISTINCT FROM stored.count_in
+        OR raw.count_out IS DISTINCT FROM stored.count_out
+        OR abs(raw.dwell_sum - stored.dwell_sum) > 0.001
+        OR abs(raw.dwell_min - stored.dwell_min) > 0.001
+        OR abs(raw.dwell_max - stored.dwell_max) > 0.001
+        OR (raw.dwell_min IS NULL) <> (stored.dwell_min IS NULL)
+        OR raw.dwell_histogram IS DISTINCT FROM stored.dwell_histogram
+    ORDER BY 2, 1
+"""
+
+# Start of the range when no ``since`` is given
+BEGINNING = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def hour_bucket(moment):
+    """
+    Return the start of the UTC hour ``moment`` falls in.
+    """
+    return moment.astimezone(datetime.timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+
+
+def raw_history_start(since=None):
+    """
+    Return the first hour from ``since`` on whose process rows are all still in
+    the database, i.e. after the last exit of any archived process.
+    """
+    since = hour_bucket(since) if since else BEGINNING
+    archived = ProcessArchive.objects.aggregate(until=Max("last_exit_time"))["until"]
+    if archived is not None:
+        since = max(since, hour_bucket(archived) + datetime.timedelta(hours=1))
+    return since
+
+
+def dwell_bucket(seconds):
+    """
+    Return the index of the histogram bucket of a dwell time.
+    """
+    return bisect.bisect_right(DWELL_HISTOGRAM_EDGES, seconds)
+
+
+def record_process_flows(opened=(), closed=()):
+    """
+    Add opened and closed processes to the hourly station stats.
+
+    Must run in the transaction that opens or closes the processes. All the
+    touched hours are updated with one upsert, locking them in a fixed order so
+    that concurrent moves cannot deadlock on them.
+
+    Args:
+        opened (list): ``(station_id, entry_time)`` of every opened process.
+        closed (list): ``(station_id, entry_time, exit_time)`` of every closed
+            process; ``entry_time`` may be None.
+    """
+    deltas = defaultdict(
+        lambda: [0, 0, 0.0, None, None, [0] * (len(DWELL_HISTOGRAM_EDGES) + 1)]
+    )
+    for station_id, entry_time in opened:
+        if entry_time is not None:
+            deltas[station_id, hour_bucket(entry_time)][0] += 1
+    for station_id, entry_time, exit_time in closed:
+        delta = deltas[station_id, hour_bucket(exit_time)]
+        delta[1] += 1
+        if entry_time is None:
+            continue
+        dwell = (exit_time - entry_time).total_seconds()
+        delta[2] += dwell
+        delta[3] = dwell if delta[3] is None else min(delta[3], dwell)
+        delta[4] = dwell if delta[4] is None else max(delta[4], dwell)
+        delta[5][dwell_bucket(dwell)] += 1
+    if not deltas:
+        return
+
+    rows = sorted(deltas.items())
+    values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s::integer[])"] * len(rows))
+    params = [value for key, delta in rows for value in (*key, *delta)]
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_STATS_SQL.format(values=values), params)
+
+
+def raw_stats_sql():
+    histogram = ", ".join(
+        f"(count(*) FILTER (WHERE width_bucket(dwell, %(edges)s) = {bucket}))::int"
+        for bucket in range(len(DWELL_HISTOGRAM_EDGES) + 1)
+    )
+    return RAW_STATS_SQL.format(histogram=histogram)
+
+
+def rebuild_station_stats(since=None):
+    """
+    Recompute the hourly station stats from the raw process rows.
+
+    The stats table is locked while it is rebuilt, so moves committed during the
+    rebuild are neither lost nor counted twice. Hours of archived history are
+    kept as they are.
+
+    Args:
+        since (datetime): Only rebuild the hours from this one on.
+
+    Returns:
+        int: Number of hours rebuilt.
+    """
+    params = {"since": raw_history_start(since)}
+    params["edges"] = [float(edge) for edge in DWELL_HISTOGRAM_EDGES]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE product_stationhourlystats IN EXCLUSIVE MODE")
+        cursor.execute(
+            "DELETE FROM product_stationhourlystats WHERE hour >= %(since)s", params
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO product_stationhourlystats (
+                station_id, hour, count_in, count_out,
+                dwell_sum, dwell_min, dwell_max, dwell_histogram
+            )
+            SELECT * FROM ({raw_stats_sql()}) raw
+            """,
+            params,
+        )
+        return cursor.rowcount
+
+
+def drifted_station_stats(since=None):
+    """
+    Compare the hourly station stats with the raw process rows.
+
+    Hours of archived history cannot be compared and are skipped.
+
+    Args:
+        since (datetime): Only compare the hours from this one on.
+
+    Returns:
+        list: ``(station_id, hour)`` of every hour whose stats are wrong.
+    """
+    params = {"since": raw_history_start(since)}
+    params["edges"] = [float(edge) for edge in DWELL_HISTOGRAM_EDGES]
+    with connection.cursor() as cursor:
+        cursor.execute(DRIFTED_STATS_SQL.format(raw=raw_stats_sql()), params)
+        return cursor.fetchall()
+
+
+def summarize_stats(rows):
+    """
+    Combine hourly stats into totals over their whole range.
+
+    Dwell time percentiles are estimated from the histogram, as the upper bound
+    of the bucket the percentile falls in.
+
+    Args:
+        rows (list): StationHourlyStats instances.
+
+    Returns:
+        dict: Counts and dwell times in seconds.
+    """
+    histogram = [0] * (len(DWELL_HISTOGRAM_EDGES) + 1)
+    for row in rows:
+        for bucket, count in enumerate(row.dwell_histogram):
+            histogram[bucket] += count
+    dwell_count = sum(histogram)
+    dwell_min = [row.dwell_min for row in rows if row.dwell_min is not None]
+    dwell_max = [row.dwell_max for row in rows if row.dwell_max is not None]
+
+    def percentile(fraction):
+        if not dwell_count:
+            return None
+        seen = 0
+        for bucket, count in enumerate(histogram):
+            seen += count
+            if seen >= fraction * dwell_count:
+                break
+        if bucket < len(DWELL_HISTOGRAM_EDGES):
+            return DWELL_HISTOGRAM_EDGES[bucket]
+        return max(dwell_max)
+
+    return {
+        "count_in": sum(row.count_in for row in rows),
+        "count_out": sum(row.count_out for row in rows),
+        "dwell_mean": (
+            sum(row.dwell_sum for row in rows) / dwell_count if dwell_count else None
+        ),
+        "dwell_min": min(dwell_min, default=None),
+        "dwell_max": max(dwell_max, default=None),
+        "dwell_p50": percentile(0.5),
+        "dwell_p90": percentile(0.9),
+        "dwell_histogram": histogram,
+    }
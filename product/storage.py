@@ -0,0 +1,52 @@
+import hashlib
+import posixpath
+import re
+import textwrap
+
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ShardedUploadTo:
+    """
+    ``upload_to`` callable that spreads files over hash-prefixed subdirectories.
+
+    ``ShardedUploadTo("qr_codes")`` stores ``P-1_pump.png`` as
+    ``qr_codes/3f/a2/P-1_pump.png``, so no directory grows beyond a few hundred
+    entries even with millions of files. The shard only depends on the file name,
+    so the same name always lands in the same directory.
+
+    Attributes:
+        prefix (str): Top level directory, relative to the storage root.
+        depth (int): Number of two-character shard levels.
+    """
+
+    def __init__(self, prefix, depth=2):
+        self.prefix = prefix
+        self.depth = depth
+
+    def __call__(self, instance, filename):
+        return self.path_for(filename)
+
+    def path_for(self, filename):
+        """
+        Return the sharded path of ``filename``, ignoring any directory it is in.
+        """
+        basename = posixpath.basename(filename)
+        digest = hashlib.md5(basename.encode(), usedforsecurity=False).hexdigest()
+        shards = textwrap.wrap(digest[: self.depth * 2], 2)
+        return posixpath.join(self.prefix, *shards, basename)
+
+    def is_sharded(self, name):
+        """
+        Return whether ``name`` is already in a shard directory of this prefix.
+
+        Storage may have suffixed the file name to keep it unique after it was
+        sharded, so the directory need not match the hash of the final name.
+        """
+        prefix, *shards = posixpath.dirname(name).rsplit("/", self.depth)
+        return (
+            prefix == self.prefix
+            and len(shards) == self.depth
+            and all(re.fullmatch(r"[0-9a-f]{2}", shard) for shard in shards)
+        )
@@ -0,0 +1,76 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .models import Product
+from .utils import qr_filename, render_qr_batch
+
+
+def store_qr_images(products, contents):
+    """
+    Write rendered QR images to storage and record them on the products.
+
+    Files are named through ``Product.qr_image``'s ``upload_to`` and the rows are
+    saved with a single ``bulk_update``; the images they replace are deleted.
+
+    Args:
+        products (list): Product instances, in the order of ``contents``.
+        contents (list): The rendered PNG images.
+    """
+    field = Product._meta.get_field("qr_image")
+    replaced = []
+    for product, content in zip(products, contents):
+        name = field.generate_filename(
+            product, qr_filename(product.product_id, product.product_name)
+        )
+        old_name = product.qr_image.name
+        product.qr_image.name = field.storage.save(name, ContentFile(content))
+        product.qr_status = Product.QRStatus.READY
+        if old_name and old_name != product.qr_image.name:
+            replaced.append(old_name)
+
+    Product.objects.bulk_update(products, ["qr_image", "qr_status"], batch_size=500)
+
+    def delete_replaced():
+        for old_name in replaced:
+            field.storage.delete(old_name)
+
+    # The images they replace are only deleted once no row points at them anymore
+    transaction.on_commit(delete_replaced)
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def render_products_qr(product_ids):
+    """
+    Render the QR images of several products and store them on ``Product.qr_image``.
+
+    The product rows are committed before this task is queued, so registration does
+    not wait for PNG rendering or disk I/O. ``qr_status`` tracks the outcome.
+
+    Args:
+        product_ids (list): Primary keys of the products to render.
+    """
+    products = list(Product.objects.filter(pk__in=product_ids).order_by("pk"))
+    if not products:
+        return
+
+    try:
+        contents = render_qr_batch(
+            [product.product_id for product in products],
+            max_workers=getattr(settings, "QR_RENDER_WORKERS", None),
+        )
+        store_qr_images(products, contents)
+    except Exception:
+        Product.objects.filter(pk__in=product_ids).update(
+            qr_status=Product.QRStatus.FAILED
+        )
+        raise
+
+
+@shared_task
+def render_product_qr(product_id):
+    """
+    Render the QR image of a single product, see ``render_products_qr``.
+    """
+    render_products_qr([product_id])
@@ -0,0 +1,250 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import TelemetryRollup
+
+# Source of the raw readings, finer than every rollup
+RAW = "raw"
+
+# Rollups of the readings: resolution, bucket width and ``date_trunc`` unit
+ROLLUPS = [
+    (TelemetryRollup.Resolution.MINUTE, datetime.timedelta(minutes=1), "minute"),
+    (TelemetryRollup.Resolution.HOUR, datetime.timedelta(hours=1), "hour"),
+    (TelemetryRollup.Resolution.DAY, datetime.timedelta(days=1), "day"),
+]
+
+# Every source of telemetry with its bucket width, from the finest
+SOURCES = [(RAW, None)] + [(resolution, width) for resolution, width, _ in ROLLUPS]
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# New readings are inserted and added to every rollup by one statement. Resent
+# readings are skipped, so they are never counted twice; the rollup rows are
+# locked in a fixed order so that concurrent ingestions cannot deadlock on them.
+RECORD_TELEMETRY_SQL = """
+    WITH readings (station_id, sensor, recorded_at, value) AS (
+        VALUES {values}
+    ),
+    inserted AS (
+        INSERT INTO product_telemetryreading (station_id, sensor, recorded_at, value)
+        SELECT * FROM readings
+        ON CONFLICT (station_id, sensor, recorded_at) DO NOTHING
+        RETURNING station_id, sensor, recorded_at, value
+    ),
+    rolled_up AS (
+        INSERT INTO product_telemetryrollup AS r (
+            station_id, resolution, sensor, bucket,
+            count, value_sum, value_min, value_max
+        )
+        SELECT station_id, level.resolution, sensor,
+               date_trunc(level.unit, recorded_at, 'UTC') AS bucket,
+               count(*), sum(value), min(value), max(value)
+        FROM inserted
+        CROSS JOIN (VALUES {levels}) AS level (resolution, unit)
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 1, 2, 3, 4
+        ON CONFLICT (station_id, resolution, sensor, bucket) DO UPDATE SET
+            count = r.count + EXCLUDED.count,
+            value_sum = r.value_sum + EXCLUDED.value_sum,
+            value_min = LEAST(r.value_min, EXCLUDED.value_min),
+            value_max = GREATEST(r.value_max, EXCLUDED.value_max)
+    )
+    SELECT count(*) FROM inserted
+"""
+
+# Rows of each source in the range, as partial aggregates
+SOURCE_SQL = {
+    RAW: """
+        SELECT sensor, recorded_at AS time, 1 AS count, value AS value_sum,
+               value AS value_min, value AS value_max
+        FROM product_telemetryreading
+        WHERE station_id = %(station)s
+            AND recorded_at >= %(start)s AND recorded_at < %(end)s
+            {sensors}
+    """,
+    "rollup": """
+        SELECT sensor, bucket AS time, count, value_sum, value_min, value_max
+        FROM product_telemetryrollup
+        WHERE station_id = %(station)s AND resolution = %(resolution)s
+            AND bucket >= %(start)s AND bucket < %(end)s
+            {sensors}
+    """,
+}
+
+# Points of ``step`` seconds from ``start``; ``date_bin`` is only available from
+# PostgreSQL 14 on
+SERIES_SQL = """
+    SELECT sensor,
+           to_timestamp(
+               extract(epoch FROM %(start)s::timestamptz)
+               + floor(extract(epoch FROM time - %(start)s::timestamptz) / %(step)s) * %(step)s
+           ) AS time,
+           sum(count)::int, sum(value_sum) / sum(count), min(value_min), max(value_max)
+    FROM ({source}) AS source
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+
+def record_telemetry(readings):
+    """
+    Store a batch of sensor readings and add them to the rollups, in one query.
+
+    Args:
+        readings (list): ``(station_id, sensor, recorded_at, value)`` of every
+            reading.
+
+    Returns:
+        int: Number of readings stored; resent ones are not stored again.
+    """
+    if not readings:
+        return 0
+
+    values = ", ".join(["(%s::bigint, %s, %s::timestamptz, %s::float)"] * len(readings))
+    levels = ", ".join(f"('{resolution}', '{unit}')" for resolution, _, unit in ROLLUPS)
+    params = [value for reading in readings for value in reading]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RECORD_TELEMETRY_SQL.format(values=values, levels=levels), params
+        )
+        return cursor.fetchone()[0]
+
+
+def retention_start(source):
+    """
+    Return the time before which the telemetry of a source is pruned, or None if
+    it is kept forever.
+    """
+    days = settings.TELEMETRY_RETENTION_DAYS.get(source)
+    if days is None:
+        return None
+    return timezone.now() - datetime.timedelta(days=days)
+
+
+def telemetry_source(start, step):
+    """
+    Return the coarsest source that can answer points of ``step`` from ``start``.
+
+    A rollup can only answer them if its buckets fit whole in every point. When
+    no source that fits still holds ``start``, the points are widened to the
+    buckets of the finest coarser rollup that does.
+
+    Args:
+        start (datetime): Start of the first point.
+        step (timedelta): Width of the points.
+
+    Returns:
+        tuple: ``(source, start, step)``, with ``source`` ``RAW`` or the
+        resolution of a rollup, and the points it answers.
+    """
+
+    def kept(source):
+        pruned_before = retention_start(source)
+        return pruned_before is None or pruned_before <= start
+
+    fitting = [
+        source
+        for source, width in SOURCES
+        if width is None or not (step % width or (start - EPOCH) % width)
+    ]
+    for source in reversed(fitting):
+        if kept(source):
+            return source, start, step
+    for source, width in SOURCES:
+        if width is not None and width > step and kept(source):
+            return source, start - (start - EPOCH) % width, width * -(-step // width)
+    return fitting[-1], start, step
+
+
+def read_telemetry(station_id, start, end, step, sensors=None):
+    """
+    Aggregate the telemetry of a station into points of ``step``, from the
+    coarsest source that can answer them.
+
+    Args:
+        station_id (int): Primary key of the station.
+        start (datetime): Start of the first point.
+        end (datetime): End of the range, excluded.
+        step (timedelta): Width of the points.
+        sensors (list): Only read these sensors.
+
+    Returns:
+        tuple: ``(source, start, step, rows)``, as ``telemetry_source`` routes
+        the points, with ``rows`` a list of ``(sensor, time, count, mean, min,
+        max)`` ordered by sensor and time.
+    """
+    source, start, step = telemetry_source(start, step)
+    sql = SERIES_SQL.format(
+        source=SOURCE_SQL[RAW if source == RAW else "rollup"].format(
+            sensors="AND sensor = ANY(%(sensors)s)" if sensors else ""
+        )
+    )
+    params = {
+        "station": station_id,
+        "resolution": source,
+        "start": start,
+        "end": end,
+        "step": step.total_seconds(),
+        "sensors": sensors,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return source, start, step, cursor.fetchall()
+
+
+def summarize_telemetry(rows):
+    """
+    Combine the points read by ``read_telemetry`` into one summary per sensor.
+
+    Returns:
+        dict: ``count``, ``mean``, ``min`` and ``max`` by sensor.
+    """
+    summaries = {}
+    for sensor, _, count, mean, minimum, maximum in rows:
+        summary = summaries.setdefault(
+            sensor, {"count": 0, "mean": 0.0, "min": minimum, "max": maximum}
+        )
+        total = summary["count"] + count
+        summary["mean"] += (mean - summary["mean"]) * count / total
+        summary["count"] = total
+        summary["min"] = min(summary["min"], minimum)
+        summary["max"] = max(summary["max"], maximum)
+    return summaries
+
+
+def prune_telemetry(source, before, batch_size=10000):
+    """
+    Delete one batch of the telemetry of a source from before ``before``.
+
+    Returns:
+        int: Number of rows deleted; 0 once there are none left.
+    """
+    with connection.cursor() as cursor:
+        if source == RAW:
+            cursor.execute(
+                """
+                DELETE FROM product_telemetryreading
+                WHERE id IN (
+                    SELECT id FROM product_telemetryreading
+                    WHERE recorded_at < %(before)s
+                    LIMIT %(batch_size)s
+                )
+                """,
+                {"before": before, "batch_size": batch_size},
+            )
+        else:
+            cursor.execute(
+                """
+                DELETE FROM product_telemetryrollup
+                WHERE id IN (
+                    SELECT id FROM product_telemetryrollup
+                    WHERE resolution = %(resolution)s AND bucket < %(before)s
+                    LIMIT %(batch_size)s
+                )
+                """,
+                {"resolution": source, "before": before, "batch_size": batch_size},
+            )
+        return cursor.rowcount
@@ -1,3 +1,1549 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from io import StringIO
+from urllib.parse import quote
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from product.archive import detach_history_partition, history_partitions
+from product.cache import cached_board
+from product.changes import prune_changes
+from product.counters import drifted_station_counters
+from product.serializers import SECTIONS, CastingSnapshotSerializer
+from product.gateway import ScanGateway, send_scans
+from product.models import (
+    CastingSnapshot,
+    ChangeLog,
+    Process,
+    ProcessArchive,
+    Product,
+    Quality,
+    ScanEvent,
+    Station,
+    StationCounter,
+    StationHourlyStats,
+    TelemetryReading,
+    TelemetryRollup,
+)
+from product.services import (
+    apply_scan_events,
+    IdempotencyConflict,
+    MoveError,
+    move_product,
+    move_products,
+    open_entry_processes,
+)
+from product.stats import hour_bucket
+from product.tasks import render_products_qr
+from product.utils import parse_qr_payload, qr_payload
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductQRTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def test_product_create_renders_qr_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            resp = self.client.post(
+                "/api/v1/product/",
+                data={"product_id": "P-100", "product_name": "Valve body"},
+            )
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data["qr_status"], Product.QRStatus.PENDING)
+        self.assertIsNone(resp.data["qr_image"])
+        self.assertTrue(
+            Process.objects.filter(product_id="P-100", station_id=1).exists()
+        )
+
+        # The render and the board updates are queued on commit; the render runs
+        # eagerly in tests
+        self.assertEqual(len(callbacks), 3)
+        for callback in callbacks:
+            callback()
+        product = Product.objects.get(pk="P-100")
+        self.assertEqual(product.qr_status, Product.QRStatus.READY)
+        self.assertRegex(product.qr_image.name, r"^qr_codes/\w{2}/\w{2}/P-100_")
+
+    def test_rerender_deletes_the_replaced_image(self):
+        Product.objects.create(product_id="P-101", product_name="Valve body")
+        paths = []
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                render_products_qr(["P-101"])
+            paths.append(Product.objects.get(pk="P-101").qr_image.path)
+
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+
+
+class ProductQREndpointTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        Product.objects.create(product_id="P-200", product_name="Pump housing")
+
+    def test_qr_png_revalidates_with_etag(self):
+        resp = self.client.get("/api/v1/product/P-200/qr.png")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "image/png")
+        self.assertIn("no-cache", resp["Cache-Control"])
+        self.assertTrue(resp.content.startswith(b"\x89PNG"))
+
+        resp = self.client.get(
+            "/api/v1/product/P-200/qr.png", HTTP_IF_NONE_MATCH=resp["ETag"]
+        )
+        self.assertEqual(resp.status_code, 304)
+
+    def test_qr_svg_and_unknown_product(self):
+        resp = self.client.get("/api/v1/product/P-200/qr.svg")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "image/svg+xml")
+        self.assertTrue(resp.content.startswith(b"<svg"))
+
+        resp = self.client.get("/api/v1/product/missing/qr.svg")
+        self.assertEqual(resp.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductBulkCreateTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def test_bulk_create_products_and_processes(self):
+        payload = [
+            {"product_id": f"B-{i}", "product_name": f"Casting {i}"} for i in range(40)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                "/api/v1/product/bulk/", data=payload, format="json"
+            )
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.data), 40)
+        self.assertEqual(
+            Process.objects.filter(
+                product__product_id__startswith="B-", station_id=1
+            ).count(),
+            40,
+        )
+        self.assertFalse(
+            Product.objects.exclude(qr_status=Product.QRStatus.READY).exists()
+        )
+
+    def test_bulk_create_reports_per_item_errors(self):
+        Product.objects.create(product_id="B-1", product_name="Existing")
+        payload = [
+            {"product_id": "B-1", "product_name": "Taken"},
+            {"product_id": "B-2", "product_name": "Fine"},
+            {"product_id": "B-2", "product_name": "Repeated"},
+            {"product_id": "B-3"},
+        ]
+        resp = self.client.post("/api/v1/product/bulk/", data=payload, format="json")
+        self.assertEqual(resp.status_code, 400)
+        errors = resp.data["products"]
+        self.assertIn("product_id", errors[0])
+        self.assertEqual(errors[1], {})
+        self.assertIn("product_id", errors[2])
+        self.assertIn("product_name", errors[3])
+        self.assertEqual(Product.objects.count(), 1)
+
+
+class LabelSheetTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        Product.objects.bulk_create(
+            [Product(product_id=f"L-{i}", product_name=f"Label {i}") for i in range(30)]
+        )
+
+    def test_pdf_sheet_is_streamed(self):
+        ids = ",".join(f"L-{i}" for i in range(30))
+        resp = self.client.get(f"/api/v1/product/labels/?ids={ids}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        content = b"".join(resp.streaming_content)
+        self.assertTrue(content.startswith(b"%PDF-1.4"))
+        self.assertIn(b"/Count 2", content)
+        self.assertTrue(content.endswith(b"%%EOF\n"))
+
+    def test_png_page_and_missing_selection(self):
+        resp = self.client.get("/api/v1/product/labels/?ids=L-1,L-2&kind=png")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content.startswith(b"\x89PNG"))
+
+        resp = self.client.get("/api/v1/product/labels/")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_empty_pdf_selection_is_not_found(self):
+        resp = self.client.get("/api/v1/product/labels/?ids=NOPE")
+        self.assertEqual(resp.status_code, 404)
+
+
+class ScanTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        product = Product.objects.create(product_id="S-1", product_name="Gear, large")
+        open_entry_processes([product])
+        move_product("S-1", 3)
+
+    def test_compact_payload_round_trip(self):
+        payload = qr_payload("S-1")
+        self.assertEqual(payload, "BC1:S-1")
+        self.assertEqual(parse_qr_payload(payload), "S-1")
+        self.assertEqual(parse_qr_payload("https://bay.example/s/BC1:S-1"), "S-1")
+        self.assertEqual(parse_qr_payload("ID: S-1, Name: Gear, large"), "S-1")
+        self.assertIsNone(parse_qr_payload("something else"))
+
+    def test_scan_resolves_current_station_in_one_query(self):
+        for payload in ["BC1:S-1", "ID: S-1, Name: Gear, large"]:
+            with self.assertNumQueries(1):
+                resp = self.client.get(f"/api/scan/{quote(payload)}")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data["product_id"], "S-1")
+            self.assertEqual(resp.data["station_id"], 3)
+            self.assertEqual(resp.data["station_name"], "Molding")
+
+        self.assertEqual(self.client.get("/api/scan/BC1:missing").status_code, 404)
+
+
+class ZPLTest(APITestCase):
+    def test_zpl_labels_are_streamed(self):
+        Product.objects.create(product_id="Z-1", product_name="Cap ^XZ")
+        Product.objects.create(product_id="Z-2", product_name="Flange")
+
+        resp = self.client.get("/api/v1/product/zpl/?ids=Z-1,Z-2")
+        self.assertEqual(resp.status_code, 200)
+        content = b"".join(resp.streaming_content).decode()
+        self.assertEqual(content.count("^XA"), 2)
+        self.assertIn("^FDMA,BC1:Z-1^FS", content)
+        # Caret in the name is escaped, not interpreted as a command
+        self.assertIn("Cap _5EXZ", content)
+        self.assertEqual(content.count("^XZ"), 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RegenerateQRCommandTest(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create(
+            [Product(product_id=f"R-{i}", product_name=f"Part {i}") for i in range(5)]
+        )
+
+    def test_regenerate_qr_in_batches(self):
+        out = StringIO()
+        call_command("regenerate_qr", "--dry-run", stdout=out)
+        self.assertIn("5 products would be regenerated", out.getvalue())
+
+        checkpoint = os.path.join(tempfile.mkdtemp(), "checkpoint")
+        call_command(
+            "regenerate_qr",
+            "--batch-size=2",
+            "--workers=1",
+            f"--checkpoint={checkpoint}",
+            stdout=out,
+        )
+        self.assertIn("Regenerated 5 QR images", out.getvalue())
+        self.assertFalse(os.path.exists(checkpoint))
+        for product in Product.objects.all():
+            self.assertEqual(product.qr_status, Product.QRStatus.READY)
+            self.assertTrue(os.path.exists(product.qr_image.path))
+
+    def test_regenerate_qr_resumes_from_checkpoint(self):
+        checkpoint = os.path.join(tempfile.mkdtemp(), "checkpoint")
+        with open(checkpoint, "w") as f:
+            f.write("R-2")
+
+        call_command(
+            "regenerate_qr",
+            "--workers=1",
+            f"--checkpoint={checkpoint}",
+            stdout=StringIO(),
+        )
+        self.assertEqual(
+            list(
+                Product.objects.filter(qr_status=Product.QRStatus.READY)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            ),
+            ["R-3", "R-4"],
+        )
+
+
+class ShardMediaCommandTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, "qr_codes"))
+        with open(os.path.join(self.media_root, "qr_codes", "M-1_old.png"), "wb") as f:
+            f.write(b"png")
+
+    def test_shard_media_moves_files_and_paths(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            Product.objects.create(
+                product_id="M-1", product_name="Old", qr_image="qr_codes/M-1_old.png"
+            )
+            call_command("shard_media", stdout=StringIO())
+
+            product = Product.objects.get(pk="M-1")
+            self.assertRegex(
+                product.qr_image.name, r"^qr_codes/[0-9a-f]{2}/[0-9a-f]{2}/M-1_old.png$"
+            )
+            with open(product.qr_image.path, "rb") as f:
+                self.assertEqual(f.read(), b"png")
+            self.assertFalse(
+                os.path.exists(os.path.join(self.media_root, "qr_codes", "M-1_old.png"))
+            )
+
+    def test_shard_media_skips_sharded_files(self):
+        # Storage suffixed the name after sharding, so it is not in its own shard
+        name = "qr_codes/ab/cd/M-1_old_x7Kq2Lm.png"
+        with override_settings(MEDIA_ROOT=self.media_root):
+            Product.objects.create(product_id="M-1", product_name="Old", qr_image=name)
+            os.makedirs(os.path.join(self.media_root, "qr_codes", "ab", "cd"))
+            with open(os.path.join(self.media_root, name), "wb") as f:
+                f.write(b"png")
+            out = StringIO()
+            call_command("shard_media", stdout=out)
+
+            self.assertIn("Product.qr_image: 0 files", out.getvalue())
+            self.assertEqual(Product.objects.get(pk="M-1").qr_image.name, name)
+
+
+class ProductMoveTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        product = Product.objects.create(product_id="MV-1", product_name="Housing")
+        Process.objects.create(product=product, station_id=1)
+
+    def move(self, station, **extra):
+        return self.client.post(
+            "/api/v1/product/MV-1/update_product/",
+            data={"is_checked": True, "move_to": station},
+            format="json",
+            **extra,
+        )
+
+    def test_move_closes_current_process(self):
+        resp = self.move(2)
+        self.assertEqual(resp.status_code, 200)
+        active = Process.objects.get(product_id="MV-1", is_active=True)
+        self.assertEqual(active.station_id, 2)
+        self.assertIsNotNone(
+            Process.objects.get(product_id="MV-1", station_id=1).exit_time
+        )
+
+        resp = self.move(2)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_retried_move_is_applied_once(self):
+        for _ in range(2):
+            resp = self.move(2, HTTP_IDEMPOTENCY_KEY="scan-42")
+            self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Process.objects.filter(product_id="MV-1").count(), 2)
+
+        resp = self.move(3, HTTP_IDEMPOTENCY_KEY="scan-42")
+        self.assertEqual(resp.status_code, 409)
+
+
+class ProductMoveConcurrencyTest(TransactionTestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        product = Product.objects.create(product_id="MV-2", product_name="Impeller")
+        Process.objects.create(product=product, station_id=1)
+
+    def run_concurrently(self, moves):
+        barrier = threading.Barrier(len(moves))
+        errors = []
+
+        def worker(station_id, key):
+            try:
+                barrier.wait()
+                move_product("MV-2", station_id, idempotency_key=key)
+            except MoveError:
+                pass
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=move) for move in moves]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_moves_leave_one_active_process(self):
+        self.run_concurrently([(2 + i % 5, None) for i in range(20)])
+
+        self.assertEqual(
+            Process.objects.filter(product_id="MV-2", is_active=True).count(), 1
+        )
+        self.assertEqual(
+            Process.objects.filter(product_id="MV-2", exit_time__isnull=True).count(),
+            1,
+        )
+
+    def test_concurrent_retries_apply_move_once(self):
+        self.run_concurrently([(3, "retry") for _ in range(10)])
+
+        self.assertEqual(Process.objects.filter(product_id="MV-2").count(), 2)
+        self.assertEqual(
+            Process.objects.get(product_id="MV-2", is_active=True).station_id, 3
+        )
+
+    def test_concurrent_first_uses_of_a_key_conflict(self):
+        Product.objects.create(product_id="MV-3", product_name="Impeller")
+        moved, release = threading.Event(), threading.Event()
+        outcomes = []
+
+        def first():
+            try:
+                with transaction.atomic():
+                    move_product("MV-2", 2, idempotency_key="shared")
+                    moved.set()
+                    release.wait()
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                move_product("MV-3", 2, idempotency_key="shared")
+            except Exception as e:
+                outcomes.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        threads[0].start()
+        moved.wait()
+        threads[1].start()
+        # The second move waits on the unique index of the key until the first
+        # one commits
+        with connection.cursor() as cursor:
+            for _ in range(500):
+                cursor.execute(
+                    "SELECT count(*) FROM pg_stat_activity"
+                    " WHERE wait_event_type = 'Lock'"
+                )
+                if cursor.fetchone()[0]:
+                    break
+                time.sleep(0.02)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), 1)
+        self.assertIsInstance(outcomes[0], IdempotencyConflict)
+        self.assertFalse(Process.objects.filter(product_id="MV-3").exists())
+
+
+class ScanApplyConcurrencyTest(TransactionTestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        open_entry_processes(
+            Product.objects.bulk_create(
+                [
+                    Product(product_id=f"P{i}", product_name="Pulley")
+                    for i in range(1, 6)
+                ]
+            )
+        )
+
+    def waiting_backends(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'"
+            )
+            return cursor.fetchone()[0]
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 10
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+
+    def test_batch_and_bulk_move_do_not_deadlock(self):
+        ScanEvent.objects.bulk_create(
+            [
+                ScanEvent(key=f"k{i}", product_id=product_id, station_id=station_id)
+                for i, (product_id, station_id) in enumerate(
+                    [("P1", 2), ("P5", 2), ("P3", 3), ("P4", 3)]
+                )
+            ]
+        )
+        locked, release = threading.Event(), threading.Event()
+        errors = []
+
+        def run(func):
+            try:
+                func()
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def hold_p3():
+            with transaction.atomic():
+                Product.objects.select_for_update().get(pk="P3")
+                locked.set()
+                release.wait()
+
+        holder = threading.Thread(target=run, args=(hold_p3,))
+        holder.start()
+        locked.wait()
+        # The batch would lock P1 and P5 for station 2 and wait on P3, while the
+        # bulk move locks P4 and waits on P5
+        batch = threading.Thread(target=run, args=(apply_scan_events,))
+        batch.start()
+        self.wait_for(lambda: self.waiting_backends() == 1)
+        bulk = threading.Thread(
+            target=run, args=(lambda: move_products(["P4", "P5"], 5),)
+        )
+        bulk.start()
+        self.wait_for(lambda: not bulk.is_alive() or self.waiting_backends() == 2)
+        release.set()
+        for thread in (holder, batch, bulk):
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertFalse(ScanEvent.objects.filter(status="pending").exists())
+
+
+class ProductBulkMoveTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        products = Product.objects.bulk_create(
+            [Product(product_id=f"F-{i:03d}", product_name="Flask") for i in range(200)]
+        )
+        Process.objects.bulk_create(
+            [Process(product=product, station_id=4) for product in products]
+        )
+        Process.objects.filter(product_id="F-000").update(station_id=5)
+
+    def test_bulk_move_in_constant_queries(self):
+        product_ids = [f"F-{i:03d}" for i in range(200)] + ["missing"]
+        with self.assertNumQueries(10):
+            resp = self.client.post(
+                "/api/v1/product/bulk_move/",
+                data={"product_ids": product_ids, "move_to": 5},
+                format="json",
+            )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["moved"], 199)
+        statuses = {item["product_id"]: item["status"] for item in resp.data["results"]}
+        self.assertEqual(statuses["F-000"], "already_at_station")
+        self.assertEqual(statuses["F-001"], "moved")
+        self.assertEqual(statuses["missing"], "not_found")
+
+        self.assertEqual(
+            Process.objects.filter(is_active=True, station_id=5).count(), 200
+        )
+        self.assertEqual(Process.objects.filter(is_active=True).count(), 200)
+
+
+class CurrentStationTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def test_moves_maintain_current_station(self):
+        self.client.post(
+            "/api/v1/product/",
+            data={"product_id": "C-1", "product_name": "Bracket"},
+        )
+        product = Product.objects.get(pk="C-1")
+        self.assertEqual(product.current_station_id, 1)
+        self.assertEqual(product.current_process.station_id, 1)
+
+        self.client.post(
+            "/api/v1/product/bulk_move/",
+            data={"product_ids": ["C-1"], "move_to": 2},
+            format="json",
+        )
+        process, _ = move_product("C-1", 4)
+        product.refresh_from_db()
+        self.assertEqual(product.current_station_id, 4)
+        self.assertEqual(product.current_process, process)
+
+    def test_reconcile_repairs_drift(self):
+        product = Product.objects.create(product_id="C-2", product_name="Bracket")
+        Process.objects.create(product=product, station_id=1, is_active=False)
+        process = Process.objects.create(product=product, station_id=3)
+
+        out = StringIO()
+        call_command("reconcile_current_station", "--dry-run", stdout=out)
+        self.assertIn("1 products have drifted", out.getvalue())
+
+        call_command("reconcile_current_station", stdout=out)
+        product.refresh_from_db()
+        self.assertEqual(product.current_station_id, 3)
+        self.assertEqual(product.current_process, process)
+
+
+class QueryPlanTest(APITestCase):
+    """
+    Hot endpoints must reach the growing tables through an index.
+
+    The queries an endpoint runs are captured and EXPLAINed again with sequential
+    scans disabled; the planner only falls back to one if no index can serve the
+    query, which is then reported with the offending SQL.
+    """
+
+    fixtures = ["stations.json"]
+    # Tables that grow with months of production history
+    GROWING_TABLES = {"product_product", "product_process"}
+
+    @classmethod
+    def setUpTestData(cls):
+        products = Product.objects.bulk_create(
+            [Product(product_id=f"H-{i:04d}", product_name="Hub") for i in range(500)]
+        )
+        open_entry_processes(products)
+        for station_id in (2, 3, 4):
+            move_products([product.pk for product in products[::2]], station_id)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE product_product, product_process")
+
+    def setUp(self):
+        cache.clear()
+
+    def assertIndexedQueries(self, func):
+        """
+        Fail on a sequential scan of a growing table, and return the names of the
+        indexes the queries use.
+        """
+        indexes = set()
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            for query in ctx.captured_queries:
+                sql = query["sql"]
+                if not sql.startswith(("SELECT", "UPDATE")):
+                    continue
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                nodes = [cursor.fetchone()[0][0]["Plan"]]
+                while nodes:
+                    node = nodes.pop()
+                    nodes.extend(node.get("Plans", []))
+                    if "Index Name" in node:
+                        indexes.add(node["Index Name"])
+                    if (
+                        node["Node Type"] == "Seq Scan"
+                        and node["Relation Name"] in self.GROWING_TABLES
+                    ):
+                        self.fail(f"Sequential scan on {node['Relation Name']}: {sql}")
+        return indexes
+
+    def test_board_endpoints_use_indexes(self):
+        self.assertIndexedQueries(lambda: self.client.get("/api/v1/stations/"))
+        self.assertIndexedQueries(
+            lambda: self.client.get("/api/station-product-process/")
+        )
+        # Served by the indexes of migration 0018, not only by the foreign key ones
+        self.assertIn(
+            "process_active_station_idx",
+            self.assertIndexedQueries(
+                lambda: self.client.get("/api/v1/process/?station=4&is_active=true")
+            ),
+        )
+        self.assertIn(
+            "process_product_history_idx",
+            self.assertIndexedQueries(
+                lambda: self.client.get("/api/v1/process/?product=H-0002")
+            ),
+        )
+        self.assertIndexedQueries(
+            lambda: self.client.get(f"/api/scan/{quote(qr_payload('H-0002'))}")
+        )
+
+    def test_moves_use_indexes(self):
+        self.assertIndexedQueries(
+            lambda: self.client.post(
+                "/api/v1/product/H-0001/update_product/",
+                data={"is_checked": True, "move_to": 2},
+                format="json",
+            )
+        )
+        self.assertIndexedQueries(
+            lambda: self.client.post(
+                "/api/v1/product/bulk_move/",
+                data={"product_ids": ["H-0001", "H-0003"], "move_to": 5},
+                format="json",
+            )
+        )
+
+
+class ActiveProcessConstraintTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        self.product = Product.objects.create(product_id="U-1", product_name="Gear")
+        open_entry_processes([self.product])
+
+    def test_second_active_process_is_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Process.objects.create(product=self.product, station_id=2)
+
+        resp = self.client.post(
+            "/api/v1/process/", data={"product": "U-1", "station": 2}, format="json"
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_repair_closes_all_but_latest_active_process(self):
+        # Data from before the constraint existed
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX process_one_active_per_product")
+        entry = Process.objects.get(product=self.product)
+        now = timezone.now()
+        Process.objects.filter(pk=entry.pk).update(entry_time=now - timedelta(hours=2))
+        middle = Process.objects.create(
+            product=self.product, station_id=2, entry_time=now - timedelta(hours=1)
+        )
+        latest = Process.objects.create(
+            product=self.product, station_id=3, entry_time=now
+        )
+
+        out = StringIO()
+        call_command("repair_active_processes", "--dry-run", stdout=out)
+        self.assertIn("2 duplicate active processes found", out.getvalue())
+
+        call_command("repair_active_processes", stdout=out)
+        self.assertEqual(
+            list(Process.objects.filter(is_active=True).values_list("pk", flat=True)),
+            [latest.pk],
+        )
+        entry.refresh_from_db()
+        self.assertEqual(entry.exit_time, middle.entry_time)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_process, latest)
+        self.assertEqual(self.product.current_station_id, 3)
+
+
+class ScanGatewayTest(TransactionTestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        open_entry_processes(
+            Product.objects.bulk_create(
+                [Product(product_id=f"G-{i}", product_name="Gear") for i in (1, 2)]
+            )
+        )
+
+    def run_gateway(self, scenario):
+        async def run():
+            gateway = ScanGateway(poll_interval=0.05)
+            await gateway.start("127.0.0.1", 0)
+            try:
+                result = await scenario(gateway.port)
+                await gateway.flush()
+                return result
+            finally:
+                await gateway.close()
+
+        return asyncio.run(run())
+
+    def test_scans_are_acknowledged_and_applied_in_order(self):
+        scans = [
+            {"key": "a", "station": 2, "payload": qr_payload("G-1")},
+            {"key": "b", "station": 2, "product": "G-2"},
+            {"key": "c", "station": 3, "product": "G-1"},
+            {"key": "c", "station": 3, "product": "G-1"},
+            {"key": "d", "station": 4, "product": "G-1"},
+            {"key": "e", "station": 99, "product": "G-2"},
+            {"key": "f", "station": 3, "product": "missing"},
+            {"key": "g", "station": 2, "product": "G-2"},
+            {"station": 2, "product": "G-2"},
+        ]
+        acks = self.run_gateway(lambda port: send_scans("127.0.0.1", port, scans))
+
+        self.assertEqual(
+            [(ack["key"], ack["status"]) for ack in acks],
+            [
+                ("a", "queued"),
+                ("b", "queued"),
+                ("c", "queued"),
+                ("c", "queued"),
+                ("d", "queued"),
+                ("e", "rejected"),
+                ("f", "queued"),
+                ("g", "queued"),
+                (None, "rejected"),
+            ],
+        )
+        self.assertEqual(
+            list(
+                Process.objects.filter(product_id="G-1")
+                .order_by("id")
+                .values_list("station_id", flat=True)
+            ),
+            [1, 2, 3, 4],
+        )
+        self.assertEqual(Product.objects.get(pk="G-2").current_station_id, 2)
+        self.assertEqual(
+            dict(ScanEvent.objects.values_list("key", "status")),
+            {
+                "a": "applied",
+                "b": "applied",
+                "c": "applied",
+                "d": "applied",
+                "f": "failed",
+                "g": "skipped",
+            },
+        )
+
+    def test_http_fallback(self):
+        async def post(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            body = b'{"key": "h1", "station": 5, "product": "G-2"}\n'
+            writer.write(
+                b"POST /scans HTTP/1.1\r\nHost: gateway\r\n"
+                b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+            )
+            response = await reader.read()
+            writer.close()
+            return response
+
+        response = self.run_gateway(post)
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+        self.assertIn(b'"status": "queued"', response)
+        self.assertEqual(Product.objects.get(pk="G-2").current_station_id, 5)
+
+
+class StationListTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        cache.clear()
+
+    def add_products(self, prefix, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            products = Product.objects.bulk_create(
+                [
+                    Product(product_id=f"{prefix}-{i}", product_name="Hub")
+                    for i in range(count)
+                ]
+            )
+            open_entry_processes(products)
+            move_products([product.pk for product in products[::2]], 2)
+
+    def test_list_takes_fixed_number_of_queries(self):
+        self.add_products("S", 4)
+        with self.assertNumQueries(2):
+            resp = self.client.get("/api/v1/stations/")
+        self.assertEqual(resp.status_code, 200)
+        first, second = resp.data[:2]
+        # Products currently at the station
+        self.assertEqual(first["number_of_products"], 2)
+        self.assertEqual([p["id"] for p in first["products"]], ["S-1", "S-3"])
+        self.assertEqual([p["id"] for p in second["products"]], ["S-0", "S-2"])
+        self.assertEqual(
+            second["products"][0]["qr_image"],
+            "http://testserver/api/v1/product/S-0/qr.png",
+        )
+
+        self.add_products("T", 50)
+        with self.assertNumQueries(2):
+            resp = self.client.get("/api/v1/stations/")
+        self.assertEqual(len(resp.data[1]["products"]), 27)
+
+    def test_created_station_is_serialized_without_annotations(self):
+        resp = self.client.post("/api/v1/stations/", data={"name": "Grinding"})
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data["number_of_products"], 0)
+        self.assertEqual(resp.data["products"], [])
+
+
+class StationBoardCacheTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(product_id="C-1", product_name="Cap")
+            open_entry_processes([product])
+
+    def board(self):
+        resp = self.client.get("/api/station-product-process/")
+        self.assertEqual(resp.status_code, 200)
+        return {
+            station["station_name"]: [p["product_id"] for p in station["products"]]
+            for station in resp.data
+        }
+
+    def test_polls_are_served_from_cache_until_a_change(self):
+        self.assertEqual(self.board(), {"Entry Point": ["C-1"]})
+        self.client.get("/api/v1/stations/")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.board(), {"Entry Point": ["C-1"]})
+            self.client.get("/api/v1/stations/")
+
+        # A move through the services invalidates the board once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            move_product("C-1", 2)
+        self.assertEqual(self.board(), {"Ramming": ["C-1"]})
+
+        # So does a plain model save, through the signals
+        with self.captureOnCommitCallbacks(execute=True):
+            station = Station.objects.get(pk=2)
+            station.name = "Ramming floor"
+            station.save()
+        self.assertEqual(self.board(), {"Ramming floor": ["C-1"]})
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return ["board"]
+
+        threads = [
+            threading.Thread(target=cached_board, args=("test", build))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(cached_board("test", build), ["board"])
+
+
+@override_settings(CACHE_IS_SHARED=True)
+class ConditionalListTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(product_id="E-1", product_name="Elbow")
+            open_entry_processes([product])
+
+    def assertRevalidates(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp["ETag"]
+        with self.assertNumQueries(0):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], etag)
+        return etag
+
+    def test_unchanged_lists_answer_304_without_queries(self):
+        urls = [
+            "/api/v1/stations/",
+            "/api/station-product-process/",
+            "/api/v1/process/?station=1",
+        ]
+        etags = [self.assertRevalidates(url) for url in urls]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            move_product("E-1", 2)
+        for url, etag in zip(urls, etags):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp["ETag"], etag)
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_no_etags_without_a_shared_cache(self):
+        resp = self.client.get("/api/v1/stations/")
+        self.assertNotIn("ETag", resp)
+        resp = self.client.get("/api/v1/stations/", HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_casting_snapshots_have_their_own_version(self):
+        user = get_user_model().objects.create_user("inspector")
+        self.client.force_authenticate(user)
+        etag = self.assertRevalidates("/api/v1/casting-snapshots/")
+
+        # Board changes leave the snapshot list valid
+        with self.captureOnCommitCallbacks(execute=True):
+            move_product("E-1", 2)
+        resp = self.client.get("/api/v1/casting-snapshots/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CastingSnapshot.objects.create(product_id="E-1", station_id=2)
+        resp = self.client.get("/api/v1/casting-snapshots/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data), 1)
+
+
+class ChangeFeedTest(TransactionTestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cursor = self.client.get("/api/changes/").data["cursor"]
+
+    def read(self, **params):
+        resp = self.client.get("/api/changes/", {"since": self.cursor, **params})
+        self.assertEqual(resp.status_code, 200)
+        return resp.data
+
+    def test_feed_reports_the_last_state_of_every_changed_row(self):
+        open_entry_processes(
+            Product.objects.bulk_create(
+                [Product(product_id=f"F-{i}", product_name="Flange") for i in (1, 2)]
+            )
+        )
+        move_products(["F-1", "F-2"], 2)
+        Process.objects.filter(product_id="F-2", is_active=False).delete()
+
+        with self.assertNumQueries(3):
+            feed = self.read()
+        self.assertFalse(feed["has_more"])
+        changes = {(c["resource"], c["op"]): c for c in feed["changes"]}
+        self.assertEqual(
+            sorted(c["id"] for c in feed["changes"] if c["resource"] == "product"),
+            ["F-1", "F-2"],
+        )
+        self.assertEqual(changes["product", "upsert"]["data"]["current_station"], 2)
+        self.assertIsNone(changes["process", "delete"]["data"])
+        self.assertEqual(len(feed["changes"]), 6)
+
+        # Read in small batches, the same changes come through
+        ids = set()
+        while True:
+            feed = self.read(limit=2)
+            ids.update((c["resource"], c["id"]) for c in feed["changes"])
+            self.cursor = feed["cursor"]
+            if not feed["has_more"]:
+                break
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(self.read()["changes"], [])
+
+    def test_casting_snapshots_need_a_signed_in_user(self):
+        product = Product.objects.create(product_id="F-3", product_name="Flange")
+        quality = Quality.objects.create(comments="Fine")
+        snapshot = CastingSnapshot.objects.create(
+            product=product, station_id=1, quality=quality
+        )
+        self.assertEqual(self.read(resource="casting_snapshot")["changes"], [])
+
+        self.client.force_authenticate(get_user_model().objects.create_user("qa"))
+        self.cursor = self.read(resource="casting_snapshot")["cursor"]
+        quality.comments = "Porosity"
+        quality.save()
+        (change,) = self.read()["changes"]
+        self.assertEqual(change["id"], str(snapshot.pk))
+        self.assertEqual(change["data"]["quality"]["comments"], "Porosity")
+
+    def test_pruned_cursor_is_gone(self):
+        Product.objects.create(product_id="F-4", product_name="Flange")
+        self.cursor = self.read()["cursor"]
+        call_command("prune_change_log", days=-1, stdout=StringIO())
+        resp = self.client.get("/api/changes/", {"since": self.cursor})
+        self.assertEqual(resp.status_code, 410)
+
+    def test_prune_without_newer_changes(self):
+        Product.objects.create(product_id="F-5", product_name="Flange")
+        Product.objects.create(product_id="F-6", product_name="Flange")
+        # No change was made at or after the cutoff
+        before = timezone.now() + timedelta(days=1)
+        logged = ChangeLog.objects.count()
+        self.assertGreaterEqual(logged, 2)
+        self.assertEqual(prune_changes(before, batch_size=1), 1)
+        self.assertEqual(prune_changes(before), logged - 1)
+        self.assertEqual(prune_changes(before), 0)
+        self.assertFalse(ChangeLog.objects.exists())
+
+
+class StationCounterTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def counts(self, station_id):
+        counter = StationCounter.objects.get(pk=station_id)
+        return counter.wip, counter.count_in, counter.count_out
+
+    def test_moves_keep_counters_in_step_with_processes(self):
+        products = Product.objects.bulk_create(
+            [Product(product_id=f"K-{i}", product_name="Knuckle") for i in range(3)]
+        )
+        open_entry_processes(products)
+        move_products(["K-0", "K-1"], 2)
+        move_product("K-0", 3)
+        self.assertEqual(self.counts(1), (1, 3, 2))
+        self.assertEqual(self.counts(2), (1, 2, 1))
+        self.assertEqual(self.counts(3), (1, 1, 0))
+        self.assertEqual(drifted_station_counters(), [])
+
+        # Raw edits refresh the work in progress of their stations
+        process = Process.objects.get(product_id="K-2", is_active=True)
+        resp = self.client.delete(f"/api/v1/process/{process.pk}/")
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(self.counts(1), (0, 3, 2))
+
+    def test_check_command_reports_and_fixes_drift(self):
+        open_entry_processes(
+            [Product.objects.create(product_id="K-9", product_name="Knuckle")]
+        )
+        StationCounter.objects.filter(pk=1).update(wip=5)
+        with self.assertRaises(CommandError):
+            call_command("check_station_counters", stdout=StringIO())
+
+        call_command("check_station_counters", fix=True, stdout=StringIO())
+        self.assertEqual(self.counts(1), (1, 1, 0))
+        call_command("check_station_counters", stdout=StringIO())
+
+    def test_deleting_products_refreshes_their_stations(self):
+        products = Product.objects.bulk_create(
+            [Product(product_id=f"K-{i}", product_name="Knuckle") for i in range(3)]
+        )
+        open_entry_processes(products)
+        move_product("K-0", 2)
+
+        resp = self.client.delete("/api/v1/product/K-0/")
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(self.counts(2)[0], 0)
+
+        self.client.force_login(
+            get_user_model().objects.create_superuser("admin", password="secret")
+        )
+        resp = self.client.post(
+            "/admin/product/product/",
+            {"action": "delete_selected", "_selected_action": ["K-1"], "post": "yes"},
+        )
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(self.counts(1)[0], 1)
+
+    def test_new_station_gets_a_counter(self):
+        resp = self.client.post("/api/v1/stations/", data={"name": "Grinding"})
+        self.assertEqual(self.counts(resp.data["id"]), (0, 0, 0))
+
+
+class CastingSnapshotWriteTest(TestCase):
+    fixtures = ["stations.json"]
+
+    # A valid payload of every station section
+    SECTION_PAYLOADS = {
+        "station_one": {
+            "weight_lbs": 12.5,
+            "materials": "Iron",
+            "pattern_type": "Wood",
+        },
+        "ramming_floor": {"cope_temperature": 70.0},
+        "molding_floor": {"cope_baume": 1.2},
+        "pour": {"pour_temperature": 2600.0},
+        "shakeout": {"shakeout_time_days": 1.0},
+        "quality": {"comments": "Fine"},
+    }
+
+    def setUp(self):
+        Product.objects.create(product_id="W-1", product_name="Wheel")
+
+    def save(self, queries, instance=None, **data):
+        serializer = CastingSnapshotSerializer(instance, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        # The savepoint of the transaction and its release, plus the writes
+        with self.assertNumQueries(queries + 2):
+            return serializer.save()
+
+    def test_create_inserts_each_row_once(self):
+        for count in range(len(SECTIONS) + 1):
+            for names in itertools.combinations(SECTIONS, count):
+                with self.subTest(sections=names):
+                    snapshot = self.save(
+                        count + 1,
+                        product="W-1",
+                        station=2,
+                        **{name: self.SECTION_PAYLOADS[name] for name in names},
+                    )
+                    snapshot.refresh_from_db()
+                    for name in SECTIONS:
+                        linked = getattr(snapshot, f"{name}_id") is not None
+                        self.assertEqual(linked, name in names)
+
+    def test_update_writes_only_changed_rows_and_columns(self):
+        snapshot = self.save(
+            2, product="W-1", station=2, quality=self.SECTION_PAYLOADS["quality"]
+        )
+        snapshot = CastingSnapshot.objects.select_related(*SECTIONS).get(pk=snapshot.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.save(
+                3,
+                snapshot,
+                station=3,
+                quality={"comments": "Porosity"},
+                shakeout=self.SECTION_PAYLOADS["shakeout"],
+            )
+        quality_update = next(
+            q["sql"] for q in queries if q["sql"].startswith('UPDATE "product_quality"')
+        )
+        self.assertNotIn("surface_quality_grade", quality_update)
+        snapshot.refresh_from_db()
+        self.assertEqual(snapshot.station_id, 3)
+        self.assertEqual(snapshot.quality.comments, "Porosity")
+        self.assertEqual(snapshot.shakeout.shakeout_time_days, 1.0)
+
+        # Nothing changed, nothing written
+        self.save(0, snapshot, station=3, quality={"comments": "Porosity"})
+
+
+class CastingSnapshotBulkTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        Product.objects.create(product_id="W-1", product_name="Wheel")
+        self.client.force_authenticate(get_user_model().objects.create_user("pour"))
+
+    def post(self, payload):
+        return self.client.post(
+            "/api/v1/casting-snapshots/bulk/", data=payload, format="json"
+        )
+
+    def test_bulk_ingest_in_constant_queries(self):
+        for size in (5, 50):
+            payload = [
+                {
+                    "product": "W-1",
+                    "station": 4,
+                    **CastingSnapshotWriteTest.SECTION_PAYLOADS,
+                }
+                for _ in range(size)
+            ]
+            # Products and stations, the savepoint and its release, one insert per
+            # section model and one of the snapshots
+            with self.assertNumQueries(2 + 2 + len(SECTIONS) + 1):
+                resp = self.post(payload)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data["created"], size)
+
+        snapshot = CastingSnapshot.objects.get(pk=resp.data["results"][-1]["id"])
+        self.assertEqual(snapshot.pour.pour_temperature, 2600.0)
+        self.assertEqual(snapshot.station_one.materials, "Iron")
+
+    def test_bulk_ingest_stores_valid_items(self):
+        payload = {
+            "snapshots": [
+                {"product": "W-1", "station": 2, "quality": {"comments": "Fine"}},
+                {"product": "W-404", "station": 2},
+                {"product": "W-1", "station": 2, "station_one": {"weight_lbs": 1}},
+                {"product": "W-1", "station": 99, "ramming_floor": {}},
+                {"product": "W-1", "station": 3, "ramming_floor": {}},
+            ]
+        }
+        resp = self.post(payload)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["created"], 2)
+        results = resp.data["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["created", "invalid", "invalid", "invalid", "created"],
+        )
+        self.assertIn("product", results[1]["errors"])
+        self.assertIn("materials", results[2]["errors"]["station_one"])
+        self.assertIn("station", results[3]["errors"])
+        self.assertEqual(CastingSnapshot.objects.count(), 2)
+        # Sections without any value are not stored
+        self.assertIsNone(
+            CastingSnapshot.objects.get(pk=results[4]["id"]).ramming_floor
+        )
+        self.assertEqual(self.post([]).status_code, 400)
+
+
+class TelemetryTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        self.start = hour_bucket(timezone.now()) - timedelta(hours=2)
+        self.readings = [
+            {
+                "station": 2,
+                "sensor": "cope_temperature",
+                "recorded_at": (self.start + timedelta(seconds=20 * i)).isoformat(),
+                "value": float(i),
+            }
+            for i in range(9)
+        ]
+
+    def ingest(self, readings):
+        return self.client.post("/api/telemetry/", data=readings, format="json")
+
+    def series(self, resolution, minutes=3):
+        until = self.start + timedelta(minutes=minutes)
+        return self.client.get(
+            "/api/v1/stations/2/telemetry/",
+            {
+                "since": self.start.isoformat(),
+                "until": until.isoformat(),
+                "resolution": resolution,
+                "sensor": "cope_temperature",
+            },
+        )
+
+    def test_ingest_rolls_up_once(self):
+        # The stations, then the readings and every rollup at once
+        with self.assertNumQueries(2):
+            resp = self.ingest(self.readings)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data, {"stored": 9, "skipped": 0})
+        resp = self.ingest({"readings": self.readings})
+        self.assertEqual(resp.data, {"stored": 0, "skipped": 9})
+
+        minutes = TelemetryRollup.objects.filter(resolution="1m").order_by("bucket")
+        self.assertEqual([rollup.count for rollup in minutes], [3, 3, 3])
+        hour = TelemetryRollup.objects.get(resolution="1h")
+        self.assertEqual(
+            (hour.count, hour.value_sum, hour.value_min, hour.value_max),
+            (9, 36.0, 0.0, 8.0),
+        )
+        self.assertEqual(TelemetryRollup.objects.filter(resolution="1d").count(), 1)
+
+    def test_invalid_batch_is_rejected(self):
+        resp = self.ingest(self.readings + [{**self.readings[0], "station": 99}])
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("station", resp.data["readings"][9])
+        self.assertFalse(TelemetryReading.objects.exists())
+
+    def test_series_is_read_from_the_coarsest_fitting_source(self):
+        self.ingest(self.readings)
+        for resolution, source, means in [
+            (60, "1m", [1.0, 4.0, 7.0]),
+            (180, "1m", [4.0]),
+            (20, "raw", [float(i) for i in range(9)]),
+            # Minutes do not fit in points of 90 seconds
+            (90, "raw", [2.0, 6.5]),
+            (3600, "1h", [4.0]),
+        ]:
+            with self.subTest(resolution=resolution):
+                resp = self.series(resolution)
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(resp.data["source"], source)
+                points = resp.data["sensors"]["cope_temperature"]
+                self.assertEqual([point["mean"] for point in points], means)
+
+    @override_settings(
+        TELEMETRY_RETENTION_DAYS={"raw": 0, "1m": 0, "1h": 730, "1d": None}
+    )
+    def test_pruned_range_is_read_from_a_coarser_rollup(self):
+        self.ingest(self.readings)
+        call_command("prune_telemetry", stdout=StringIO())
+        self.assertFalse(TelemetryReading.objects.exists())
+
+        resp = self.series(60)
+        self.assertEqual((resp.data["source"], resp.data["resolution"]), ("1h", 3600))
+        self.assertEqual(resp.data["sensors"]["cope_temperature"][0]["count"], 9)
+
+    def test_snapshot_window(self):
+        self.ingest(self.readings)
+        Product.objects.create(product_id="W-1", product_name="Wheel")
+        snapshot = CastingSnapshot.objects.create(
+            product_id="W-1", station_id=2, recorded_at=self.start
+        )
+        self.client.force_authenticate(get_user_model().objects.create_user("pour"))
+
+        resp = self.client.get(
+            f"/api/v1/casting-snapshots/{snapshot.pk}/telemetry/", {"minutes": 1}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["source"], "1m")
+        self.assertEqual(
+            resp.data["sensors"]["cope_temperature"],
+            {"count": 6, "mean": 2.5, "min": 0.0, "max": 5.0},
+        )
+
+
+class StationStatsTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        products = Product.objects.bulk_create(
+            [Product(product_id=f"D-{i}", product_name="Disc") for i in range(3)]
+        )
+        open_entry_processes(products)
+        # Entered an hour and a half ago, so the dwell times are known
+        Process.objects.update(entry_time=timezone.now() - timedelta(minutes=90))
+        StationHourlyStats.objects.all().delete()
+        call_command("backfill_station_stats", stdout=StringIO())
+
+    def test_moves_update_stats_incrementally(self):
+        move_product("D-0", 2)
+        move_products(["D-1", "D-2"], 2)
+
+        resp = self.client.get("/api/v1/stations/1/stats/")
+        self.assertEqual(resp.status_code, 200)
+        summary = resp.data["summary"]
+        self.assertEqual(summary["count_in"], 3)
+        self.assertEqual(summary["count_out"], 3)
+        self.assertAlmostEqual(summary["dwell_mean"], 90 * 60, delta=60)
+        self.assertEqual(summary["dwell_p50"], 2 * 3600)
+        self.assertEqual(sum(summary["dwell_histogram"]), 3)
+
+        resp = self.client.get("/api/v1/stations/2/stats/")
+        self.assertEqual(resp.data["summary"]["count_in"], 3)
+        self.assertEqual(resp.data["summary"]["count_out"], 0)
+
+        out = StringIO()
+        call_command("check_station_stats", stdout=out)
+        self.assertIn("match the history", out.getvalue())
+
+    def test_check_reports_drift_and_backfill_repairs_it(self):
+        move_product("D-0", 3)
+        StationHourlyStats.objects.filter(station_id=3).update(count_in=7)
+
+        with self.assertRaisesMessage(CommandError, "1 station hours differ"):
+            call_command("check_station_stats", stdout=StringIO())
+
+        call_command("backfill_station_stats", stdout=StringIO())
+        call_command("check_station_stats", stdout=StringIO())
+        self.assertEqual(StationHourlyStats.objects.get(station_id=3).count_in, 1)
+
+
+class ProcessArchiveTest(APITestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        settings = override_settings(PROCESS_ARCHIVE_DIR=self.archive_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        product = Product.objects.create(product_id="A-1", product_name="Axle")
+        for station_id, entered in [(1, "2025-01-10"), (2, "2025-02-03")]:
+            entry_time = datetime.fromisoformat(f"{entered}T08:00:00+00:00")
+            Process.objects.create(
+                product=product,
+                station_id=station_id,
+                entry_time=entry_time,
+                exit_time=entry_time + timedelta(hours=3),
+                is_active=False,
+            )
+        move_product("A-1", 3)
+        call_command("backfill_station_stats", stdout=StringIO())
+
+    def test_old_history_is_partitioned_then_archived(self):
+        call_command("archive_processes", "--days", "90", stdout=StringIO())
+        self.assertEqual(
+            list(Process.objects.values_list("station_id", flat=True)), [3]
+        )
+        resp = self.client.get("/api/v1/process-history/", {"product": "A-1"})
+        self.assertEqual([row["station"] for row in resp.data], [1, 2])
+        self.assertEqual(self.client.get("/api/v1/process-history/").status_code, 400)
+        call_command("check_station_stats", stdout=StringIO())
+
+        call_command("detach_process_history", "--before", "2025-02", stdout=StringIO())
+        archive = ProcessArchive.objects.get()
+        self.assertEqual((archive.month.isoformat(), archive.rows), ("2025-01-01", 1))
+        resp = self.client.get("/api/v1/process-history/", {"product": "A-1"})
+        self.assertEqual([row["station"] for row in resp.data], [2])
+        call_command("check_station_stats", stdout=StringIO())
+
+        resp = self.client.get(
+            f"/api/v1/process-archives/{archive.pk}/rows/", {"product": "A-1"}
+        )
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "id,station_id,product_id,process_number,"
+            "entry_time,exit_time,idempotency_key",
+        )
+        self.assertEqual(len(lines), 2)
+        self.assertIn("2025-01-10 08:00:00+00", lines[1])
+
+    def test_late_processes_of_archived_months_stay_in_the_default_partition(self):
+        call_command("archive_processes", "--days", "90", stdout=StringIO())
+        call_command("detach_process_history", "--before", "2025-02", stdout=StringIO())
+
+        # Entered in the archived month, closed after it was archived
+        entry_time = datetime.fromisoformat("2025-01-20T08:00:00+00:00")
+        Process.objects.create(
+            product_id="A-1",
+            station_id=4,
+            entry_time=entry_time,
+            exit_time=entry_time + timedelta(days=40),
+            is_active=False,
+        )
+        call_command("archive_processes", "--days", "90", stdout=StringIO())
+        self.assertEqual(
+            [month.isoformat() for month in history_partitions()], ["2025-02-01"]
+        )
+        resp = self.client.get("/api/v1/process-history/", {"product": "A-1"})
+        self.assertEqual([row["station"] for row in resp.data], [4, 2])
+
+        call_command("detach_process_history", "--before", "2025-03", stdout=StringIO())
+        self.assertEqual(ProcessArchive.objects.count(), 2)
+
+    def test_failed_archive_leaves_no_file(self):
+        call_command("archive_processes", "--days", "90", stdout=StringIO())
+        ProcessArchive.objects.create(month="2025-01-01", file="elsewhere", rows=0)
+        with self.assertRaises(IntegrityError):
+            detach_history_partition(date(2025, 1, 1))
+        self.assertEqual(os.listdir(self.archive_dir.name), [])
+        self.assertIn(date(2025, 1, 1), history_partitions())
+
+
+class StationBoardStreamTest(TestCase):
+    fixtures = ["stations.json"]
+
+    def setUp(self):
+        product = Product.objects.create(product_id="B-1", product_name="Bell")
+        open_entry_processes([product])
+
+    def test_wsgi_requests_are_told_to_poll(self):
+        resp = self.client.get("/api/station-board/events/?station=1")
+        self.assertEqual(resp.status_code, 501)
+        self.assertIn(b"/api/station-product-process/", resp.content)
+
+    def test_screens_get_snapshot_then_deltas(self):
+        @sync_to_async
+        def move():
+            with self.captureOnCommitCallbacks(execute=True):
+                move_products(["B-1"], 2)
+
+        async def read_event(events):
+            chunk = await anext(events)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            event, data = chunk.strip().split("\n")
+            return event.removeprefix("event: "), json.loads(
+                data.removeprefix("data: ")
+            )
+
+        async def watch():
+            client = AsyncClient()
+            screens = [
+                aiter(
+                    (
+                        await client.get(
+                            "/api/station-board/events/?station=1&station=2"
+                        )
+                    ).streaming_content
+                )
+                for _ in range(2)
+            ]
+            snapshots = [await read_event(screen) for screen in screens]
+            await move()
+            deltas = [await read_event(screen) for screen in screens]
+            for screen in screens:
+                await screen.aclose()
+            return snapshots, deltas
+
+        snapshots, deltas = async_to_sync(watch)()
+        event, snapshot = snapshots[0]
+        self.assertEqual(event, "snapshot")
+        self.assertEqual(snapshot[0]["station"], 1)
+        self.assertEqual(snapshot[0]["products"][0]["product_id"], "B-1")
+
+        for event, delta in deltas:
+            self.assertEqual(event, "delta")
+            self.assertEqual(
+                [(item["event"], item["station"]) for item in delta],
+                [("left", 1), ("entered", 2)],
+            )
@@ -1,7 +1,189 @@
-import segno
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+
+import segno
+from django.conf import settings
 from django.core.files import File
 
+# Bump whenever the encoded payload or the rendering parameters change, so that
+# previously issued ETags (and disk cache entries) stop matching.
+QR_RENDER_VERSION = 2
+
+# Versioned prefix of the compact payload. It only uses characters of the QR
+# alphanumeric mode, so upper-case IDs encode at 5.5 bits per character.
+QR_PAYLOAD_PREFIX = "BC1:"
+
+# Payload of QR codes printed before the compact format, e.g. "ID: 12, Name: Pump"
+LEGACY_QR_PAYLOAD = re.compile(r"^ID: (?P<id>.+?), Name: .*$", re.DOTALL)
+
+# Batches smaller than this are rendered in-process; a pool is not worth starting.
+QR_PARALLEL_THRESHOLD = 32
+
+QR_CONTENT_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def qr_payload(id: str) -> str:
+    """
+    Return the compact text encoded in the QR code of a product.
+
+    The payload is the product ID behind a versioned prefix, optionally preceded by
+    ``QR_PAYLOAD_BASE_URL`` so that phone cameras open the scan endpoint directly.
+    The product name is printed next to the code and not encoded.
+    """
+    base_url = getattr(settings, "QR_PAYLOAD_BASE_URL", None) or ""
+    return f"{base_url}{QR_PAYLOAD_PREFIX}{id}"
+
+
+def parse_qr_payload(payload: str):
+    """
+    Return the product ID encoded in a scanned QR payload, or None if unrecognised.
+
+    Both the compact format (optionally as a URL) and the legacy
+    ``"ID: {id}, Name: {name}"`` format are understood.
+    """
+    payload = payload.strip()
+    legacy = LEGACY_QR_PAYLOAD.match(payload)
+    if legacy:
+        return legacy.group("id")
+
+    if "://" in payload:
+        payload = payload.rstrip("/").rsplit("/", 1)[-1]
+    prefix, _, product_id = payload.partition(QR_PAYLOAD_PREFIX)
+    if prefix or not product_id:
+        return None
+    return product_id
+
+
+def make_qr(id: str) -> segno.QRCode:
+    """
+    Build the QR symbol of a product.
+
+    The smallest symbol version that fits the payload at medium error correction is
+    chosen, and the error correction is then raised as far as that version allows.
+    """
+    return segno.make(qr_payload(id), error="m", boost_error=True, micro=False)
+
+
+def render_qr(id: str, kind: str = "png") -> bytes:
+    """
+    Render the QR code of a product.
+
+    Rendering is deterministic: the same ID always produces the same bytes.
+    SVG output is vector and skips rasterization entirely.
+
+    Args:
+        id (str): The ID of the product.
+        kind (str): Output format, ``"png"`` or ``"svg"``.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    qr = make_qr(id)
+
+    qr_io = BytesIO()
+    if kind == "svg":
+        qr.save(qr_io, kind="svg", scale=10, border=4, xmldecl=False)
+    else:
+        qr.save(qr_io, kind="png", scale=10, border=4)
+    return qr_io.getvalue()
+
+
+def qr_etag(id: str, kind: str = "png") -> str:
+    """
+    Return a strong validator for the rendered QR code, computed without rendering it.
+    """
+    key = f"{QR_RENDER_VERSION}:{kind}:{qr_payload(id)}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def qr_filename(id: str, name: str) -> str:
+    """
+    Return the file name under which the QR image of a product is stored.
+    """
+    return f"{id}_{name}.png"
+
+
+def _map_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def parallel_imap(func, items, max_workers: int = None, chunksize: int = 16):
+    """
+    Yield ``func(item)`` for every item, in order, computed across a process pool.
+
+    Items are submitted in chunks and only a couple of chunks per worker are in
+    flight at a time, so long inputs are streamed with bounded memory. Inside a
+    daemonic process (which may not start children) items are mapped in-process.
+
+    Args:
+        func (callable): A picklable, module-level function.
+        items (iterable): The arguments to map over.
+        max_workers (int): Size of the process pool, defaults to the CPU count.
+        chunksize (int): Number of items sent to a worker at once.
+    """
+    if max_workers == 1 or multiprocessing.current_process().daemon:
+        for item in items:
+            yield func(item)
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) < chunksize:
+                continue
+            pending.append(executor.submit(_map_chunk, func, chunk))
+            chunk = []
+            if len(pending) >= max_workers * 2:
+                yield from pending.popleft().result()
+        if chunk:
+            pending.append(executor.submit(_map_chunk, func, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _render_qr_args(args):
+    return render_qr(*args)
+
+
+def render_qr_batch(ids, kind: str = "png", max_workers: int = None) -> list:
+    """
+    Render the QR codes of many products in parallel across a process pool.
+
+    Small batches are rendered in-process; a pool is not worth starting for them.
+
+    Args:
+        ids (iterable): IDs of the products.
+        kind (str): Output format, ``"png"`` or ``"svg"``.
+        max_workers (int): Size of the process pool, defaults to the CPU count.
+
+    Returns:
+        list: The encoded images, in the order of ``ids``.
+    """
+    args = [(id, kind) for id in ids]
+    if len(args) < QR_PARALLEL_THRESHOLD:
+        return [render_qr(*arg) for arg in args]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(args) // (max_workers * 4))
+    return list(
+        parallel_imap(
+            _render_qr_args, args, max_workers=max_workers, chunksize=chunksize
+        )
+    )
+
 
 def generate_qr(id: str, name: str) -> File:
     """
@@ -18,22 +200,153 @@ def generate_qr(id: str, name: str) -> File:
         File: The QR image file.
     """
 
-    # Combine ID and name into a single string to be encoded in the QR code
-    data = f"ID: {id}, Name: {name}"
+    return File(BytesIO(render_qr(id)), name=qr_filename(id, name))
 
-    # Generate the QR code with the specified error correction level
-    qr = segno.make(data, error="h")  # 'h' stands for high error correction
 
-    # Create a BytesIO object to hold the QR code image data
-    qr_io = BytesIO()
+def _zpl_field(value) -> str:
+    # Field data is hex-escaped (^FH) so IDs and names cannot inject commands
+    value = str(value)
+    for char in "_^~":
+        value = value.replace(char, f"_{ord(char):02X}")
+    return value
+
+
+def generate_zpl(
+    id: str, name: str, dpi: int = 203, width: float = 2, height: float = 1
+) -> str:
+    """
+    Generate a ZPL label for a product, for Zebra thermal printers.
+
+    The QR code is sent as a native ``^BQ`` barcode command, so the printer renders
+    it itself; the product ID and name are printed as text fields. A label is a few
+    hundred bytes, compared with tens of KB for a rasterized PNG.
+
+    Args:
+        id (str): The ID of the product.
+        name (str): The name of the product.
+        dpi (int): Resolution of the printer head (203, 300 or 600).
+        width (float): Label width in inches.
+        height (float): Label height in inches.
+
+    Returns:
+        str: The ZPL commands of a single label, from ``^XA`` to ``^XZ``.
+    """
+    label_width, label_height = round(width * dpi), round(height * dpi)
+    margin = dpi // 10
+
+    # Scale modules so the symbol (with its quiet zone) fills the label height
+    modules = make_qr(id).symbol_size(scale=1, border=4)[0]
+    magnification = max(1, min(10, (label_height - margin) // modules))
+    text_left = margin + modules * magnification
+    text_width = max(1, label_width - text_left - margin)
+    id_font, name_font = dpi // 7, dpi // 10
+
+    return "\n".join(
+        [
+            "^XA",
+            "^CI28",
+            f"^PW{label_width}",
+            f"^LL{label_height}",
+            f"^FO{margin // 2},{margin // 2}^BQN,2,{magnification}"
+            f"^FH_^FDMA,{_zpl_field(qr_payload(id))}^FS",
+            f"^FO{text_left},{margin * 2}^A0N,{id_font},{id_font}"
+            f"^FB{text_width},1,0,L^FH_^FD{_zpl_field(id)}^FS",
+            f"^FO{text_left},{margin * 2 + id_font + margin // 2}"
+            f"^A0N,{name_font},{name_font}"
+            f"^FB{text_width},2,0,L^FH_^FD{_zpl_field(name)}^FS",
+            "^XZ",
+            "",
+        ]
+    )
+
+
+def atomic_write(path: str, content: bytes):
+    """
+    Write a file so that readers see either the old or the new content, never a
+    partially written file.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class QRCache:
+    """
+    Bounded in-memory LRU of rendered QR codes, optionally backed by a disk cache.
+
+    Entries are keyed by their ETag, so a change of payload format never hits a
+    stale entry.
+
+    Attributes:
+        maxsize (int): Maximum number of images kept in memory.
+        directory (str): Optional directory for the disk cache; disabled when empty.
+    """
+
+    def __init__(self, maxsize=1024, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, id: str, kind: str = "png"):
+        """
+        Return ``(etag, content)`` for a product QR code, rendering it on a miss.
+        """
+        etag = qr_etag(id, kind)
+        with self._lock:
+            content = self._entries.get(etag)
+            if content is not None:
+                self._entries.move_to_end(etag)
+                return etag, content
+
+        content = self._read_disk(etag, kind)
+        if content is None:
+            content = render_qr(id, kind)
+            self._write_disk(etag, kind, content)
+
+        with self._lock:
+            self._entries[etag] = content
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return etag, content
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _disk_path(self, etag, kind):
+        return os.path.join(self.directory, etag[:2], f"{etag}.{kind}")
 
-    # Save the QR code image to the BytesIO object in PNG format
-    qr.save(qr_io, kind="png", scale=10, border=4)
+    def _read_disk(self, etag, kind):
+        if not self.directory:
+            return None
+        try:
+            with open(self._disk_path(etag, kind), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
 
-    # Ensure the BytesIO object is positioned at the start
-    qr_io.seek(0)
+    def _write_disk(self, etag, kind, content):
+        if not self.directory:
+            return
+        try:
+            atomic_write(self._disk_path(etag, kind), content)
+        except OSError:
+            # The disk cache is best effort; the image is still served from memory
+            pass
 
-    # Create a Django File object from the BytesIO object
-    qr_image = File(qr_io, name=f"{id}_{name}.png")
 
-    return qr_image
+qr_cache = QRCache(
+    maxsize=getattr(settings, "QR_CACHE_SIZE", 1024),
+    directory=getattr(settings, "QR_CACHE_DIR", None),
+)
@@ -1,92 +1,525 @@
-from django.db.models import F
+import asyncio
+import csv
+import io
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django.db import transaction
+from django.db.models import F, Prefetch
 from collections import defaultdict
-from django.utils import timezone
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_safe
+from django.views.decorators.vary import vary_on_headers
 from rest_framework import viewsets, response, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 
-from .models import Product, Process, Station, CastingSnapshot
+from .labels import LabelLayout, iter_pdf_sheet, iter_png_pages, label_products
+from .archive import HISTORY_COLUMNS, iter_archive_rows
+from .broker import RESYNC, board_broker
+from .cache import BOARD, CASTING_SNAPSHOTS, cached_board, collection_etag
+from .changes import CursorExpired, head_cursor, read_changes
+from .counters import active_station_ids, refresh_station_wip
+from .models import (
+    Product,
+    Process,
+    ProcessArchive,
+    ProcessHistory,
+    Station,
+    StationHourlyStats,
+    CastingSnapshot,
+)
 from .serializers import (
     ProductSerializer,
+    ProductBulkCreateSerializer,
+    LabelSheetQuerySerializer,
+    ZPLQuerySerializer,
+    ScanSerializer,
+    ProductMoveSerializer,
+    ProductBulkMoveSerializer,
     ProcessSerializer,
+    ProcessHistorySerializer,
+    ProcessArchiveSerializer,
+    ProcessArchiveQuerySerializer,
     StationSerialzier,
+    StationStatsQuerySerializer,
+    StationHourlyStatsSerializer,
     StationProductProcessSerializer,
     CastingSnapshotSerializer,
+    CastingSnapshotBulkCreateSerializer,
+    ChangesQuerySerializer,
+    SnapshotTelemetryQuerySerializer,
+    TelemetryBatchSerializer,
+    TelemetryQuerySerializer,
+)
+from .services import (
+    IdempotencyConflict,
+    MoveError,
+    MoveOutcome,
+    move_product,
+    move_products,
+    reconcile_current_pointers,
 )
+from .stats import hour_bucket, summarize_stats
+from .telemetry import read_telemetry, summarize_telemetry
+from .utils import (
+    QR_CONTENT_TYPES,
+    generate_zpl,
+    parse_qr_payload,
+    qr_cache,
+    qr_etag,
+)
+
+# The image at a QR URL changes with the render version and the payload base URL,
+# so caches revalidate every time; that is a 304 without rendering anything
+QR_CACHE_CONTROL = "public, no-cache"
 
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request):
+        """
+        Register a batch of products, given as a list or as ``{"products": [...]}``.
+        """
+        data = request.data
+        if isinstance(data, list):
+            data = {"products": data}
+
+        serializer = ProductBulkCreateSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        products = serializer.save()
+        return response.Response(
+            ProductSerializer(products, many=True, context={"request": request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        station_ids = active_station_ids([instance.pk])
+        super().perform_destroy(instance)
+        refresh_station_wip(station_ids)
+
+    @action(detail=False, methods=["get"])
+    def labels(self, request):
+        """
+        Print sheet of QR labels for ``?ids=a,b,c`` and/or the products at ``?station=``.
+
+        ``kind=pdf`` (the default) streams the whole sheet page by page;
+        ``kind=png`` returns the tiled page given by ``page``.
+        """
+        query = LabelSheetQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        layout = LabelLayout(
+            columns=params["columns"],
+            rows=params["rows"],
+            page_size=params["page_size"],
+        )
+        items = label_products(params.get("ids"), params.get("station"))
+
+        if params["kind"] == "png":
+            start = (params["page"] - 1) * layout.per_page
+            end = start + layout.per_page
+            page_items = list(items[start:end])
+            if not page_items:
+                raise Http404("No labels on this page.")
+            content = next(iter_png_pages(page_items, layout, max_workers=1))
+            return HttpResponse(content, content_type="image/png")
+
+        if not items.exists():
+            raise Http404("No labels to print.")
+        # A pool of every CPU per request would starve the other workers of the
+        # server, so the sheet is drawn by a small pool, if any
+        resp = StreamingHttpResponse(
+            iter_pdf_sheet(
+                items.iterator(chunk_size=500),
+                layout,
+                max_workers=settings.LABEL_SHEET_WORKERS,
+            ),
+            content_type="application/pdf",
+        )
+        resp["Content-Disposition"] = 'attachment; filename="labels.pdf"'
+        return resp
+
+    @action(detail=False, methods=["get"])
+    def zpl(self, request):
+        """
+        Stream ZPL labels for ``?ids=a,b,c`` and/or the products at ``?station=``.
+        """
+        query = ZPLQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        items = label_products(params.get("ids"), params.get("station"))
+        resp = StreamingHttpResponse(
+            (
+                generate_zpl(
+                    product_id,
+                    product_name,
+                    dpi=params["dpi"],
+                    width=params["width"],
+                    height=params["height"],
+                )
+                for product_id, product_name in items.iterator(chunk_size=500)
+            ),
+            content_type="text/plain; charset=utf-8",
+        )
+        resp["Content-Disposition"] = 'attachment; filename="labels.zpl"'
+        return resp
+
     @action(detail=True, methods=["post"])
     def update_product(self, request, pk=None):
-        product = self.get_object()
-        is_checked = request.data.get("is_checked")
-        move_to = request.data.get("move_to")
+        """
+        Move the product to the ``move_to`` station.
 
-        # Retrieve the most recent process for the product to determine its current station
-        current_process = Process.objects.filter(product=product).last()
+        An ``idempotency_key`` (or ``Idempotency-Key`` header) makes retries safe:
+        a move that was already applied is acknowledged without moving again.
+        """
+        serializer = ProductMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
 
-        # Check if the target station is the same as the current station
-        if str(current_process.station_id) == str(move_to):
+        if not params["is_checked"]:
             return response.Response(
-                {"detail": "Product is already in the specified station."},
-                status=status.HTTP_400_BAD_REQUEST,
+                "Couldn't update", status=status.HTTP_400_BAD_REQUEST
             )
 
-        if is_checked:
-            # Mark the current process as exited
-            current_process.exit_time = timezone.now()
-            current_process.is_active = False
-            current_process.save(update_fields=["exit_time", "is_active"])
-
-            # Create a new process for the move
-            Process.objects.create(
-                product=product, station_id=move_to, entry_time=timezone.now()
+        idempotency_key = params.get("idempotency_key") or request.headers.get(
+            "Idempotency-Key"
+        )
+        try:
+            process, _ = move_product(pk, params["move_to"].pk, idempotency_key)
+        except Product.DoesNotExist:
+            raise Http404("No Product matches the given query.")
+        except IdempotencyConflict as e:
+            return response.Response(
+                {"detail": str(e)}, status=status.HTTP_409_CONFLICT
             )
+        except MoveError as e:
             return response.Response(
-                {"is_checked": "Updated"}, status=status.HTTP_200_OK
+                {"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        return response.Response("Couldn't update", status=status.HTTP_400_BAD_REQUEST)
+        return response.Response(
+            {"is_checked": "Updated", "process": process.pk}, status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=["post"])
+    def bulk_move(self, request):
+        """
+        Move the products in ``product_ids`` to the ``move_to`` station at once.
+
+        Every product gets an outcome: moved, already at the station or not found.
+        """
+        serializer = ProductBulkMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        outcomes = move_products(params["product_ids"], params["move_to"].pk)
+        return response.Response(
+            {
+                "moved": sum(
+                    outcome == MoveOutcome.MOVED for outcome in outcomes.values()
+                ),
+                "results": [
+                    {"product_id": product_id, "status": outcome}
+                    for product_id, outcome in outcomes.items()
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+@require_safe
+def product_qr(request, pk, kind):
+    """
+    Render a product QR code on demand as PNG or SVG.
+
+    Images are deterministic for a given product ID and render settings, so they
+    are served with a strong ETag that caches revalidate on every use;
+    revalidation returns 304 without rendering anything.
+    """
+    if not Product.objects.filter(pk=pk).exists():
+        raise Http404("No Product matches the given query.")
+
+    etag = f'"{qr_etag(pk, kind)}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified["Cache-Control"] = QR_CACHE_CONTROL
+        return not_modified
+
+    _, content = qr_cache.get(pk, kind)
+    resp = HttpResponse(content, content_type=QR_CONTENT_TYPES[kind])
+    resp["ETag"] = etag
+    resp["Cache-Control"] = QR_CACHE_CONTROL
+    return resp
+
+
+def conditional_on(*collections):
+    """
+    Answer conditional GETs of a view method from the change versions of the
+    collections it reads, with 304 and without running the method.
+    """
+    return method_decorator(
+        [condition(etag_func=collection_etag(*collections)), vary_on_headers("Accept")]
+    )
 
 
 class ProcessViewSet(viewsets.ModelViewSet):
-    queryset = Process.objects.all()
+    queryset = Process.objects.order_by("id")
     serializer_class = ProcessSerializer
+    filterset_fields = ["product", "station", "is_active"]
+
+    @conditional_on(BOARD)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    # Raw process edits bypass the move functions, so the current station
+    # pointers of the products involved and the work in progress of the stations
+    # involved are reconciled in the same transaction.
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        reconcile_current_pointers([serializer.instance.product_id])
+        refresh_station_wip([serializer.instance.station_id])
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous = serializer.instance.product_id, serializer.instance.station_id
+        super().perform_update(serializer)
+        reconcile_current_pointers([previous[0], serializer.instance.product_id])
+        refresh_station_wip([previous[1], serializer.instance.station_id])
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        product_id, station_id = instance.product_id, instance.station_id
+        super().perform_destroy(instance)
+        reconcile_current_pointers([product_id])
+        refresh_station_wip([station_id])
+
+
+class ProcessHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Closed processes moved out of the hot Process table, by product or station.
+    """
+
+    queryset = ProcessHistory.objects.order_by("entry_time", "id")
+    serializer_class = ProcessHistorySerializer
+    filterset_fields = ["product", "station"]
+
+    def list(self, request, *args, **kwargs):
+        # The history is far too large to list whole
+        if not {"product", "station"} & set(request.query_params):
+            raise ValidationError("Filter the history by product or station.")
+        return super().list(request, *args, **kwargs)
+
+
+class ProcessArchiveViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Months of process history archived out of the database.
+    """
+
+    queryset = ProcessArchive.objects.order_by("month")
+    serializer_class = ProcessArchiveSerializer
+
+    @action(detail=True, methods=["get"])
+    def rows(self, request, pk=None):
+        """
+        Stream the archived processes as CSV, filtered by ``?product=`` and/or
+        ``?station=``.
+        """
+        archive = self.get_object()
+        query = ProcessArchiveQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        def lines():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, HISTORY_COLUMNS)
+            writer.writeheader()
+            rows = iter_archive_rows(
+                archive, params.get("product"), params.get("station")
+            )
+            for row in rows:
+                writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+
+        resp = StreamingHttpResponse(lines(), content_type="text/csv")
+        resp["Content-Disposition"] = (
+            f'attachment; filename="processes-{archive.month:%Y-%m}.csv"'
+        )
+        return resp
 
 
 class StationViewSet(viewsets.ModelViewSet):
-    queryset = Station.objects.all()
+    queryset = Station.objects.order_by("id")
     serializer_class = StationSerialzier
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            # Counters joined and products prefetched for all the stations at
+            # once, so the list takes the same number of queries however many
+            # products are in WIP
+            queryset = queryset.select_related("counter").prefetch_related(
+                Prefetch(
+                    "process_set",
+                    queryset=Process.objects.filter(is_active=True)
+                    .select_related("product")
+                    .order_by("entry_time", "id"),
+                    to_attr="active_processes",
+                )
+            )
+        return queryset
+
+    @conditional_on(BOARD)
+    def list(self, request, *args, **kwargs):
+        # Cached until a product, process or station changes; per host, as the
+        # QR image URLs are absolute
+        data = cached_board(
+            f"stations:{request.scheme}://{request.get_host()}",
+            lambda: super(StationViewSet, self).list(request, *args, **kwargs).data,
+        )
+        return response.Response(data)
+
+    @action(detail=True, methods=["get"])
+    def stats(self, request, pk=None):
+        """
+        Hourly throughput and dwell times of the station between ``?since=`` and
+        ``?until=`` (the last day by default), with their totals.
+
+        Answered from the incrementally maintained hourly stats, so the cost
+        depends on the length of the range, not on the size of the history.
+        """
+        station = self.get_object()
+        query = StationStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        rows = list(
+            StationHourlyStats.objects.filter(
+                station=station,
+                hour__gte=hour_bucket(params["since"]),
+                hour__lt=params["until"],
+            ).order_by("hour")
+        )
+        return response.Response(
+            {
+                "station": station.pk,
+                "since": params["since"],
+                "until": params["until"],
+                "summary": summarize_stats(rows),
+                "hours": StationHourlyStatsSerializer(rows, many=True).data,
+            }
+        )
+
+    @action(detail=True, methods=["get"])
+    def telemetry(self, request, pk=None):
+        """
+        Sensor readings of the station between ``?since=`` and ``?until=`` (the
+        last hour by default), in points of ``?resolution=`` seconds; ``?sensor=``
+        (repeatable) limits the sensors read.
+
+        Every point is read from the coarsest rollup whose buckets fit in it, or
+        from the raw readings, and ``source`` tells which one.
+        """
+        station = self.get_object()
+        query = TelemetryQuerySerializer(
+            data={
+                **request.query_params.dict(),
+                "sensor": request.query_params.getlist("sensor"),
+            }
+        )
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        source, since, step, rows = read_telemetry(
+            station.pk,
+            params["since"],
+            params["until"],
+            params["step"],
+            params.get("sensor"),
+        )
+        sensors = defaultdict(list)
+        for sensor, time, count, mean, minimum, maximum in rows:
+            sensors[sensor].append(
+                {
+                    "time": time,
+                    "count": count,
+                    "mean": mean,
+                    "min": minimum,
+                    "max": maximum,
+                }
+            )
+        return response.Response(
+            {
+                "station": station.pk,
+                "since": since,
+                "until": params["until"],
+                "resolution": int(step.total_seconds()),
+                "source": source,
+                "sensors": sensors,
+            }
+        )
+
 
 class StationProductProcessView(APIView):
+    """
+    Products currently at each station, grouped by station name.
+
+    Cached until a product, process or station changes.
+    """
 
+    @conditional_on(BOARD)
     def get(self, request):
+        return response.Response(
+            cached_board("station-product-process", self.board_data)
+        )
+
+    def board_data(self):
         data = (
-            Process.objects.select_related("product", "station")
-            .filter(exit_time__isnull=True)
+            Product.objects.filter(current_station__isnull=False)
             .values(
-                "station__name",
-                "product__product_id",
-                "product__product_name",
-                "entry_time",
-                "exit_time",
+                "current_station__name",
+                "product_id",
+                "product_name",
+                "current_process__entry_time",
+                "current_process__exit_time",
             )
-            .order_by("station_id")
+            .order_by("current_station_id")
         )
 
         # Grouping the data by station
         grouped_data = defaultdict(list)
         for item in data:
-            station_name = item["station__name"]
+            station_name = item["current_station__name"]
             product_info = {
-                "product_id": item["product__product_id"],
-                "product_name": item["product__product_name"],
-                "entry_time": item["entry_time"],
-                "exit_time": item["exit_time"],
+                "product_id": item["product_id"],
+                "product_name": item["product_name"],
+                "entry_time": item["current_process__entry_time"],
+                "exit_time": item["current_process__exit_time"],
             }
             grouped_data[station_name].append(product_info)
 
@@ -97,7 +530,248 @@ class StationProductProcessView(APIView):
         ]
 
         serializer = StationProductProcessSerializer(response_data, many=True)
-        return response.Response(serializer.data)
+        return serializer.data
+
+
+# Seconds between keep-alive comments on idle board streams
+BOARD_HEARTBEAT = 15
+
+
+def board_snapshot(station_ids=None):
+    """
+    Return the products currently at each station, in one query.
+    """
+    queryset = Product.objects.filter(current_station__isnull=False)
+    if station_ids:
+        queryset = queryset.filter(current_station__in=station_ids)
+    rows = queryset.values(
+        "product_id",
+        "product_name",
+        "current_station_id",
+        "current_station__name",
+        entry_time=F("current_process__entry_time"),
+    ).order_by("current_station_id", "entry_time")
+
+    stations = {}
+    for row in rows:
+        station = stations.setdefault(
+            row["current_station_id"],
+            {
+                "station": row["current_station_id"],
+                "station_name": row["current_station__name"],
+                "products": [],
+            },
+        )
+        station["products"].append(
+            {
+                "product_id": row["product_id"],
+                "product_name": row["product_name"],
+                "entry_time": row["entry_time"],
+            }
+        )
+    return list(stations.values())
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def board_events(station_ids):
+    async with board_broker.subscribe(station_ids) as subscription:
+        # Subscribed before the snapshot is read, so no delta falls in between
+        snapshot = await sync_to_async(board_snapshot)(station_ids)
+        yield server_sent_event("snapshot", snapshot)
+        while True:
+            try:
+                deltas = await asyncio.wait_for(subscription.get(), BOARD_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if deltas is RESYNC:
+                snapshot = await sync_to_async(board_snapshot)(station_ids)
+                yield server_sent_event("snapshot", snapshot)
+            else:
+                yield server_sent_event("delta", deltas)
+
+
+async def station_board_events(request):
+    """
+    Live station board as server-sent events, for ``?station=`` (repeatable) or
+    all stations.
+
+    A ``snapshot`` event with the products at the stations comes first, followed
+    by ``delta`` events listing products that ``entered`` or ``left`` a station.
+    A new snapshot is sent whenever the stream may have missed deltas.
+
+    The stream never ends, so it is only served over ASGI: a WSGI server would
+    hold a worker for good without sending anything. Over WSGI, screens are told
+    to poll the cached board instead.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(
+            "The station board stream needs an ASGI server; "
+            "poll /api/station-product-process/ instead.",
+            status=501,
+            content_type="text/plain",
+        )
+    try:
+        station_ids = [int(station) for station in request.GET.getlist("station")]
+    except ValueError:
+        return HttpResponseBadRequest("station must be an integer.")
+
+    resp = StreamingHttpResponse(
+        board_events(station_ids), content_type="text/event-stream"
+    )
+    resp["Cache-Control"] = "no-cache"
+    # Keep proxies such as nginx from buffering the stream
+    resp["X-Accel-Buffering"] = "no"
+    return resp
+
+
+class ChangeFeedView(APIView):
+    """
+    Changes of products, processes and casting snapshots after ``?since=``, so
+    that clients stay in sync by reading what changed instead of whole lists.
+
+    Without ``since``, only the current cursor is returned, to follow the feed
+    from after a full load. Each change is an ``upsert`` with the current row or
+    a ``delete``, at most once per row; ``?resource=`` (repeatable) limits the
+    resources read. Reading on from the returned ``cursor`` while ``has_more`` is
+    set catches up completely. A cursor whose changes were pruned is answered
+    with 410, after which the client has to reload everything.
+    """
+
+    # Serializer and queryset of the current rows of every resource
+    RESOURCES = {
+        "product": (ProductSerializer, Product.objects.all()),
+        "process": (ProcessSerializer, Process.objects.all()),
+        "casting_snapshot": (
+            CastingSnapshotSerializer,
+            CastingSnapshot.objects.select_related(
+                "station_one",
+                "ramming_floor",
+                "molding_floor",
+                "pour",
+                "shakeout",
+                "quality",
+            ),
+        ),
+    }
+
+    def get(self, request):
+        query = ChangesQuerySerializer(
+            data={
+                **request.query_params.dict(),
+                "resource": request.query_params.getlist("resource"),
+            }
+        )
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        if "since" not in params:
+            return response.Response(
+                {"cursor": head_cursor(), "has_more": False, "changes": []}
+            )
+
+        resources = params.get("resource") or list(self.RESOURCES)
+        if not request.user.is_authenticated:
+            # Casting snapshots are only served to signed in users
+            resources = [name for name in resources if name != "casting_snapshot"]
+        if not resources:
+            return response.Response(
+                {"cursor": params["since"], "has_more": False, "changes": []}
+            )
+        try:
+            changes, cursor, has_more = read_changes(
+                params["since"], resources, params["limit"]
+            )
+        except CursorExpired:
+            return response.Response(
+                {"detail": "Cursor expired, reload everything."},
+                status=status.HTTP_410_GONE,
+            )
+
+        # The current rows, with one query per resource
+        object_ids = defaultdict(list)
+        for resource, object_id in changes:
+            object_ids[resource].append(object_id)
+        rows = {}
+        for resource, ids in object_ids.items():
+            serializer_class, queryset = self.RESOURCES[resource]
+            objs = list(queryset.filter(pk__in=ids))
+            serializer = serializer_class(objs, many=True, context={"request": request})
+            for obj, data in zip(objs, serializer.data):
+                rows[resource, str(obj.pk)] = data
+
+        return response.Response(
+            {
+                "cursor": cursor,
+                "has_more": has_more,
+                "changes": [
+                    {
+                        "resource": resource,
+                        "id": object_id,
+                        "op": "upsert" if (resource, object_id) in rows else "delete",
+                        "data": rows.get((resource, object_id)),
+                    }
+                    for resource, object_id in changes
+                ],
+            }
+        )
+
+
+class TelemetryView(APIView):
+    """
+    Ingest a batch of sensor readings, given as a list or as ``{"readings": [...]}``.
+
+    The readings are added to the 1 minute, 1 hour and 1 day rollups as they are
+    stored. Resending a batch is safe: readings already stored are skipped.
+    """
+
+    def post(self, request):
+        data = request.data
+        if isinstance(data, list):
+            data = {"readings": data}
+
+        serializer = TelemetryBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        stored = serializer.save()
+        return response.Response(
+            {
+                "stored": stored,
+                "skipped": len(serializer.validated_data["readings"]) - stored,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class ScanView(APIView):
+    """
+    Resolve a scanned QR payload to its product and current station.
+    """
+
+    def get(self, request, payload):
+        product_id = parse_qr_payload(payload)
+        if product_id is None:
+            raise Http404("Unrecognised QR payload.")
+
+        # One primary key lookup, joined with the current process and station
+        row = (
+            Product.objects.filter(pk=product_id)
+            .values(
+                "product_id",
+                "product_name",
+                process_id=F("current_process_id"),
+                station_id=F("current_station_id"),
+                station_name=F("current_station__name"),
+                entry_time=F("current_process__entry_time"),
+            )
+            .first()
+        )
+        if row is None:
+            raise Http404("No Product matches the given query.")
+        return response.Response(ScanSerializer(row).data)
 
 
 class CastingSnapshotViewSet(viewsets.ModelViewSet):
@@ -118,6 +792,68 @@ class CastingSnapshotViewSet(viewsets.ModelViewSet):
     serializer_class = CastingSnapshotSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @conditional_on(CASTING_SNAPSHOTS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=True, methods=["get"])
+    def telemetry(self, request, pk=None):
+        """
+        Sensor readings of the snapshot's station around the time it was taken,
+        summarized per sensor: the whole minutes from ``?minutes=`` (10 by
+        default) before the minute it was taken to as many after it.
+        """
+        snapshot = self.get_object()
+        query = SnapshotTelemetryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        if snapshot.recorded_at is None:
+            raise ValidationError("The snapshot has no recording time.")
+
+        minute = snapshot.recorded_at.replace(second=0, microsecond=0)
+        window = timedelta(minutes=query.validated_data["minutes"])
+        since, until = minute - window, minute + window + timedelta(minutes=1)
+        source, _, _, rows = read_telemetry(
+            snapshot.station_id, since, until, until - since
+        )
+        return response.Response(
+            {
+                "since": since,
+                "until": until,
+                "source": source,
+                "sensors": summarize_telemetry(rows),
+            }
+        )
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request):
+        """
+        Ingest a batch of snapshots, given as a list or as ``{"snapshots": [...]}``.
+
+        Valid snapshots are stored even when others in the batch are not; every
+        item gets a result, either the ID of its snapshot or its errors.
+        """
+        data = request.data
+        if isinstance(data, list):
+            data = {"snapshots": data}
+
+        serializer = CastingSnapshotBulkCreateSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+        return response.Response(
+            {
+                "created": sum(snapshot is not None for snapshot, _ in results),
+                "results": [
+                    (
+                        {"index": index, "status": "created", "id": snapshot.pk}
+                        if snapshot is not None
+                        else {"index": index, "status": "invalid", "errors": errors}
+                    )
+                    for index, (snapshot, errors) in enumerate(results)
+                ],
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 #     def create(self, request, *args, **kwargs):
 #         """